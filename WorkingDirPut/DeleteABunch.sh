@@ -46,7 +46,12 @@ for task in ${tasks} ; do
 done
 
 
+# delete all the resources at once (concurrently, with one XNAT client)
+deletions_file=$(mktemp)
 for resource in ${resources} ; do
     echo "Deleting resource: ${resource}"
-    ./DeleteResource.sh --user=tbbrown --project=HCP_Staging --subject=${subject} --session=${subject}_3T --resource=${resource} --password=${password} --force
+    printf "HCP_Staging\t${subject}\t${subject}_3T\t${resource}\n" >> ${deletions_file}
 done
+
+PYTHONPATH=${XNAT_PBS_JOBS}/lib ${XNAT_PBS_JOBS}/lib/utils/bulk_delete_resources.py --user=tbbrown --password=${password} --input-file=${deletions_file} --force
+rm -f ${deletions_file}
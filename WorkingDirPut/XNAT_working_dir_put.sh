@@ -146,6 +146,17 @@ Options: [ ] = optional, < > = user-supplied-value
 								  the --client-string= and --server-string= options specified
 								  below. Each of these options has default values.
 
+ [--parallel-streams=<n>]	 : Only used if --use-http is specified. Upload the files
+							   in the working directory in <n> parallel HTTP streams
+							   (see lib/utils/parallel_upload.py) instead of zipping 
+							   them up and uploading the zip file in one stream.
+							   The uploaded files are recorded in a transfer journal
+							   (.XNAT_PUT_JOURNAL) in the working directory. If that
+							   journal exists (from an earlier, interrupted put),
+							   the previous resource is not deleted and only the
+							   files not already uploaded (or changed since) are
+							   uploaded.
+
  [--client-string=<cli_str>] : Specification of CLIENT_STRING to replace with SERVER_STRING
 							   in the working directory path (CLIENT_PATH) to form the 
 							   SERVER_PATH (See --use-http above.)
@@ -182,6 +193,7 @@ get_options()
 	unset g_reason
 	unset g_leave_subject_id_level
 	unset g_use_http
+	unset g_parallel_streams
 	unset g_client_string
 	unset g_server_string
 	
@@ -253,6 +265,10 @@ get_options()
 				g_use_http="TRUE"
 				index=$(( index + 1 ))
 				;;
+			--parallel-streams=*)
+				g_parallel_streams=${argument/*=/""}
+				index=$(( index + 1 ))
+				;;
 			--client-string=*)
 				g_client_string=${argument/*=/""}
 				index=$(( index + 1 ))
@@ -342,6 +358,7 @@ get_options()
 	log_Msg "g_leave_subject_id_level: ${g_leave_subject_id_level}"
 
 	log_Msg "g_use_http: ${g_use_http}"
+	log_Msg "g_parallel_streams: ${g_parallel_streams}"
 
 	if [ -z "${g_client_string}" ]; then
 		log_Err "client string (--client-string=) required"
@@ -367,6 +384,47 @@ get_options()
 	fi
 }
 
+# Make g_server a shadow server that is up, checking it and then the others in
+# XNAT_PBS_JOBS_PUT_SERVER_LIST (starting after it) the same way that
+# PutDirIntoResource.sh does. Returns 3 if all the shadow servers stay down.
+find_up_put_server()
+{
+	HTTP_CODE=`curl https://${g_server} -o /dev/null -w "%{http_code}\n" -s`
+	if [ "$HTTP_CODE" != "302" ] ; then
+		numberofservers=($XNAT_PBS_JOBS_PUT_SERVER_LIST)
+		shdw_server_list_i=0
+		for shdw_server_list in ${XNAT_PBS_JOBS_PUT_SERVER_LIST}; do
+			if [[ "${shdw_server_list}" == "${g_server}" ]]; then
+				break
+			fi
+			shdw_server_list_i=$[$shdw_server_list_i + 1]
+		done
+		numberofservers_n=( ${numberofservers[@]:$shdw_server_list_i:${#numberofservers[@]}} ${numberofservers[@]:0:$shdw_server_list_i} )
+		while_i=0
+		while [ $while_i -le 60 ]; do
+			log_Msg "searching for another shadow server"
+			for shdw_server in ${numberofservers_n[@]}; do
+				HTTP_CODE1=`curl https://${shdw_server} -o /dev/null -w "%{http_code}\n" -s`
+				if [ "$HTTP_CODE1" == "302" ]; then
+					g_server=${shdw_server}
+					log_Msg "switching to a New shadow Server: ${g_server}"
+					return 0
+				fi
+			done
+			while_i=$[$while_i + 1]
+			if [ "$while_i" -lt 60 ]; then
+				log_Msg "Sleeping for 1 minute to Check shadow servers again"
+				sleep 1m
+			else
+				log_Msg "all shadow servers are down"
+				return 3
+			fi
+		done
+	fi
+
+	return 0
+}
+
 # Main processing
 main()
 {
@@ -383,26 +441,33 @@ main()
 	fi
 	log_Msg "resource: ${resource}"
 
-	# Delete previous resource
-	log_Msg "-------------------------------------------------"
-	log_Msg "Deleting previous resource"
-	log_Msg "-------------------------------------------------"
-	${XNAT_PBS_JOBS}/WorkingDirPut/DeleteResource.sh \
-					--user=${g_user} \
-					--password=${g_password} \
-					--server=${g_server} \
-					--project=${g_project} \
-					--subject=${g_subject} \
-					--session=${g_session} \
-					--resource=${resource} \
-					--protocol="https" \
-					--force
-	shadowserver_code=$?
-	if [ ${shadowserver_code} -eq 3 ]
-	then
-		log_Msg "EXIT: all shadow servers are down".
-		exit 1
-	fi	
+	if [ "${g_use_http}" = "TRUE" ] && [ -n "${g_parallel_streams}" ] && [ -e "${g_working_dir}/.XNAT_PUT_JOURNAL" ] ; then
+		# Resume an interrupted put (see lib/utils/transfer_journal.py)
+		log_Msg "-------------------------------------------------"
+		log_Msg "Resuming put recorded in ${g_working_dir}/.XNAT_PUT_JOURNAL, not deleting previous resource"
+		log_Msg "-------------------------------------------------"
+	else
+		# Delete previous resource
+		log_Msg "-------------------------------------------------"
+		log_Msg "Deleting previous resource"
+		log_Msg "-------------------------------------------------"
+		${XNAT_PBS_JOBS}/WorkingDirPut/DeleteResource.sh \
+						--user=${g_user} \
+						--password=${g_password} \
+						--server=${g_server} \
+						--project=${g_project} \
+						--subject=${g_subject} \
+						--session=${g_session} \
+						--resource=${resource} \
+						--protocol="https" \
+						--force
+		shadowserver_code=$?
+		if [ ${shadowserver_code} -eq 3 ]
+		then
+			log_Msg "EXIT: all shadow servers are down".
+			exit 1
+		fi	
+	fi
 	
 	# Make processing job log files readable so they can be pushed into the database
 	chmod --recursive a+r ${g_working_dir}/*
@@ -424,7 +489,35 @@ main()
 
 	# Push the data into the DB
 
-	if [ "${g_use_http}" = "TRUE" ] ; then
+	if [ "${g_use_http}" = "TRUE" ] && [ -n "${g_parallel_streams}" ] ; then
+		log_Msg "-------------------------------------------------"
+		log_Msg "Putting new data into DB using ${g_parallel_streams} parallel HTTP streams from working dir: ${g_working_dir}"
+		log_Msg "-------------------------------------------------"
+
+		# parallel_upload.py talks to the server directly, so fail over to another
+		# shadow server here if this one is down (as PutDirIntoResource.sh would)
+		find_up_put_server
+		if [ $? -eq 3 ]; then
+			log_Msg "EXIT: all shadow servers are down"
+			exit 3
+		fi
+
+		PYTHONPATH=${XNAT_PBS_JOBS}/lib python3 ${XNAT_PBS_JOBS}/lib/utils/parallel_upload.py \
+						--user=${g_user} \
+						--password=${g_password} \
+						--server=${g_server} \
+						--project=${g_project} \
+						--subject=${g_subject} \
+						--session=${g_session} \
+						--resource=${resource} \
+						--reason=${g_reason} \
+						--dir=${g_working_dir} \
+						--streams=${g_parallel_streams} \
+						--protocol="https" \
+						--force
+		shadowserver_code=$?
+
+	elif [ "${g_use_http}" = "TRUE" ] ; then
 		log_Msg "-------------------------------------------------"
 		log_Msg "Putting new data into DB using HTTP from working dir: ${g_working_dir}"
 		log_Msg "-------------------------------------------------"
@@ -8,6 +8,9 @@ ccf/archive.py: Provides direct access to a CCF project archive.
 import glob
 import os
 
+# import of local modules
+import ccf.session_inventory as ccf_session_inventory
+
 UNPROC_SUFFIX = 'unproc'
 PREPROC_SUFFIX = "preproc"
 FUNCTIONAL_SCAN_MARKER = 'fMRI'
@@ -70,6 +73,13 @@ class CcfArchive(object):
 		"""
 		return f'{self.archive_root}/{project_id}/resources'
 
+	def session_inventory(self, subject_info):
+		"""
+		The (cached) SessionInventory of the subject-level resources directory
+		for a subject in this project archive
+		"""
+		return ccf_session_inventory.get_session_inventory(self.subject_resources_dir_full_path(subject_info))
+
 	# scan name property checking methods
 
 	def is_resting_state_scan_name(self, scan_name):
@@ -95,7 +105,7 @@ class CcfArchive(object):
 		"""
 		path_expr = self.subject_resources_dir_full_path(subject_info)
 		path_expr += "/" + 'T[12]w' + "_" + '*' + UNPROC_SUFFIX
-		dir_list = glob.glob(path_expr)
+		dir_list = self._glob_resources(subject_info, path_expr)
 		return sorted(dir_list)
 
 	def available_structural_unproc_names(self, subject_info):
@@ -113,7 +123,7 @@ class CcfArchive(object):
 		"""
 		path_expr = self.subject_resources_dir_full_path(subject_info)
 		path_expr += "/" + 'T1w' + "_" + '*' + UNPROC_SUFFIX
-		dir_list = glob.glob(path_expr)
+		dir_list = self._glob_resources(subject_info, path_expr)
 		return sorted(dir_list)
 
 	def available_t1w_unproc_names(self, subject_info):
@@ -131,7 +141,7 @@ class CcfArchive(object):
 		"""
 		path_expr = self.subject_resources_dir_full_path(subject_info)
 		path_expr += "/" + 'T2w' + "_" + '*' + UNPROC_SUFFIX
-		dir_list = glob.glob(path_expr)
+		dir_list = self._glob_resources(subject_info, path_expr)
 		return sorted(dir_list)
 
 	def available_t2w_unproc_names(self, subject_info):
@@ -149,7 +159,7 @@ class CcfArchive(object):
 		"""
 		path_expr = self.subject_resources_dir_full_path(subject_info)
 		path_expr += "/" + '*' + FUNCTIONAL_SCAN_MARKER + '*' + UNPROC_SUFFIX
-		dir_list = glob.glob(path_expr)
+		dir_list = self._glob_resources(subject_info, path_expr)
 		return sorted(dir_list)
 
 	def available_functional_unproc_names(self, subject_info):
@@ -185,7 +195,7 @@ class CcfArchive(object):
 		List of full paths to any resources containing unprocessing diffusion scans
 		for the specified subject
 		"""
-		dir_list = glob.glob(self.diffusion_unproc_dir_full_path(subject_info))
+		dir_list = self._glob_resources(subject_info, self.diffusion_unproc_dir_full_path(subject_info))
 		return sorted(dir_list)
 
 	def available_diffusion_unproc_names(self, subject_info):
@@ -208,7 +218,7 @@ class CcfArchive(object):
 		"""
 		List of full paths to the running status directories
 		"""
-		dir_list = glob.glob(self.running_status_dir_full_path(subject_info))
+		dir_list = self._glob_resources(subject_info, self.running_status_dir_full_path(subject_info))
 		return sorted(dir_list)	
 		
 	# preprocessed data paths and names
@@ -231,7 +241,7 @@ class CcfArchive(object):
 		for the specified subject
 		"""
 		path_expr = self.hand_edit_dir_full_path(subject_info)
-		dir_list = glob.glob(path_expr)
+		dir_list = self._glob_resources(subject_info, path_expr)
 		return sorted(dir_list)
 	
 	def available_structural_preproc_hand_edit_dir_full_paths(self, subject_info):
@@ -240,7 +250,7 @@ class CcfArchive(object):
 		for the specified subject
 		"""
 		path_expr = self.structural_preproc_hand_edit_dir_full_path(subject_info)
-		dir_list = glob.glob(path_expr)
+		dir_list = self._glob_resources(subject_info, path_expr)
 		return sorted(dir_list)
 	
 	def available_structural_preproc_dir_full_paths(self, subject_info):
@@ -249,7 +259,7 @@ class CcfArchive(object):
 		for the specified subject
 		"""
 		path_expr = self.structural_preproc_dir_full_path(subject_info)
-		dir_list = glob.glob(path_expr)
+		dir_list = self._glob_resources(subject_info, path_expr)
 		return sorted(dir_list)
 		
 	def supplemental_structural_preproc_dir_full_path(self, subject_info):
@@ -267,7 +277,7 @@ class CcfArchive(object):
 		data for the specified subject
 		"""
 		path_expr = self.supplemental_structural_preproc_dir_full_path(subject_info)
-		dir_list = glob.glob(path_expr)
+		dir_list = self._glob_resources(subject_info, path_expr)
 		return sorted(dir_list)
 		
 	def hand_edit_dir_full_path(self, subject_info):
@@ -300,7 +310,7 @@ class CcfArchive(object):
 		for the specified subject
 		"""
 		path_expr = self.hand_edit_dir_full_path(subject_info)
-		dir_list = glob.glob(path_expr)
+		dir_list = self._glob_resources(subject_info, path_expr)
 		return sorted(dir_list)
 	
 	def available_structural_preproc_hand_edit_dir_full_paths(self, subject_info):
@@ -309,7 +319,7 @@ class CcfArchive(object):
 		for the specified subject
 		"""
 		path_expr = self.structural_preproc_hand_edit_dir_full_path(subject_info)
-		dir_list = glob.glob(path_expr)
+		dir_list = self._glob_resources(subject_info, path_expr)
 		return sorted(dir_list)
 
 	def diffusion_preproc_dir_full_path(self, subject_info):
@@ -330,7 +340,7 @@ class CcfArchive(object):
 		for the specified subject
 		"""
 		path_expr = self.diffusion_preproc_dir_full_path(subject_info)
-		dir_list = glob.glob(path_expr)
+		dir_list = self._glob_resources(subject_info, path_expr)
 		return sorted(dir_list)
 
 
@@ -341,7 +351,7 @@ class CcfArchive(object):
 		"""
 		path_expr = self.subject_resources_dir_full_path(subject_info)
 		path_expr += "/" + '*' + FUNCTIONAL_SCAN_MARKER + '*' + PREPROC_SUFFIX
-		dir_list = glob.glob(path_expr)
+		dir_list = self._glob_resources(subject_info, path_expr)
 		return sorted(dir_list)
 
 	def available_functional_preproc_names(self, subject_info):
@@ -385,7 +395,7 @@ class CcfArchive(object):
 		data for the specified subject
 		"""
 		path_expr = self.msmall_registration_dir_full_path(subject_info)
-		dir_list = glob.glob(path_expr)
+		dir_list = self._glob_resources(subject_info, path_expr)
 		return sorted(dir_list)
 
 
@@ -438,7 +448,7 @@ class CcfArchive(object):
 		# dir_list = glob.glob(path_expr)
 		# return sorted(dir_list)
 		path_expr = self.multirun_icafix_dir_full_path(subject_info)
-		dir_list = glob.glob(path_expr)
+		dir_list = self._glob_resources(subject_info, path_expr)
 		return sorted(dir_list)
 
 
@@ -449,7 +459,7 @@ class CcfArchive(object):
 		"""
 		path_expr = self.subject_resources_dir_full_path(subject_info)
 		path_expr += "/" + '*' + FIX_PROCESSED_SUFFIX
-		dir_list = glob.glob(path_expr)
+		dir_list = self._glob_resources(subject_info, path_expr)
 		return sorted(dir_list)
 
 	def dedrift_and_resample_dir_full_path(self, subject_info):
@@ -466,7 +476,7 @@ class CcfArchive(object):
 		data for the specified subject
 		"""
 		path_expr = self.dedrift_and_resample_dir_full_path(subject_info)
-		dir_list = glob.glob(path_expr)
+		dir_list = self._glob_resources(subject_info, path_expr)
 		return sorted(dir_list)
 
 	def available_rss_processed_dir_full_paths(self, subject_info):
@@ -476,7 +486,7 @@ class CcfArchive(object):
 		"""
 		path_expr = self.subject_resources_dir_full_path(subject_info)
 		path_expr += "/" + '*' + RSS_PROCESSED_SUFFIX
-		dir_list = glob.glob(path_expr)
+		dir_list = self._glob_resources(subject_info, path_expr)
 		return sorted(dir_list)
 
 	def available_postfix_processed_dir_full_paths(self, subject_info):
@@ -486,7 +496,7 @@ class CcfArchive(object):
 		"""
 		path_expr = self.subject_resources_dir_full_path(subject_info)
 		path_expr += "/" + '*' + POSTFIX_PROCESSED_SUFFIX
-		dir_list = glob.glob(path_expr)
+		dir_list = self._glob_resources(subject_info, path_expr)
 		return sorted(dir_list)
 
 	def available_task_processed_dir_full_paths(self, subject_info):
@@ -498,7 +508,7 @@ class CcfArchive(object):
 
 		path_expr = self.subject_resources_dir_full_path(subject_info)
 		path_expr += "/" + TASK_SCAN_MARKER + '*'
-		first_dir_list = glob.glob(path_expr)
+		first_dir_list = self._glob_resources(subject_info, path_expr)
 
 		for directory in first_dir_list:
 			lastsepindex = directory.rfind("/")
@@ -524,7 +534,7 @@ class CcfArchive(object):
 		for the specified subject
 		"""
 		path_expr = self.bedpostx_dir_full_path(subject_info)
-		dir_list = glob.glob(path_expr)
+		dir_list = self._glob_resources(subject_info, path_expr)
 		return sorted(dir_list)
 
 	def reapplyfix_dir_full_path(self, subject_info, scan_name, reg_name=None):
@@ -541,7 +551,7 @@ class CcfArchive(object):
 		if reg_name:
 			path_expr += reg_name
 
-		dir_list = glob.glob(path_expr)
+		dir_list = self._glob_resources(subject_info, path_expr)
 		return sorted(dir_list)
 
 	def available_reapplyfix_names(self, subject_info, reg_name=None):
@@ -553,6 +563,16 @@ class CcfArchive(object):
 
 	# Internal utility methods
 
+	def _glob_resources(self, subject_info, path_expr):
+		"""
+		Sorted list of full paths matching the specified expression, answered from
+		the session inventory when the expression is for a subject-level resource
+		"""
+		(dir_name, pattern) = os.path.split(path_expr)
+		if dir_name != self.subject_resources_dir_full_path(subject_info):
+			return sorted(glob.glob(path_expr))
+		return self.session_inventory(subject_info).glob(pattern)
+
 	def _get_scan_names_from_full_paths(self, dir_list):
 		name_list = []
 		for directory in dir_list:
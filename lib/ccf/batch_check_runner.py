@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+"""
+ccf/batch_check_runner.py: Run the per-row checks of a batch completion check
+(Check*CompletionBatch.py) in parallel.
+
+The rows (subjects or subject scans) are fanned out to a pool of worker threads
+or processes, but the results are yielded in input order as soon as each one
+(and all the rows before it) are available, so the .status file is streamed in
+the same order as it would be by a serial check. The time taken to check each
+row is reported as it is yielded.
+"""
+
+# import of built-in modules
+import argparse
+import concurrent.futures
+import functools
+import logging
+import os
+import sys
+import time
+
+# import of third-party modules
+
+# import of local modules
+import utils.file_integrity as file_integrity
+
+# authorship information
+__author__ = "Timothy B. Brown"
+__copyright__ = "Copyright 2020, The Connectome Coordination Facility (CCF)"
+__maintainer__ = "Junil Chang"
+
+# create a module logger
+module_logger = logging.getLogger(__name__)
+module_logger.setLevel(logging.WARNING)  # Note: This can be overidden by log file configuration
+
+
+class _DeepVerifyAction(argparse.Action):
+	"""
+	Turn on deep verification by setting it in the environment, so that it applies
+	to every completion check (including those done in worker processes).
+	"""
+
+	def __call__(self, parser, namespace, values, option_string=None):
+		os.environ[file_integrity.DEEP_VERIFY_VARIABLE] = '1'
+		setattr(namespace, self.dest, True)
+
+
+def add_arguments(parser):
+	"""Add the command line arguments that control a BatchCheckRunner to the specified parser."""
+	parser.add_argument('-j', '--jobs', dest='jobs', required=False, type=int, default=1,
+						help="number of rows to check at once (default: 1)")
+	parser.add_argument('--processes', dest='use_processes', action='store_true',
+						required=False, default=False,
+						help="check rows in worker processes instead of worker threads")
+	parser.add_argument('--deep-verify', dest='deep_verify', action=_DeepVerifyAction, nargs=0,
+						required=False, default=file_integrity.deep_verify_default(),
+						help="also check expected files for truncation or corruption (rows only "
+						"checked for the existence of the files before are checked again)")
+
+
+def _timed_call(check_item, item):
+	start_time = time.monotonic()
+	result = check_item(*item)
+	return (time.monotonic() - start_time, result)
+
+
+class BatchCheckRunner(object):
+	"""
+	Runs a check function over a list of items (each a tuple of arguments to the
+	check function) using the specified number of worker threads or processes.
+	"""
+
+	def __init__(self, jobs=1, use_processes=False, latency_output=sys.stderr):
+		self._jobs = max(1, jobs)
+		self._use_processes = use_processes
+		self._latency_output = latency_output
+
+	@property
+	def jobs(self):
+		return self._jobs
+
+	def run(self, check_item, items):
+		"""
+		Generator of check_item(*item) for each item in items, in the order of items.
+
+		When checking in worker processes, check_item and the items must be
+		picklable (e.g. a module level function or a functools.partial of one).
+		"""
+		timed_check_item = functools.partial(_timed_call, check_item)
+		latencies = []
+		start_time = time.monotonic()
+
+		if self._jobs == 1:
+			executor = None
+			results = map(timed_check_item, items)
+		elif self._use_processes:
+			executor = concurrent.futures.ProcessPoolExecutor(max_workers=self._jobs)
+			results = executor.map(timed_check_item, items)
+		else:
+			executor = concurrent.futures.ThreadPoolExecutor(max_workers=self._jobs)
+			results = executor.map(timed_check_item, items)
+
+		try:
+			for row, (latency, result) in enumerate(results, start=1):
+				latencies.append(latency)
+				print("row " + str(row) + " checked in " + "%.3f" % latency + " seconds",
+					  file=self._latency_output)
+				yield result
+
+		finally:
+			if executor:
+				executor.shutdown(wait=False, cancel_futures=True)
+
+		elapsed = time.monotonic() - start_time
+		if latencies:
+			print("checked " + str(len(latencies)) + " rows with " + str(self._jobs) + " job(s) in " +
+				  "%.3f" % elapsed + " seconds, mean row latency: " +
+				  "%.3f" % (sum(latencies) / len(latencies)) + " seconds, max row latency: " +
+				  "%.3f" % max(latencies) + " seconds", file=self._latency_output)
@@ -13,6 +13,8 @@ import random
 # import of third-party modules
 
 # import of local modules
+import ccf.job_submission_engine as job_submission_engine
+import ccf.shadow_server_scheduler as shadow_server_scheduler
 import utils.os_utils as os_utils
 
 # authorship information
@@ -60,8 +62,88 @@ class BatchSubmitter(abc.ABC):
     def __init__(self, archive):
         """Construct a BatchSumitter"""
         self._archive = archive
+        self._submission_engine = job_submission_engine.SubmissionEngine()
+        self._put_server_scheduler = None
+        self._queued_submitters = []
         # #### self._shadow_number = random.randint(self.MIN_SHADOW_NUMBER, self.MAX_SHADOW_NUMBER)
 
+    @property
+    def submission_engine(self):
+        """
+        Submission engine shared by all the one subject submitters in a batch so that
+        the job chains for the whole batch are submitted to the scheduler together.
+        """
+        return self._submission_engine
+
+    @property
+    def put_server_scheduler(self):
+        """
+        Scheduler that assigns the puts of the jobs in this batch to the healthy shadow
+        servers (the servers are probed once per batch, when the first put is assigned).
+        """
+        if self._put_server_scheduler is None:
+            self._put_server_scheduler = shadow_server_scheduler.ShadowServerScheduler()
+        return self._put_server_scheduler
+
+    def use_job_arrays(self, array_script_dir):
+        """
+        Submit the jobs queued for this batch as PBS job arrays (one array per processing
+        stage) instead of as individual job chains. Intended for pipelines that submit one
+        independent job chain per scan.
+
+        :param array_script_dir: directory in which to write the job array wrapper scripts
+        """
+        self._submission_engine = job_submission_engine.JobArraySubmissionEngine(array_script_dir)
+
+    def queue_jobs(self, submitter, processing_stage):
+        """
+        Queue the jobs for one subject with the shared submission engine. They are
+        submitted, along with the jobs for all other subjects in the batch, by
+        submit_queued_jobs, which must be called (e.g. in a finally clause) even
+        if queuing the jobs for a later subject fails.
+
+        :param submitter: one subject submitter, configured for the subject
+        :param processing_stage: processing stage to submit jobs through
+        :return: the submitted job list returned by the one subject submitter
+        """
+        submitter.submission_engine = self.submission_engine
+        self._queued_submitters.append(submitter)
+        try:
+            return submitter.submit_jobs(processing_stage)
+        except Exception:
+            # do not submit part of a chain, the subject's marker is cleared by submit_queued_jobs
+            submitter.discard_queued_jobs()
+            raise
+
+    def submit_queued_jobs(self, queued_job_lists):
+        """
+        Submit all jobs queued with the shared submission engine and report the
+        job ids that were assigned.
+
+        :param queued_job_lists: list of (subject, submitted_job_list) tuples as
+                                 returned from the one subject submitters
+        """
+        try:
+            self.submission_engine.submit()
+        finally:
+            self.submission_engine.close()
+            # subjects whose job chains were not (completely) submitted must not be
+            # left marked as queued
+            for submitter in self._queued_submitters:
+                submitter.clear_stale_running_status()
+            self._queued_submitters = []
+            for (subject, submitted_job_list) in queued_job_lists:
+                print("-----")
+                print("\tsubmitted jobs for:", subject)
+                for job in submitted_job_list:
+                    print("\tsubmitted jobs:", job)
+            print("-----")
+            if self._put_server_scheduler is not None:
+                print("\tput server assignments (" + self._put_server_scheduler.policy + "):")
+                for (server, count) in sorted(self._put_server_scheduler.assigned.items()):
+                    print("\t\t", server + ":", count)
+                print("-----")
+
     @property
     def shadow_number(self):
         """shadow number"""
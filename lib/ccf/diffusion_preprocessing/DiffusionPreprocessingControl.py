@@ -34,8 +34,12 @@ import ccf.diffusion_preprocessing.SubmitDiffusionPreprocessingBatch as SubmitDi
 import ccf.diffusion_preprocessing.one_subject_completion_xnat_checker as one_subject_completion_xnat_checker
 import ccf.diffusion_preprocessing.one_subject_prereq_checker as one_subject_prereq_checker
 import ccf.diffusion_preprocessing.one_subject_run_status_checker as one_subject_run_status_checker
+import ccf.running_status_index as ccf_running_status_index
+import ccf.status_cache as ccf_status_cache
+import ccf.status_store as ccf_status_store
 import ccf.subject as ccf_subject
 import qt_utils.login_dialog as login_dialog
+import qt_utils.status_table_builder as status_table_builder
 import utils.file_utils as file_utils
 import utils.my_configparser as my_configparser
 
@@ -168,6 +172,18 @@ class ControlPanelWidget(QWidget):
 		
 		self.createTable()
 
+		self.progress_bar = QProgressBar(self)
+		self.progress_bar.hide()
+
+		# the status table is built in worker threads, see refreshStatusTable
+		self._status_list = []
+		self._status_cache = ccf_status_cache.StatusCache()
+		self._status_store = ccf_status_store.StatusStore(ccf_status_store.default_status_db_path())
+		self._status_table_builder = status_table_builder.StatusTableBuilder(parent=self)
+		self._status_table_builder.status_item_ready.connect(self.on_status_item_ready)
+		self._status_table_builder.progress.connect(self.on_status_progress)
+		self._status_table_builder.finished.connect(self.on_status_finished)
+
 		export_button = QPushButton("Export", self)
 		export_button.clicked.connect(self.on_export_click)
 
@@ -182,6 +198,7 @@ class ControlPanelWidget(QWidget):
 
 		self.layout = QVBoxLayout()
 		self.layout.addWidget(self.tableWidget)
+		self.layout.addWidget(self.progress_bar)
 
 		button_box = QHBoxLayout()
 		button_box.addWidget(export_button)
@@ -260,12 +277,13 @@ class ControlPanelWidget(QWidget):
 
 		self.tableWidget.clearSelection()
 		
+		running_status_index = ccf_running_status_index.RunningStatusIndex()
+		
 		for index, subject in enumerate(self.subject_list):
-			prereqs_met = self.prereq_checker.are_prereqs_met(self.archive, subject)
-			processing_complete = self.completion_checker.is_processing_marked_complete(self.archive, subject)
-			queued_or_running = self.run_status_checker.get_queued_or_running(subject)
+			# only rows whose inputs have changed since their status was determined are re-evaluated
+			status_item = self.cached_status_item(subject, running_status_index)
 
-			if prereqs_met and (not processing_complete) and (not queued_or_running):
+			if status_item.prerequisites_met and (not status_item.processing_complete) and (not status_item.run_status):
 				self.tableWidget.selectRow(index)
 		
 	@property
@@ -300,37 +318,64 @@ class ControlPanelWidget(QWidget):
 	def subject_list(self):
 		return self._subject_list
 
-	def build_status_list(self, subject_list):
+	def check_status(self, subject):
+		prereqs_met = self.prereq_checker.are_prereqs_met(self.archive, subject)
+		resource = self.archive.diffusion_preproc_dir_name(subject)
+		resource_exists = self.completion_checker.does_processed_resource_exist(self.archive, subject)
 
-		status_list = []
+		if resource_exists:
+			resource_fullpath = self.archive.diffusion_preproc_dir_full_path(subject)
+			resource_mtime = os.path.getmtime(resource_fullpath)
+		else:
+			resource = DNM
+			resource_mtime = None
+		
+		processing_complete = self.completion_checker.is_processing_marked_complete(self.archive, subject)
 
-		for subject in self._subject_list:
-			prereqs_met = self.prereq_checker.are_prereqs_met(self.archive, subject)
-			resource = self.archive.diffusion_preproc_dir_name(subject)
-			resource_exists = self.completion_checker.does_processed_resource_exist(archive, subject)
+		return (prereqs_met, resource, resource_exists, resource_mtime, processing_complete)
 
-			if resource_exists:
-				resource_fullpath = self.archive.diffusion_preproc_dir_full_path(subject)
-				timestamp = os.path.getmtime(resource_fullpath)
-				resource_date = datetime.datetime.fromtimestamp(timestamp).strftime(DATE_FORMAT)
-			else:
-				resource = DNM
-				resource_date = NA
-			
-			processing_complete = self.completion_checker.is_processing_marked_complete(self.archive, subject)
-			run_status = self.run_status_checker.get_queued_or_running(subject)
-			
-			status_list.append(StatusInfo(subject.project, subject.subject_id, subject.classifier,
-										  prereqs_met, resource, resource_exists, resource_date,
-										  processing_complete, run_status))
+	def build_status_item(self, subject, running_status_index):
+		run_status = self.run_status_checker.get_queued_or_running(subject, running_status_index)
+
+		# the checks are only redone if the resources they depend on have changed since they were last done
+		record = self._status_store.get_or_check(
+			ccf_status_store.status_key(subject, self.completion_checker.processing_name),
+			self.completion_checker.status_dependency_paths(self.archive, subject),
+			ccf_status_store.MARKER_CHECK, lambda: self.check_status(subject), run_status)
+
+		if record.resource_mtime is None:
+			resource_date = NA
+		else:
+			resource_date = datetime.datetime.fromtimestamp(record.resource_mtime).strftime(DATE_FORMAT)
+
+		return StatusInfo(subject.project, subject.subject_id, subject.classifier,
+						  record.prereqs_met, record.resource, record.resource_exists, resource_date,
+						  record.complete, run_status)
+
+	def status_dependency_paths(self, subject):
+		"""
+		Paths whose modification times determine whether the cached status for
+		the specified subject is still valid
+		"""
+		paths = self.completion_checker.status_dependency_paths(self.archive, subject)
+		paths.append(self.run_status_checker.running_marker_dir_full_path(subject))
+		return paths
+
+	def cached_status_item(self, subject, running_status_index):
+		return self._status_cache.get_or_build(
+			str(subject), self.status_dependency_paths(subject),
+			lambda: self.build_status_item(subject, running_status_index))
+
+	def build_status_list(self, subject_list):
+
+		running_status_index = ccf_running_status_index.RunningStatusIndex()
 
-		return status_list
+		return [self.cached_status_item(subject, running_status_index) for subject in subject_list]
 	
 	@subject_list.setter
 	def subject_list(self, value):
-		self._subject_list = value		
-		status_list = self.build_status_list(self._subject_list)
-		self.setStatusList(status_list)
+		self._subject_list = value
+		self.refreshStatusTable()
 
 	def setStatusList(self, status_list):
 		self.tableWidget.clear()
@@ -346,6 +391,40 @@ class ControlPanelWidget(QWidget):
 
 		self.tableWidget.resizeColumnsToContents()
 
+	def refreshStatusTable(self):
+		"""
+		Rebuild the status table for the current subject list. The rows are filled
+		in as their status becomes available, and any refresh still in progress is
+		cancelled.
+		"""
+		self.tableWidget.clear()
+		self.tableWidget.setHorizontalHeaderLabels(self.header_labels)
+		self.tableWidget.setRowCount(len(self._subject_list))
+
+		self._status_list = [None] * len(self._subject_list)
+
+		self.progress_bar.setRange(0, len(self._subject_list))
+		self.progress_bar.setValue(0)
+		self.progress_bar.show()
+
+		running_status_index = ccf_running_status_index.RunningStatusIndex()
+		self._status_table_builder.start(
+			self._subject_list, lambda subject: self.cached_status_item(subject, running_status_index))
+
+	@pyqtSlot(int, object)
+	def on_status_item_ready(self, row, status_item):
+		self._status_list[row] = status_item
+		self.setStatusItem(status_item, row)
+
+	@pyqtSlot(int, int)
+	def on_status_progress(self, done, total):
+		self.progress_bar.setValue(done)
+
+	@pyqtSlot()
+	def on_status_finished(self):
+		self.progress_bar.hide()
+		self.tableWidget.resizeColumnsToContents()
+
 	def setStatusItem(self, status_item, row):
 		self.tableWidget.setItem(row, 0, QTableWidgetItem(status_item.project))
 		self.tableWidget.item(row, 0).setTextAlignment(Qt.AlignCenter)
@@ -375,7 +454,11 @@ class ControlPanelWidget(QWidget):
 		self.tableWidget.item(row, 8).setTextAlignment(Qt.AlignCenter)
 
 	def exportTable(self):
-		status_list = self.build_status_list(self._subject_list)
+		if self._status_table_builder.in_progress or None in self._status_list:
+			status_list = self.build_status_list(self._subject_list)
+		else:
+			status_list = self._status_list
+
 		options = QFileDialog.Options()
 		status_file_name, other_stuff = QFileDialog.getSaveFileName(self, "Save Status File", "", "Status Files (*.status);;All Files (*)", options=options)
 
@@ -217,7 +217,7 @@ class OneSubjectJobSubmitter(one_subject_job_submitter.OneSubjectJobSubmitter):
 			script.write(hcppipelineprocess_line + os.linesep)
 			os.chmod(script_name, stat.S_IRWXU | stat.S_IRWXG)
 			
-	def mark_running_status(self, stage):
+	def mark_running_status(self, stage, running=True):
 		module_logger.debug(debug_utils.get_name())
 
 		if stage > ccf_processing_stage.ProcessingStage.PREPARE_SCRIPTS:
@@ -232,7 +232,7 @@ class OneSubjectJobSubmitter(one_subject_job_submitter.OneSubjectJobSubmitter):
 			mark_cmd += ' --subject=' + self.subject
 			mark_cmd += ' --classifier=' + self.classifier
 			mark_cmd += ' --resource=RunningStatus'
-			mark_cmd += ' --queued'
+			mark_cmd += ' --queued' if running else ' --not-queued'
 
 			completed_mark_cmd_process = subprocess.run(
 				mark_cmd, shell=True, check=True, stdout=subprocess.PIPE, universal_newlines=True)
@@ -6,6 +6,8 @@ for a specified subject within a specified project.
 
 # import of built-in modules
 import abc
+import contextlib
+import functools
 import glob
 import logging
 import logging.config
@@ -22,6 +24,7 @@ import utils.debug_utils as debug_utils
 import utils.file_utils as file_utils
 import utils.my_argparse as my_argparse
 import utils.os_utils as os_utils
+import utils.overlay_copy as overlay_copy
 
 # authorship information
 __author__ = "Timothy B. Brown"
@@ -36,6 +39,14 @@ sh.setFormatter(logging.Formatter('%(name)s: %(message)s'))
 module_logger.addHandler(sh)
 
 
+def _planned_copies(method):
+    """Decorator for DataRetriever methods that defers their copies, see DataRetriever.planned_copies"""
+    @functools.wraps(method)
+    def planned_copies_method(self, *args, **kwargs):
+        with self.planned_copies():
+            return method(self, *args, **kwargs)
+    return planned_copies_method
+
 
 class DataRetriever(object):
 
@@ -47,6 +58,16 @@ class DataRetriever(object):
         # True  ==> files will be copied
         self._copy = False
 
+        # indication of whether copies should be made by reflinking or hard
+        # linking files where possible (instead of by rsync), only used if
+        # data is to be copied
+        self._link_copy = False
+
+        # number of copies (by rsync) made at once, and the plan of the copies
+        # deferred by planned_copies
+        self._copy_workers = int(os.getenv('XNAT_PBS_JOBS_GET_DATA_COPY_WORKERS', overlay_copy.DEFAULT_WORKERS))
+        self._copy_plan = None
+
         # indication of whether logging of files copied
         # or linked should be shown
         self._show_log = False
@@ -65,6 +86,26 @@ class DataRetriever(object):
             raise TypeError("copy must be set to a boolean value")
         self._copy = value
 
+    @property
+    def link_copy(self):
+        return self._link_copy
+
+    @link_copy.setter
+    def link_copy(self, value):
+        if not isinstance(value, bool):
+            raise TypeError("link_copy must be set to a boolean value")
+        self._link_copy = value
+
+    @property
+    def copy_workers(self):
+        return self._copy_workers
+
+    @copy_workers.setter
+    def copy_workers(self, value):
+        if not isinstance(value, int) or value < 1:
+            raise TypeError("copy_workers must be set to a positive integer value")
+        self._copy_workers = value
+
     @property
     def show_log(self):
         return self._show_log
@@ -75,21 +116,36 @@ class DataRetriever(object):
             raise TypeError("show_log must be set to a boolean value")
         self._show_log = value
 
+    @contextlib.contextmanager
+    def planned_copies(self):
+        """
+        Defer the copies (by rsync) made in a block, then make them all together,
+        copy_workers at a time, with the same result as making them in turn (see
+        utils/overlay_copy.py). Blocks can be nested, the copies are made at the
+        end of the outermost block.
+        """
+        if self._copy_plan is not None:
+            yield
+            return
+
+        self._copy_plan = overlay_copy.OverlayCopyPlan()
+        try:
+            yield
+            copy_plan = self._copy_plan
+        finally:
+            self._copy_plan = None
+        copy_plan.execute(self.copy_workers, self.show_log)
+
     def _from_to(self, get_from, put_to):
         os.makedirs(put_to, exist_ok=True)
-        if self.copy:
-            if self.show_log:
-                rsync_cmd = 'rsync -auLv '
-            else:
-                rsync_cmd = 'rsync -auL '
+        if self.copy and self.link_copy:
+            module_logger.debug(debug_utils.get_name() + " link copying " + get_from + " to " + put_to)
+            os_utils.copy_tree_by_links(get_from, put_to, self.show_log)
 
-            rsync_cmd += get_from + os.sep + '*' + ' ' + put_to
-            module_logger.debug(debug_utils.get_name() + " rsync_cmd: " + rsync_cmd)
-
-            completed_rsync_process = subprocess.run(
-                rsync_cmd, shell=True, check=True, stdout=subprocess.PIPE,
-                universal_newlines=True)
-            module_logger.debug(debug_utils.get_name() + " stdout: " + completed_rsync_process.stdout)
+        elif self.copy:
+            with self.planned_copies():
+                module_logger.debug(debug_utils.get_name() + " planning copy of " + get_from + " to " + put_to)
+                self._copy_plan.add(get_from, put_to)
 
         else:
             module_logger.debug(debug_utils.get_name() + " linking " + put_to + " to " + get_from)
@@ -97,6 +153,7 @@ class DataRetriever(object):
 
     # get unprocessed data
 
+    @_planned_copies
     def _get_unprocessed_data(self, directories, subject_info, output_dir):
         for directory in directories:
             get_from = directory
@@ -132,6 +189,7 @@ class DataRetriever(object):
             subject_info,
             output_dir)
 
+    @_planned_copies
     def get_unproc_data(self, subject_info, output_dir):
         self.get_structural_unproc_data(subject_info, output_dir)
         self.get_functional_unproc_data(subject_info, output_dir)
@@ -139,6 +197,7 @@ class DataRetriever(object):
 
     # get preprocessed data
 
+    @_planned_copies
     def _get_preprocessed_data(self, directories, output_dir):
         for directory in directories:
             get_from = directory
@@ -185,6 +244,7 @@ class DataRetriever(object):
             self.archive.available_diffusion_preproc_dir_full_paths(subject_info),
             output_dir)
 
+    @_planned_copies
     def get_preproc_data(self, subject_info, output_dir):
 
         if self.copy:
@@ -205,6 +265,7 @@ class DataRetriever(object):
 
     # get processed data
 
+    @_planned_copies
     def _get_processed_data(self, directories, output_dir):
         for directory in directories:
             get_from = directory
@@ -260,6 +321,7 @@ class DataRetriever(object):
 
     # prerequisites data for specific pipelines
 
+    @_planned_copies
     def get_struct_preproc_prereqs(self, subject_info, output_dir):
         """
         Get the data necessary to run the Structural Preprocessing pipeline
@@ -274,6 +336,7 @@ class DataRetriever(object):
             # chronological order
             self.get_unproc_data(subject_info, output_dir)
 
+    @_planned_copies
     def get_struct_preproc_hand_edit_prereqs(self, subject_info, output_dir):
         """
         Get the data necessary to run the Functional Preprocessing pipelines
@@ -292,6 +355,7 @@ class DataRetriever(object):
             self.get_structural_preproc_data(subject_info, output_dir)
             self.get_unproc_data(subject_info, output_dir)
 
+    @_planned_copies
     def get_diffusion_preproc_prereqs(self, subject_info, output_dir):
         """
         Get the data necessary to run the Diffusion Preprocessing pipeline
@@ -309,6 +373,7 @@ class DataRetriever(object):
             self.get_structural_preproc_data(subject_info, output_dir)
             self.get_unproc_data(subject_info, output_dir)
 
+    @_planned_copies
     def get_functional_preproc_prereqs(self, subject_info, output_dir):
         """
         Get the data necessary to run the Functional Preprocessing pipelines
@@ -326,6 +391,7 @@ class DataRetriever(object):
             self.get_structural_preproc_data(subject_info, output_dir)
             self.get_unproc_data(subject_info, output_dir)
 
+    @_planned_copies
     def get_multirunicafix_prereqs(self, subject_info, output_dir):
         """
         Get the data necessary to run the MultiRunICAFIX pipeline
@@ -343,6 +409,7 @@ class DataRetriever(object):
             self.get_unproc_data(subject_info, output_dir)
 
 
+    @_planned_copies
     def get_msmall_prereqs(self, subject_info, output_dir):
         """
         Get the data necessary to run the MsmAll pipeline
@@ -419,9 +486,11 @@ class DataRetriever(object):
         if self.copy:
             # when copying (via rsync), data should be retreived in chronological order
             # (i.e. the order in which the pipelines are run)
-            self.get_preproc_data(subject_info, output_dir)
-            self.get_fix_processed_data(subject_info, output_dir)
-            self.get_msmall_registration_data(subject_info, output_dir)
+            # (and copied before the ICA files are removed below)
+            with self.planned_copies():
+                self.get_preproc_data(subject_info, output_dir)
+                self.get_fix_processed_data(subject_info, output_dir)
+                self.get_msmall_registration_data(subject_info, output_dir)
 
         else:
             # when creating symbolic links, data should be retrieved in reverse
@@ -455,11 +524,8 @@ class DataRetriever(object):
         # find all paths that end with '.ica'
         paths = glob.iglob(output_dir + os.sep + '**' + os.sep + '*.ica', recursive=True)
         for path in paths:
-            if os.path.isdir(path):
-                for root, dirs, files in os.walk(path):
-                    for file in files:
-                        file_to_copy = os.path.join(root, file)
-                        file_utils.make_link_into_copy(file_to_copy, verbose=True)
+            if os.path.isdir(path) and not os.path.islink(path):
+                file_utils.make_all_links_into_copies(path, verbose=True)
 
     def get_reapplyfix_prereqs(self, subject_info, output_dir):
         """
@@ -470,6 +536,7 @@ class DataRetriever(object):
 
     # all pipeline data
 
+    @_planned_copies
     def get_all_pipeline_data(self, subject_info, output_dir):
         """
         Get all the subject specific data recognized.
@@ -529,6 +596,11 @@ def main():
     parser.add_argument('-a', '--scan', dest='scan', required=False, type=str, default=None)
     parser.add_argument('-c', '--copy', dest='copy', action='store_true',
                         required=False, default=False)
+    parser.add_argument('-k', '--link-copy', dest='link_copy', action='store_true',
+                        required=False, default=False,
+                        help="copy by reflinking or hard linking files where possible (implies --copy)")
+    parser.add_argument('-w', '--copy-workers', dest='copy_workers', required=False, type=int,
+                        help="number of rsync copies made at once (1 to copy each resource in turn)")
     parser.add_argument('-l', '--log', dest='log', action='store_true',
                         required=False, default=False)
     parser.add_argument('-r', '--remove-non-subdirs', dest='remove_non_subdirs', action='store_true',
@@ -571,6 +643,8 @@ def main():
     module_logger.info("              Phase: " + args.phase)
     if args.copy:
         module_logger.info("               Copy: " + str(args.copy))
+    if args.link_copy:
+        module_logger.info("          Link Copy: " + str(args.link_copy))
     if args.log:
         module_logger.info("                Log: " + str(args.log))
     if args.remove_non_subdirs:
@@ -581,7 +655,10 @@ def main():
     archive = ccf_archive.CcfArchive()
 
     data_retriever = DataRetriever(archive)
-    data_retriever.copy = args.copy
+    data_retriever.copy = args.copy or args.link_copy
+    data_retriever.link_copy = args.link_copy
+    if args.copy_workers:
+        data_retriever.copy_workers = args.copy_workers
     data_retriever.show_log = args.log
 
     # retrieve data based on phase requested
@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+
+"""
+ccf/job_submission_engine.py: Submit chains of dependent PBS jobs through a
+single persistent channel to the scheduler.
+
+Jobs are first queued in memory (with their dependencies on other queued jobs
+or on already existing job ids). When the engine is asked to submit, all queued
+jobs are pushed, in order, through one long-lived shell coprocess that runs the
+qsub commands. The job id for each job is read back from the coprocess as soon
+as it is available.
+"""
+
+# import of built-in modules
+import contextlib
+import logging
+import os
+import shlex
+import stat
+import subprocess
+
+# import of third-party modules
+
+# import of local modules
+import ccf.queue_snapshot as queue_snapshot
+import utils.debug_utils as debug_utils
+
+# authorship information
+__author__ = "Timothy B. Brown"
+__copyright__ = "Copyright 2020, The Connectome Coordination Facility (CCF)"
+__maintainer__ = "Junil Chang"
+
+# create a module logger
+module_logger = logging.getLogger(__name__)
+module_logger.setLevel(logging.WARNING)  # Note: This can be overidden by log file configuration
+
+
+class QueuedJob(object):
+	"""
+	A job that has been queued with a SubmissionEngine.
+
+	Until the engine has submitted the job, job_no is None. Once submitted,
+	str() of a QueuedJob is the PBS job id, so it can be used anywhere a job
+	id string was used before.
+	"""
+
+	def __init__(self, script_name, prior_job=None, dependency='afterok', qsub_options=None):
+		self._script_name = script_name
+		self._prior_job = prior_job
+		self._dependency = dependency
+		self._qsub_options = qsub_options
+		self._job_no = None
+		self._returncode = None
+		self._submit_cmd = None
+
+	@property
+	def script_name(self):
+		return self._script_name
+
+	@property
+	def prior_job(self):
+		return self._prior_job
+
+	@property
+	def dependency(self):
+		return self._dependency
+
+	@property
+	def qsub_options(self):
+		return self._qsub_options
+
+	@property
+	def job_no(self):
+		"""PBS job id, or None if the job has not (successfully) been submitted."""
+		return self._job_no
+
+	@property
+	def returncode(self):
+		"""Exit status of the qsub command, or None if the job has not been sent to qsub."""
+		return self._returncode
+
+	@property
+	def submit_cmd(self):
+		return self._submit_cmd
+
+	@property
+	def submitted(self):
+		return self._job_no is not None
+
+	@property
+	def failed(self):
+		return self._returncode is not None and self._job_no is None
+
+	def __str__(self):
+		return self._job_no if self._job_no else ''
+
+	def __repr__(self):
+		return repr(str(self))
+
+
+class SubmissionEngine(object):
+	"""
+	Builds chains of dependent jobs in memory and submits them to PBS through
+	one persistent shell coprocess.
+
+	A SubmissionEngine can be shared by many OneSubjectJobSubmitter objects so
+	that the job chains for a whole batch of subjects are submitted together.
+	"""
+
+	_RESULT_FORMAT = "printf '%d %d %s\\n' "
+
+	def __init__(self, qsub_command='qsub', shell='/bin/bash'):
+		self._qsub_command = qsub_command
+		self._shell = shell
+		self._coprocess = None
+		self._pending = []
+		self._submitted = []
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	@property
+	def pending_jobs(self):
+		return list(self._pending)
+
+	@property
+	def submitted_jobs(self):
+		return list(self._submitted)
+
+	def queue(self, script_name, prior_job=None, dependency='afterok', qsub_options=None):
+		"""
+		Queue a job script for submission.
+
+		:param script_name: path to the job script to be submitted
+		:param prior_job: QueuedJob or job id string that this job depends on
+		:param dependency: PBS dependency type (e.g. afterok, afterany)
+		:param qsub_options: list of additional qsub options
+		:return: the QueuedJob
+		"""
+		job = QueuedJob(script_name, prior_job, dependency, qsub_options)
+		self._pending.append(job)
+		module_logger.debug(debug_utils.get_name() + ": queued " + script_name)
+		return job
+
+	def discard(self, jobs):
+		"""Remove the specified jobs from the pending jobs, so they are not submitted."""
+		discarded = set(id(job) for job in jobs)
+		self._pending = [job for job in self._pending if id(job) not in discarded]
+
+	def _start(self):
+		if self._coprocess is None or self._coprocess.poll() is not None:
+			module_logger.debug(debug_utils.get_name() + ": starting " + self._shell)
+			self._coprocess = subprocess.Popen(
+				[self._shell], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+				universal_newlines=True, bufsize=1)
+
+	def close(self):
+		"""Shut down the coprocess used to talk to the scheduler."""
+		if self._coprocess is not None:
+			if self._coprocess.poll() is None:
+				self._coprocess.stdin.close()
+				self._coprocess.wait()
+			self._coprocess.stdout.close()
+			self._coprocess = None
+
+	def _build_submit_cmd(self, job):
+		cmd = [self._qsub_command]
+		if job.prior_job:
+			cmd += ['-W', 'depend=' + job.dependency + ':' + str(job.prior_job)]
+		if job.qsub_options:
+			cmd += job.qsub_options
+		cmd.append(job.script_name)
+		return ' '.join(shlex.quote(c) for c in cmd)
+
+	def _send(self, index, job):
+		job._submit_cmd = self._build_submit_cmd(job)
+		module_logger.debug(debug_utils.get_name() + ": " + job.submit_cmd)
+
+		line = 'J=$(' + job.submit_cmd + '); ' + self._RESULT_FORMAT + str(index) + ' $? "$J"\n'
+		self._coprocess.stdin.write(line)
+		self._coprocess.stdin.flush()
+
+		result = self._coprocess.stdout.readline()
+		if not result:
+			raise RuntimeError("Lost connection to job submission shell while submitting: " + job.script_name)
+
+		(result_index, returncode, job_no) = (result.rstrip('\n').split(' ', 2) + [''])[:3]
+		if int(result_index) != index:
+			raise RuntimeError("Job submission shell returned out of order result: " + result)
+
+		job._returncode = int(returncode)
+		if job._returncode == 0 and job_no:
+			job._job_no = job_no.strip()
+		elif job._returncode == 0:
+			# qsub succeeded but did not tell us a job id, treat as a failure
+			job._returncode = 1
+
+	def submit(self, check=True):
+		"""
+		Submit all pending jobs in the order in which they were queued.
+
+		Jobs whose prior job failed to submit are not submitted.
+
+		:param check: if True, raise subprocess.CalledProcessError for the first
+					  job that could not be submitted, after all other pending
+					  jobs have been handled
+		:return: list of the jobs handled by this call
+		"""
+		module_logger.debug(debug_utils.get_name() + ": " + str(len(self._pending)) + " pending jobs")
+
+		jobs = self._pending
+		self._pending = []
+
+		if jobs:
+			self._start()
+
+		first_failure = None
+		for index, job in enumerate(jobs):
+			if isinstance(job.prior_job, QueuedJob) and not job.prior_job.submitted:
+				module_logger.error("Not submitting " + job.script_name + " because its prior job was not submitted")
+				job._returncode = -1
+			else:
+				self._send(index, job)
+
+			if job.failed:
+				module_logger.error("Failed to submit: " + job.script_name)
+				if first_failure is None:
+					first_failure = job
+			else:
+				self._submitted.append(job)
+
+		if check and first_failure is not None:
+			raise subprocess.CalledProcessError(
+				first_failure.returncode,
+				first_failure.submit_cmd if first_failure.submit_cmd else first_failure.script_name)
+
+		return jobs
+
+
+class JobArraySubmissionEngine(SubmissionEngine):
+	"""
+	A SubmissionEngine that submits many parallel job chains (e.g. one chain per scan)
+	as PBS job arrays instead of as individual jobs.
+
+	Queued jobs are grouped by their position in their chain and by the resources
+	(#PBS directives) their job scripts request, so jobs that need different walltime
+	or memory limits are never put in the same array. Each group is submitted as one
+	job array running a generated wrapper script that uses $PBS_ARRAY_INDEX to pick
+	the member job script to run.
+
+	An array whose members are all for one session is named
+	<subject>_<classifier>[_<scan>].<PIPELINE_NAME>.JOB_ARRAY_<n>, so it is found by
+	the run status checkers like the individual jobs would be. An array spanning
+	sessions is named JOB_ARRAY.<PIPELINE_NAME>.<n> (see ccf/queue_snapshot.py).
+
+	Each array depends (afterany) on the arrays holding its members' prior jobs. The
+	per-index afterok dependencies are enforced by the wrapper: a member whose prior job
+	did not leave a success marker is not run and its array index exits with an error.
+	"""
+
+	_SKIPPED_DIRECTIVE_OPTIONS = ('-o', '-e', '-S', '-J')
+
+	def __init__(self, array_script_dir, qsub_command='qsub', shell='/bin/bash'):
+		super().__init__(qsub_command, shell)
+		self._array_script_dir = array_script_dir
+
+	@property
+	def array_script_dir(self):
+		"""Directory in which the job array wrapper scripts and success markers are written."""
+		return self._array_script_dir
+
+	def _group_jobs(self, jobs):
+		depths = {}
+		groups = {}
+		for job in jobs:
+			prior = job.prior_job
+			depth = depths[id(prior)] + 1 if isinstance(prior, QueuedJob) and id(prior) in depths else 0
+			depths[id(job)] = depth
+			directives, _ = self._read_directives(job.script_name)
+			groups.setdefault((depth, job.dependency, tuple(directives)), []).append(job)
+
+		return [groups[key] for key in sorted(groups, key=lambda key: key[0])]
+
+	def _wrapper_script_name(self, group_no, members):
+		reversed_names = [os.path.basename(job.script_name)[::-1] for job in members]
+		common_suffix = os.path.commonprefix(reversed_names)[::-1]
+		if '.' in common_suffix:
+			common_suffix = common_suffix[common_suffix.index('.'):]
+		else:
+			common_suffix = '_job.sh'
+		return self.array_script_dir + os.sep + 'JOB_ARRAY_' + str(group_no) + common_suffix
+
+	def _array_job_name(self, group_no, members):
+		"""
+		PBS job name for a job array: prefixed with the session of its members if they
+		are all for one session (at least <subject>_<classifier>), otherwise with
+		queue_snapshot.JOB_ARRAY_NAME
+		"""
+		def common_fields(names):
+			common = []
+			for fields in zip(*[name.split('_') for name in names]):
+				if len(set(fields)) != 1:
+					break
+				common.append(fields[0])
+			return common
+
+		name_parts = [os.path.basename(job.script_name).split('.') + [''] for job in members]
+		session_fields = common_fields([parts[0] for parts in name_parts])
+		pipeline = '_'.join(common_fields([parts[1] for parts in name_parts])) or 'UNKNOWN'
+
+		if len(session_fields) >= 2:
+			return '_'.join(session_fields) + '.' + pipeline + '.JOB_ARRAY_' + str(group_no)
+		return queue_snapshot.JOB_ARRAY_NAME + '.' + pipeline + '.' + str(group_no)
+
+	def _read_directives(self, script_name):
+		directives = []
+		output_dirs = {}
+		with open(script_name, 'r') as script:
+			for line in script:
+				if not line.startswith('#PBS'):
+					continue
+				fields = line.split()
+				if len(fields) > 2 and fields[1] in ('-o', '-e'):
+					output_dirs[fields[1]] = fields[2]
+				elif len(fields) > 1 and fields[1] not in self._SKIPPED_DIRECTIVE_OPTIONS:
+					directives.append(line.rstrip('\n'))
+		return directives, output_dirs
+
+	def _write_wrapper_script(self, wrapper_name, members, prior_markers, markers, dependency):
+		directives, _ = self._read_directives(members[0].script_name)
+
+		stdout_files = []
+		stderr_files = []
+		for job in members:
+			_, output_dirs = self._read_directives(job.script_name)
+			base_name = os.path.basename(job.script_name)
+			stdout_files.append(output_dirs.get('-o', self.array_script_dir) + os.sep + base_name + '.o${PBS_JOBID}')
+			stderr_files.append(output_dirs.get('-e', self.array_script_dir) + os.sep + base_name + '.e${PBS_JOBID}')
+
+		def bash_array(name, values, expand=False):
+			quote = (lambda value: '"' + value + '"') if expand else shlex.quote
+			return [name + '=('] + ['  ' + quote(value) for value in values] + [')']
+
+		lines = ['#PBS -S /bin/bash']
+		lines += directives
+		lines.append('#PBS -o ' + self.array_script_dir)
+		lines.append('#PBS -e ' + self.array_script_dir)
+		lines.append('')
+		lines.append('INDEX=${PBS_ARRAY_INDEX:-0}')
+		lines.append('')
+		lines += bash_array('SCRIPTS', [job.script_name for job in members])
+		lines += bash_array('PRIOR_MARKERS', prior_markers)
+		lines += bash_array('MARKERS', markers)
+		lines += bash_array('STDOUT_FILES', stdout_files, expand=True)
+		lines += bash_array('STDERR_FILES', stderr_files, expand=True)
+		lines.append('')
+		if dependency == 'afterok':
+			lines.append('if [ -n "${PRIOR_MARKERS[$INDEX]}" ] && [ ! -e "${PRIOR_MARKERS[$INDEX]}" ]; then')
+			lines.append('  echo "Prior job for ${SCRIPTS[$INDEX]} did not complete successfully. Not running it."')
+			lines.append('  exit 1')
+			lines.append('fi')
+			lines.append('')
+		lines.append('/bin/bash "${SCRIPTS[$INDEX]}" > "${STDOUT_FILES[$INDEX]}" 2> "${STDERR_FILES[$INDEX]}"')
+		lines.append('exit_status=$?')
+		lines.append('if [ ${exit_status} -eq 0 ]; then')
+		lines.append('  touch "${MARKERS[$INDEX]}"')
+		lines.append('fi')
+		lines.append('exit ${exit_status}')
+
+		with contextlib.suppress(FileNotFoundError):
+			os.remove(wrapper_name)
+
+		with open(wrapper_name, 'w') as wrapper:
+			for line in lines:
+				wrapper.write(line + os.linesep)
+		os.chmod(wrapper_name, stat.S_IRWXU | stat.S_IRWXG)
+
+	def submit(self, check=True):
+		"""
+		Submit all pending jobs as job arrays, one array per position in the job chains.
+
+		:param check: if True, raise subprocess.CalledProcessError for the first
+					  array that could not be submitted, after all other arrays
+					  have been handled
+		:return: list of the jobs handled by this call
+		"""
+		module_logger.debug(debug_utils.get_name() + ": " + str(len(self._pending)) + " pending jobs")
+
+		jobs = self._pending
+		self._pending = []
+
+		if jobs:
+			os.makedirs(self.array_script_dir, exist_ok=True)
+			self._start()
+
+		markers = {}
+		arrays = {}
+		first_failure = None
+
+		for group_no, members in enumerate(self._group_jobs(jobs)):
+			wrapper_name = self._wrapper_script_name(group_no, members)
+			dependency = members[0].dependency
+
+			prior_markers = []
+			prior_arrays = []
+			external_priors = []
+			for index, job in enumerate(members):
+				markers[id(job)] = wrapper_name + '.' + str(index) + '.ok'
+				prior = job.prior_job
+				if isinstance(prior, QueuedJob) and id(prior) in markers:
+					prior_markers.append(markers[id(prior)])
+					if arrays[id(prior)] not in prior_arrays:
+						prior_arrays.append(arrays[id(prior)])
+				else:
+					prior_markers.append('')
+					if str(prior or '') and str(prior) not in external_priors:
+						external_priors.append(str(prior))
+
+			self._write_wrapper_script(
+				wrapper_name, members, prior_markers, [markers[id(job)] for job in members], dependency)
+
+			qsub_options = ['-N', self._array_job_name(group_no, members)]
+			if len(members) > 1:
+				qsub_options += ['-J', '0-' + str(len(members) - 1)]
+
+			depends = []
+			if any(not array.submitted for array in prior_arrays):
+				array_job = QueuedJob(wrapper_name)
+				array_job._returncode = -1
+				module_logger.error("Not submitting " + wrapper_name + " because a prior job array was not submitted")
+			else:
+				if prior_arrays:
+					depends.append('afterany:' + ':'.join(str(array) for array in prior_arrays))
+				if external_priors:
+					depends.append(dependency + ':' + ':'.join(external_priors))
+				if depends:
+					qsub_options += ['-W', 'depend=' + ','.join(depends)]
+
+				array_job = QueuedJob(wrapper_name, qsub_options=qsub_options)
+				self._send(group_no, array_job)
+
+			for index, job in enumerate(members):
+				arrays[id(job)] = array_job
+				job._submit_cmd = array_job.submit_cmd
+				job._returncode = array_job.returncode
+				if array_job.submitted:
+					if len(members) > 1:
+						job._job_no = array_job.job_no.replace('[]', '[' + str(index) + ']', 1)
+					else:
+						job._job_no = array_job.job_no
+
+			if array_job.failed:
+				module_logger.error("Failed to submit job array: " + wrapper_name)
+				if first_failure is None:
+					first_failure = array_job
+			else:
+				self._submitted.extend(members)
+
+		if check and first_failure is not None:
+			raise subprocess.CalledProcessError(
+				first_failure.returncode,
+				first_failure.submit_cmd if first_failure.submit_cmd else first_failure.script_name)
+
+		return jobs
@@ -2,16 +2,19 @@
 
 # import of built-in modules
 import datetime
+import functools
 import logging
 import os
 
 # import of third-party modules
 
 # import of local modules
+import ccf.batch_check_runner as batch_check_runner
 import ccf.archive as ccf_archive
 import ccf.msmall_processing.one_subject_completion_checker as one_subject_completion_checker
 import ccf.msmall_processing.one_subject_prereq_checker as one_subject_prereq_checker
 import ccf.msmall_processing.one_subject_run_status_checker as one_subject_run_status_checker
+import ccf.status_store as ccf_status_store
 import ccf.subject as ccf_subject
 import utils.file_utils as file_utils
 import utils.my_argparse as my_argparse
@@ -54,6 +57,58 @@ def _write_subject_info(output_file, project, subject_id, classifier, prereqs_me
     output_file.write(subject_line + os.linesep)
     
 
+def _check_status(archive, completion_checker, prereq_checker, bypass_mark, verbose, subject):
+    prereqs_met = prereq_checker.are_prereqs_met(archive, subject)
+    
+    if completion_checker.does_processed_resource_exist(archive, subject):
+        resource_exists = True
+
+        fullpath = archive.msm_all_dir_full_path(subject)
+        resource = archive.msm_all_dir_name(subject)
+        
+        resource_mtime = os.path.getmtime(fullpath)
+        
+        if bypass_mark:
+            files_exist = completion_checker.is_processing_complete(archive, subject,
+                                                                    verbose=verbose)
+        else:
+            files_exist = completion_checker.is_processing_marked_complete(archive, subject)
+
+    else:
+        resource = DNM
+        resource_exists = False
+        resource_mtime = None
+        files_exist = False
+
+    return (prereqs_met, resource, resource_exists, resource_mtime, files_exist)
+
+
+def _check_subject(archive, completion_checker, prereq_checker, status_store, bypass_mark, verbose,
+                   subject, queued_or_running):
+    project = subject.project
+    subject_id = subject.subject_id
+    classifier = subject.classifier
+    scan = subject.extra
+
+    # the checks are only redone if the resources they depend on have changed since they were last done
+    record = status_store.get_or_check(
+        ccf_status_store.status_key(subject, completion_checker.processing_name),
+        completion_checker.status_dependency_paths(archive, subject),
+        ccf_status_store.completion_check_mode(bypass_mark),
+        functools.partial(_check_status, archive, completion_checker, prereq_checker,
+                          bypass_mark, verbose, subject),
+        queued_or_running)
+
+    if record.resource_mtime is None:
+        resource_date = NA
+    else:
+        resource_date = datetime.datetime.fromtimestamp(record.resource_mtime).strftime(DATE_FORMAT)
+
+    return (project, subject_id, classifier, record.prereqs_met,
+            record.resource, record.resource_exists, resource_date,
+            record.complete, queued_or_running)
+
+
 if __name__ == "__main__":
 
     parser = my_argparse.MyArgumentParser(
@@ -66,6 +121,8 @@ if __name__ == "__main__":
                         required=False, default=False)
     parser.add_argument('-v', '--verbose', dest='verbose', action='store_true',
                         required=False, default=False)
+    batch_check_runner.add_arguments(parser)
+    ccf_status_store.add_arguments(parser)
 
     # parse the command line arguments
     args = parser.parse_args()
@@ -96,38 +153,17 @@ if __name__ == "__main__":
     completion_checker = one_subject_completion_checker.OneSubjectCompletionChecker()
     prereq_checker = one_subject_prereq_checker.OneSubjectPrereqChecker()
     running_checker = one_subject_run_status_checker.OneSubjectRunStatusChecker()
+
+    # open the store of previously determined statuses
+    status_store = ccf_status_store.StatusStore(args.status_db, args.recheck)
     
-    for subject in subject_list:
-        project = subject.project
-        subject_id = subject.subject_id
-        classifier = subject.classifier
-        scan = subject.extra
-
-        prereqs_met = prereq_checker.are_prereqs_met(archive, subject)
-        queued_or_running = running_checker.get_queued_or_running(subject)
-        
-        if completion_checker.does_processed_resource_exist(archive, subject):
-            resource_exists = True
-
-            fullpath = archive.msm_all_dir_full_path(subject)
-            resource = archive.msm_all_dir_name(subject)
-            
-            timestamp = os.path.getmtime(fullpath)
-            resource_date = datetime.datetime.fromtimestamp(timestamp).strftime(DATE_FORMAT)
-            
-            if args.bypass_mark:
-                files_exist = completion_checker.is_processing_complete(archive, subject,
-                                                                        verbose=args.verbose)
-            else:
-                files_exist = completion_checker.is_processing_marked_complete(archive, subject)
+    # check the running markers for the whole list at once
+    queued_or_running_list = running_checker.get_queued_or_running_list(subject_list)
 
-        else:
-            resource = DNM
-            resource_exists = False
-            resource_date = NA
-            files_exist = False
-            
-        _write_subject_info(output_file, project, subject_id, classifier, prereqs_met,
-                            resource, resource_exists, resource_date,
-                            files_exist, queued_or_running)
-            
+    # check the subjects (in parallel if requested), writing the results in subject list order
+    check_subject = functools.partial(_check_subject, archive, completion_checker, prereq_checker,
+                                      status_store, args.bypass_mark, args.verbose)
+    runner = batch_check_runner.BatchCheckRunner(args.jobs, args.use_processes)
+
+    for subject_info in runner.run(check_subject, zip(subject_list, queued_or_running_list)):
+        _write_subject_info(output_file, *subject_info)
@@ -3,14 +3,13 @@
 # import of built-in modules
 import logging
 import logging.config
-import os
-import random
 import sys
 
 # import of third-party modules
 
 # import of local modules
 import ccf.archive as ccf_archive
+import ccf.running_status_index as ccf_running_status_index
 import ccf.batch_submitter as batch_submitter
 import ccf.multirunicafix_processing.one_subject_job_submitter as one_subject_job_submitter
 import ccf.multirunicafix_processing.one_subject_run_status_checker as one_subject_run_status_checker
@@ -33,73 +32,77 @@ class BatchSubmitter(batch_submitter.BatchSubmitter):
 
 	def submit_jobs(self, username, password, subject_list, config):
 
-		# submit jobs for the listed subjects
-		for subject in subject_list:
+		queued_job_lists = []
+		running_status_index = ccf_running_status_index.RunningStatusIndex()
+
+		try:
+			# submit jobs for the listed subjects
+			for subject in subject_list:
 			
-			run_status_checker = one_subject_run_status_checker.OneSubjectRunStatusChecker()
-			if run_status_checker.get_queued_or_running(subject):
-				print("-----")
-				print("\t NOT SUBMITTING JOBS FOR")
-				print("\t			project:", subject.project)
-				print("\t			subject:", subject.subject_id)
-				print("\t		 classifier:", subject.classifier)
-				print("\t JOBS ARE ALREADY QUEUED OR RUNNING")
-				continue
+				run_status_checker = one_subject_run_status_checker.OneSubjectRunStatusChecker()
+				if run_status_checker.get_queued_or_running(subject, running_status_index):
+					print("-----")
+					print("\t NOT SUBMITTING JOBS FOR")
+					print("\t			project:", subject.project)
+					print("\t			subject:", subject.subject_id)
+					print("\t		 classifier:", subject.classifier)
+					print("\t JOBS ARE ALREADY QUEUED OR RUNNING")
+					continue
 			
-			submitter = one_subject_job_submitter.OneSubjectJobSubmitter(
-				self._archive, self._archive.build_home)
+				submitter = one_subject_job_submitter.OneSubjectJobSubmitter(
+					self._archive, self._archive.build_home)
 			
-			put_server_name = os.environ.get("XNAT_PBS_JOBS_PUT_SERVER_LIST").split(" ")
-			put_server = random.choice(put_server_name)
+				put_server = self.put_server_scheduler.assign()
 			
-			# get information for the subject from the configuration
-			clean_output_first = config.get_bool_value(subject.subject_id, 'CleanOutputFirst')
-			processing_stage_str = config.get_value(subject.subject_id, 'ProcessingStage')
-			processing_stage = submitter.processing_stage_from_string(processing_stage_str)
-			walltime_limit_hrs = config.get_value(subject.subject_id, 'WalltimeLimitHours')
-			## Using mem option instead of vmem for icafix
-			#vmem_limit_gbs = config.get_value(subject.subject_id, 'VmemLimitGbs')
-			mem_limit_gbs = config.get_value(subject.subject_id, 'MemLimitGbs')
-			output_resource_suffix = config.get_value(subject.subject_id, 'OutputResourceSuffix')
-
-			print("-----")
-			print("\tSubmitting", submitter.PIPELINE_NAME, "jobs for:")
-			print("\t			   project:", subject.project)
-			print("\t			   subject:", subject.subject_id)
-			print("\t	session classifier:", subject.classifier)
-			print("\t			put_server:", put_server)
-			print("\t	  processing_stage:", processing_stage)
-			print("\t	walltime_limit_hrs:", walltime_limit_hrs)
-			#print("\t		vmem_limit_gbs:", vmem_limit_gbs)
-			print("\t		mem_limit_gbs:", mem_limit_gbs)
-			print("\toutput_resource_suffix:", output_resource_suffix)
+				# get information for the subject from the configuration
+				clean_output_first = config.get_bool_value(subject.subject_id, 'CleanOutputFirst')
+				processing_stage_str = config.get_value(subject.subject_id, 'ProcessingStage')
+				processing_stage = submitter.processing_stage_from_string(processing_stage_str)
+				walltime_limit_hrs = config.get_value(subject.subject_id, 'WalltimeLimitHours')
+				## Using mem option instead of vmem for icafix
+				#vmem_limit_gbs = config.get_value(subject.subject_id, 'VmemLimitGbs')
+				mem_limit_gbs = config.get_value(subject.subject_id, 'MemLimitGbs')
+				output_resource_suffix = config.get_value(subject.subject_id, 'OutputResourceSuffix')
+
+				print("-----")
+				print("\tSubmitting", submitter.PIPELINE_NAME, "jobs for:")
+				print("\t			   project:", subject.project)
+				print("\t			   subject:", subject.subject_id)
+				print("\t	session classifier:", subject.classifier)
+				print("\t			put_server:", put_server)
+				print("\t	  processing_stage:", processing_stage)
+				print("\t	walltime_limit_hrs:", walltime_limit_hrs)
+				#print("\t		vmem_limit_gbs:", vmem_limit_gbs)
+				print("\t		mem_limit_gbs:", mem_limit_gbs)
+				print("\toutput_resource_suffix:", output_resource_suffix)
 			
-			# user and server information
-			submitter.username = username
-			submitter.password = password
-			submitter.server = 'https://' + os_utils.getenv_required('XNAT_PBS_JOBS_XNAT_SERVER')
-
-			# subject and project information
-			submitter.project = subject.project
-			submitter.subject = subject.subject_id
-			submitter.session = subject.subject_id + '_' + subject.classifier
-			submitter.classifier = subject.classifier
+				# user and server information
+				submitter.username = username
+				submitter.password = password
+				submitter.server = 'https://' + os_utils.getenv_required('XNAT_PBS_JOBS_XNAT_SERVER')
+
+				# subject and project information
+				submitter.project = subject.project
+				submitter.subject = subject.subject_id
+				submitter.session = subject.subject_id + '_' + subject.classifier
+				submitter.classifier = subject.classifier
 			
-			# job parameters
-			submitter.clean_output_resource_first = clean_output_first
-			submitter.put_server = put_server
-			submitter.walltime_limit_hours = walltime_limit_hrs
-			#submitter.vmem_limit_gbs = vmem_limit_gbs
-			submitter.mem_limit_gbs = mem_limit_gbs
-			submitter.output_resource_suffix = output_resource_suffix
-
-			# submit jobs
-			submitted_job_list = submitter.submit_jobs(processing_stage)
-
-			for job in submitted_job_list:
-				print("\tsubmitted jobs:", job)
-
-			print("-----")
+				# job parameters
+				submitter.clean_output_resource_first = clean_output_first
+				submitter.put_server = put_server
+				submitter.put_server_list = self.put_server_scheduler.fallback_servers(put_server)
+				submitter.walltime_limit_hours = walltime_limit_hrs
+				#submitter.vmem_limit_gbs = vmem_limit_gbs
+				submitter.mem_limit_gbs = mem_limit_gbs
+				submitter.output_resource_suffix = output_resource_suffix
+
+				# queue jobs, they are submitted for the whole batch at once below
+				submitted_job_list = self.queue_jobs(submitter, processing_stage)
+				queued_job_lists.append((subject, submitted_job_list))
+				running_status_index.invalidate(self._archive.running_status_dir_full_path(subject))
+		finally:
+			# submit what was queued even if queuing the jobs for a later subject failed
+			self.submit_queued_jobs(queued_job_lists)
 
 def do_submissions(userid, password, subject_list):
 
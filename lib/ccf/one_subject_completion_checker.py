@@ -40,21 +40,24 @@ class OneSubjectCompletionChecker(abc.ABC):
 		hcp_run_utils = os_utils.getenv_required('HCP_RUN_UTILS')
 		if os.path.isfile(hcp_run_utils + os.sep + self.processing_name + os.sep
 				 + self.expected_output_files_template_filename(fieldmap)):
-			f = open(hcp_run_utils + os.sep + self.processing_name + os.sep
-					 + self.expected_output_files_template_filename(fieldmap))
+			template_file_name = (hcp_run_utils + os.sep + self.processing_name + os.sep
+								  + self.expected_output_files_template_filename(fieldmap))
 		else:
 			xnat_pbs_jobs = os_utils.getenv_required('XNAT_PBS_JOBS')
-			f = open(xnat_pbs_jobs + os.sep + self.processing_name + os.sep
-					 + self.expected_output_files_template_filename(fieldmap))
-			
+			template_file_name = (xnat_pbs_jobs + os.sep + self.processing_name + os.sep
+								  + self.expected_output_files_template_filename(fieldmap))
+
+		# the template file is only read and parsed once per process (unless it changes)
 		root_dir = os.sep.join([working_dir, subject_info.subject_id + '_' + subject_info.classifier])
-		l = file_utils.build_filename_list_from_file(f, root_dir,
-													 subjectid=subject_info.subject_id + '_' + subject_info.classifier,
-													 scan=subject_info.extra)
+		l = file_utils.build_filename_list_from_template_file(template_file_name, root_dir,
+															  subjectid=subject_info.subject_id + '_' + subject_info.classifier,
+															  scan=subject_info.extra)
 		return l
 	
-	def do_all_files_exist(self, file_name_list, verbose=False, output=sys.stdout, short_circuit=True):
-		return file_utils.do_all_files_exist(file_name_list, verbose, output, short_circuit)
+	def do_all_files_exist(self, file_name_list, verbose=False, output=sys.stdout, short_circuit=True,
+						   deep_verify=None):
+		return file_utils.do_all_files_exist(file_name_list, verbose, output, short_circuit,
+											 deep_verify=deep_verify)
 	
 	def is_processing_complete(self, working_dir, fieldmap, subject_info,
 							   verbose=False, output=sys.stdout, short_circuit=True):
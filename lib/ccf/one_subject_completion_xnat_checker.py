@@ -47,13 +47,8 @@ class OneSubjectCompletionXnatChecker(one_subject_completion_checker.OneSubjectC
 
 		return latest_time_stamp
 
-	def is_processing_marked_complete(self, archive, subject_info):
-
-		# If the processed resource does not exist, then the process is certainly not marked
-		# as complete. The file that marks completeness would be in that resource.
-		if not self.does_processed_resource_exist(archive, subject_info):
-			return False
-
+	def marker_file_full_paths(self, archive, subject_info):
+		"""Full paths to the completion marker file and the starttime marker file"""
 		resource_path = self.my_resource(archive,subject_info) + os.sep + subject_info.subject_id + '_' + subject_info.classifier + os.sep +'ProcessingInfo'
 		
 		subject_pipeline_name = subject_info.subject_id + '_' + subject_info.classifier
@@ -66,6 +61,27 @@ class OneSubjectCompletionXnatChecker(one_subject_completion_checker.OneSubjectC
 		
 		completion_marker_file_path = resource_path + os.sep + subject_pipeline_name_check + '.XNAT_CHECK.success'
 		starttime_marker_file_path = resource_path + os.sep + subject_pipeline_name + '.starttime'
+
+		return (completion_marker_file_path, starttime_marker_file_path)
+
+	def status_dependency_paths(self, archive, subject_info):
+		"""
+		Paths whose modification times determine whether a previously determined
+		prerequisite and completion status is still valid
+		"""
+		paths = [archive.subject_resources_dir_full_path(subject_info),
+				 self.my_resource(archive, subject_info)]
+		paths.extend(self.marker_file_full_paths(archive, subject_info))
+		return paths
+
+	def is_processing_marked_complete(self, archive, subject_info):
+
+		# If the processed resource does not exist, then the process is certainly not marked
+		# as complete. The file that marks completeness would be in that resource.
+		if not self.does_processed_resource_exist(archive, subject_info):
+			return False
+
+		(completion_marker_file_path, starttime_marker_file_path) = self.marker_file_full_paths(archive, subject_info)
 		
 		# If the completion marker file does not exist, the the processing is certainly not marked
 		# as complete.
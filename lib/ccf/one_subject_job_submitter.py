@@ -13,11 +13,11 @@ import os
 import shutil
 import stat
 import subprocess
-import time
 
 # import of third-party modules
 
 # import of local modules
+import ccf.job_submission_engine as job_submission_engine
 import ccf.processing_stage as ccf_processing_stage
 import utils.debug_utils as debug_utils
 import utils.delete_resource as delete_resource
@@ -55,6 +55,18 @@ class OneSubjectJobSubmitter(abc.ABC):
 		self._scan = None
 		self._working_directory_name_prefix = None
 
+		self._submission_engine = None
+		self._owns_submission_engine = False
+		self._queued_jobs = []
+		self._running_status_marked = False
+		self._no_longer_running_job = None
+
+		# number of parallel HTTP streams used by the PUT_DATA job, 0 to put the data by reference
+		self._put_data_streams = int(os.getenv('XNAT_PBS_JOBS_PUT_DATA_STREAMS', 0))
+
+		# shadow servers for the PUT_DATA job to fall back to, in order
+		self._put_server_list = None
+
 	def processing_stage_from_string(self, str_value):
 		return ccf_processing_stage.ProcessingStage.from_string(str_value)
 
@@ -196,6 +208,28 @@ class OneSubjectJobSubmitter(abc.ABC):
 		self._put_server = value
 		module_logger.debug(debug_utils.get_name() + ": set to " + str(self._put_server))
 
+	@property
+	def put_server_list(self):
+		"""
+		Shadow servers for the put to fall back to, in order, if the put server is
+		down when the put job runs (None to use XNAT_PBS_JOBS_PUT_SERVER_LIST as is)
+		"""
+		return self._put_server_list
+
+	@put_server_list.setter
+	def put_server_list(self, value):
+		self._put_server_list = value
+		module_logger.debug(debug_utils.get_name() + ": set to " + str(self._put_server_list))
+
+	@property
+	def put_data_streams(self):
+		return self._put_data_streams
+
+	@put_data_streams.setter
+	def put_data_streams(self, value):
+		self._put_data_streams = value
+		module_logger.debug(debug_utils.get_name() + ": set to " + str(self._put_data_streams))
+
 	@property
 	def walltime_limit_hours(self):
 		return self._walltime_limit_hours
@@ -242,14 +276,13 @@ class OneSubjectJobSubmitter(abc.ABC):
 	
 	@property
 	def working_directory_name_prefix(self):
-		# Since the working directory name prefix contains a timestamp, it is
-		# important to only build the working directory name prefix one time.
+		# Since the working directory name prefix contains a unique timestamp,
+		# it is important to only build the working directory name prefix one time.
 		# The first time it is requested, self._working_directory_name_prefix
 		# will have a value of None. In that case, build the name, store
 		# it and return it. For any subsequent requests, simply return
 		# the previously built name.
 		if self._working_directory_name_prefix is None:
-			current_seconds_since_epoch = int(time.time())
 			wdir = self.build_home
 			wdir += os.sep + self.project
 			wdir += os.sep + self.PIPELINE_NAME
@@ -257,7 +290,7 @@ class OneSubjectJobSubmitter(abc.ABC):
 			wdir += '_' + self.classifier
 			if self.scan:
 				wdir += '_' + self.scan
-			wdir += '.' + str(current_seconds_since_epoch)
+			wdir += '.' + os_utils.unique_time_stamp()
 			self._working_directory_name_prefix = wdir
 
 		return self._working_directory_name_prefix
@@ -408,11 +441,18 @@ class OneSubjectJobSubmitter(abc.ABC):
 		script.write(os.linesep)
 		script.write('source ' + self._get_xnat_pbs_setup_script_path() + ' ' + self._get_db_name() + os.linesep)
 		script.write('module load ' + self._get_xnat_pbs_setup_script_singularity_version() + os.linesep)
+		if self.put_server_list:
+			# fall back to the other servers in the order the put was scheduled with
+			script.write('export XNAT_PBS_JOBS_PUT_SERVER_LIST="' + ' '.join(self.put_server_list) + '"' + os.linesep)
 		script.write(os.linesep)
 		script.write('mv ' + self.working_directory_name + os.path.sep + '*' + self.PIPELINE_NAME + '* ' + self.working_directory_name + os.path.sep + self.subject + '_' + self.classifier + os.path.sep + 'ProcessingInfo' + os.linesep)
 		script.write(os.linesep)
 		script.write('singularity exec -B ' + self._get_xnat_pbs_setup_script_archive_root() + ',' + self._get_xnat_pbs_setup_script_singularity_bind_path() + ' ' + self._get_xnat_pbs_setup_script_singularity_container_xnat_path() + ' ' + self.xnat_pbs_jobs_home + os.sep + 'WorkingDirPut' + os.sep + 'XNAT_working_dir_put.sh \\' + os.linesep)
 		script.write('  --leave-subject-id-level \\' + os.linesep)
+		if self.put_data_streams > 0:
+			# upload the working directory in parallel HTTP streams instead of by reference
+			script.write('  --use-http \\' + os.linesep)
+			script.write('  --parallel-streams=' + str(self.put_data_streams) + ' \\' + os.linesep)
 		script.write('  --user="' + self.username + '" \\' + os.linesep)
 		script.write('  --password="' + self.password + '" \\' + os.linesep)
 		script.write('  --server="' + str_utils.get_server_name(self.put_server) + '" \\' + os.linesep)
@@ -625,19 +665,40 @@ class OneSubjectJobSubmitter(abc.ABC):
 		script.close()
 		os.chmod(script_name, stat.S_IRWXU | stat.S_IRWXG)
 			
+	@property
+	def submission_engine(self):
+		"""
+		The engine through which this submitter's jobs are submitted.
+
+		If no engine has been set (e.g. by a batch submitter that shares one engine
+		among all the subjects in a batch), this submitter creates and owns its own.
+		"""
+		if self._submission_engine is None:
+			self._submission_engine = job_submission_engine.SubmissionEngine()
+			self._owns_submission_engine = True
+		return self._submission_engine
+
+	@submission_engine.setter
+	def submission_engine(self, value):
+		self._submission_engine = value
+		self._owns_submission_engine = False
+
+	def queue_job(self, script_name, prior_job=None, dependency='afterok'):
+		"""
+		Queue a job script with the submission engine.
+
+		Returns the queued job and a list containing only that job, matching the
+		(last job, all jobs) return convention of the submit_*_jobs methods.
+		"""
+		job = self.submission_engine.queue(script_name, prior_job=prior_job, dependency=dependency)
+		self._queued_jobs.append(job)
+		return job, [job]
+
 	def submit_get_data_jobs(self, stage, prior_job=None):
 		module_logger.debug(debug_utils.get_name())
 
 		if stage >= ccf_processing_stage.ProcessingStage.GET_DATA:
-			if prior_job:
-				get_data_submit_cmd = 'qsub -W depend=afterok:' + prior_job + ' ' + self.get_data_job_script_name
-			else:
-				get_data_submit_cmd = 'qsub ' + self.get_data_job_script_name
-
-			completed_submit_process = subprocess.run(
-				get_data_submit_cmd, shell=True, check=True, stdout=subprocess.PIPE, universal_newlines=True)
-			get_data_job_no = str_utils.remove_ending_new_lines(completed_submit_process.stdout)
-			return get_data_job_no, [get_data_job_no]
+			return self.queue_job(self.get_data_job_script_name, prior_job)
 
 		else:
 			module_logger.info("Get data job not submitted")
@@ -647,15 +708,7 @@ class OneSubjectJobSubmitter(abc.ABC):
 		module_logger.debug(debug_utils.get_name())
 
 		if stage >= ccf_processing_stage.ProcessingStage.PROCESS_DATA:
-			if prior_job:
-				work_submit_cmd = 'qsub -W depend=afterok:' + prior_job + ' ' + self.process_data_job_script_name
-			else:
-				work_submit_cmd = 'qsub ' + self.process_data_job_script_name
-
-			completed_submit_process = subprocess.run(
-				work_submit_cmd, shell=True, check=True, stdout=subprocess.PIPE, universal_newlines=True)
-			work_job_no = str_utils.remove_ending_new_lines(completed_submit_process.stdout)
-			return work_job_no, [work_job_no]
+			return self.queue_job(self.process_data_job_script_name, prior_job)
 
 		else:
 			module_logger.info("Process data job not submitted")
@@ -665,15 +718,7 @@ class OneSubjectJobSubmitter(abc.ABC):
 		module_logger.debug(debug_utils.get_name())
 
 		if stage >= ccf_processing_stage.ProcessingStage.CLEAN_DATA:
-			if prior_job:
-				clean_submit_cmd = 'qsub -W depend=afterok:' + prior_job + ' ' + self.clean_data_script_name
-			else:
-				clean_submit_cmd = 'qsub ' + self.clean_data_script_name
-
-			completed_submit_process = subprocess.run(
-				clean_submit_cmd, shell=True, check=True, stdout=subprocess.PIPE, universal_newlines=True)
-			clean_job_no = str_utils.remove_ending_new_lines(completed_submit_process.stdout)
-			return clean_job_no, [clean_job_no]
+			return self.queue_job(self.clean_data_script_name, prior_job)
 
 		else:
 			module_logger.info("Clean data job not submitted")
@@ -683,15 +728,7 @@ class OneSubjectJobSubmitter(abc.ABC):
 		module_logger.debug(debug_utils.get_name())
 
 		if stage >= ccf_processing_stage.ProcessingStage.PUT_DATA:
-			if prior_job:
-				put_submit_cmd = 'qsub -W depend=afterok:' + prior_job + ' ' + self.put_data_script_name
-			else:
-				put_submit_cmd = 'qsub ' + self.put_data_script_name
-
-			completed_submit_process = subprocess.run(
-				put_submit_cmd, shell=True, check=True, stdout=subprocess.PIPE, universal_newlines=True)
-			put_job_no = str_utils.remove_ending_new_lines(completed_submit_process.stdout)
-			return put_job_no, [put_job_no]
+			return self.queue_job(self.put_data_script_name, prior_job)
 
 		else:
 			module_logger.info("Put data job not submitted")
@@ -701,15 +738,7 @@ class OneSubjectJobSubmitter(abc.ABC):
 		module_logger.debug(debug_utils.get_name())
 
 		if stage >= ccf_processing_stage.ProcessingStage.CHECK_DATA:
-			if prior_job:
-				check_submit_cmd = 'qsub -W depend=afterok:' + prior_job + ' ' + self.check_data_job_script_name
-			else:
-				check_submit_cmd = 'qsub ' + self.check_data_job_script_name
-
-			completed_submit_process = subprocess.run(
-				check_submit_cmd, shell=True, check=True, stdout=subprocess.PIPE, universal_newlines=True)
-			check_job_no = str_utils.remove_ending_new_lines(completed_submit_process.stdout)
-			return check_job_no, [check_job_no]
+			return self.queue_job(self.check_data_job_script_name, prior_job)
 
 		else:
 			module_logger.info("Check data job not submitted")
@@ -717,16 +746,7 @@ class OneSubjectJobSubmitter(abc.ABC):
 
 	def submit_no_longer_running_jobs(self, stage, prior_job=None):
 		module_logger.debug(debug_utils.get_name())
-
-		if prior_job:
-			cmd = 'qsub -W depend=afterany:' + prior_job + ' ' + self.mark_no_longer_running_script_name
-		else:
-			cmd = 'qsub ' + self.mark_no_longer_running_script_name
-
-		completed_submit_process = subprocess.run(
-			cmd, shell=True, check=True, stdout=subprocess.PIPE, universal_newlines=True)
-		job_no = str_utils.remove_ending_new_lines(completed_submit_process.stdout)
-		return job_no, [job_no]
+		return self.queue_job(self.mark_no_longer_running_script_name, prior_job, dependency='afterany')
 		
 	@abc.abstractmethod
 	def create_process_data_job_script(self):
@@ -755,6 +775,7 @@ class OneSubjectJobSubmitter(abc.ABC):
 		
 		# create running status marker file to indicate that jobs are queued
 		self.mark_running_status(stage=processing_stage)
+		self._running_status_marked = processing_stage > ccf_processing_stage.ProcessingStage.PREPARE_SCRIPTS
 			
 		# Submit job(s) to get the data
 		last_get_data_job_no, all_get_data_job_nos = self.submit_get_data_jobs(stage=processing_stage, prior_job=prior)
@@ -797,9 +818,52 @@ class OneSubjectJobSubmitter(abc.ABC):
 			submitted_jobs_list.append(('Complete Running Status', all_running_status_job_nos))
 		if last_running_status_job_no:
 			prior = last_running_status_job_no
-			
+		self._no_longer_running_job = last_running_status_job_no
+
+		# If this submitter is not sharing its engine with a batch, push the
+		# whole chain to the scheduler now. Otherwise the batch submitter
+		# submits the chains for all subjects at once.
+		if self._owns_submission_engine:
+			try:
+				self.submission_engine.submit()
+			finally:
+				self.submission_engine.close()
+				self.clear_stale_running_status()
+
 		return submitted_jobs_list
 
+	def discard_queued_jobs(self):
+		"""
+		Remove the jobs this submitter queued from the submission engine, e.g. when
+		queuing the rest of the chain failed, so that part of a chain is never submitted.
+		"""
+		self.submission_engine.discard(self._queued_jobs)
+		self._queued_jobs = []
+
+	def clear_stale_running_status(self):
+		"""
+		Mark the subject as no longer queued if the job at the end of its chain, which
+		would do that when the chain finishes, was not submitted (e.g. because the
+		submission failed or a qsub earlier in the chain failed). Otherwise the marker
+		created when the jobs were queued would be left behind.
+
+		Call after the jobs queued by do_job_submissions have been handed to the
+		submission engine, or discarded.
+		"""
+		marked = self._running_status_marked
+		job = self._no_longer_running_job
+		self._running_status_marked = False
+		self._no_longer_running_job = None
+		if not marked or (job is not None and job.submitted):
+			return
+
+		module_logger.warning("Jobs for " + self.subject + "_" + self.classifier +
+							  " were not all submitted, marking them as no longer queued")
+		try:
+			self.mark_running_status(stage=ccf_processing_stage.ProcessingStage.CHECK_DATA, running=False)
+		except subprocess.CalledProcessError as e:
+			module_logger.error("Unable to clear running status marker: " + str(e))
+
 	def submit_jobs(self, processing_stage=ccf_processing_stage.ProcessingStage.CHECK_DATA):
 		module_logger.debug(debug_utils.get_name() + ": processing_stage: " + str(processing_stage))
 
@@ -811,10 +875,6 @@ class OneSubjectJobSubmitter(abc.ABC):
 		module_logger.info("  Session: " + self.session)
 		module_logger.info("	Stage: " + str(processing_stage))
 
-		# make sure working directories do not have the same name based on
-		# the same start time by sleeping a few seconds
-		time.sleep(5)
-
 		# build the working directory name
 		os.makedirs(name=self.working_directory_name)
 		os.makedirs(name=self.check_data_directory_name)
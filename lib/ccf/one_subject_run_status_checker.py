@@ -15,6 +15,8 @@ import os
 # import of local modules
 import utils.os_utils as os_utils
 import ccf.archive as ccf_archive
+import ccf.queue_snapshot as queue_snapshot
+import ccf.running_status_index as ccf_running_status_index
 
 # authorship information
 __author__ = "Timothy B. Brown"
@@ -57,11 +59,14 @@ class OneSubjectRunStatusChecker(abc.ABC):
 	'R' if there are running jobs; and should return 'Q' if there are submitted
 	jobs that are not (yet) actually running.
 
-	This second method can be very tricky to implement (as it depends on the
-	underlying queuing system and perhaps on names of queued jobs) and,
-	importantly, can be very time consuming to run.  Thus it is acceptable for a
-	subclass of this abstract class to either not implement the get_run_status
-	method or implement it such that it returns some string such as 'IDONTKNOW'.
+	Running qstat for every subject is very time consuming, so the implementation
+	here answers from a QueueSnapshot that is shared by all run status checkers
+	and only runs qstat once per snapshot TTL. Jobs are matched by the owner (the
+	USER environment variable), the pipeline name, and the job name prefix from
+	_job_name_prefix. The name of a job array spanning several scans or subjects
+	does not identify them all, so a subject with no matching job that is marked
+	as running gets the status of the job arrays for its session or, failing
+	that, of the pipeline's job arrays spanning subjects.
 	"""
 
 	@property
@@ -84,15 +89,38 @@ class OneSubjectRunStatusChecker(abc.ABC):
 		#print("path: " + path)		
 		return path
 
-	def get_queued_or_running(self, subject_info):
+	def running_marker_dir_full_path(self, subject_info):
+		"""Full path to the directory containing the marker file for the specified subject."""
+		return os.path.dirname(self._path_to_running_marker_file(subject_info))
+
+	def get_queued_or_running(self, subject_info, running_status_index=None):
 		"""Whether the pipeline is marked as running for specified subject.
 
 		The result of this check is determined based upon whether the is a
 		"mark" indicating that the pipeline is running for the specified
 		subject. This is in contrast to checking based upon interaction with the
 		underlying queuing system.
+
+		If a RunningStatusIndex is specified, the check is answered from its
+		cached listing of the running status directory instead of checking
+		for the marker file itself.
 		"""
-		return os.path.exists(self._path_to_running_marker_file(subject_info))
+		path = self._path_to_running_marker_file(subject_info)
+		if running_status_index is None:
+			return os.path.exists(path)
+		return running_status_index.exists(path)
+
+	def get_queued_or_running_list(self, subject_info_list):
+		"""Whether the pipeline is marked as running for each of the specified subjects.
+
+		Each running status directory is listed only once for the whole list.
+		"""
+		index = ccf_running_status_index.RunningStatusIndex()
+		return [self.get_queued_or_running(subject_info, index) for subject_info in subject_info_list]
+
+	def _job_name_prefix(self, subject_info):
+		"""Leading part of the names of the jobs submitted for the specified subject."""
+		return subject_info.subject_id + '_' + subject_info.classifier
 
 	def get_run_status(self, subject_info):
 		"""Indication of job status for the specified subject.
@@ -109,5 +137,19 @@ class OneSubjectRunStatusChecker(abc.ABC):
 		If there is no job either running or queued, this method should return
 		None.
 		"""
-		raise NotImplementedError()
+		USER = os.getenv('USER')
+		if not USER:
+			raise RuntimeError("Environment variable USER must be set")
+
+		snapshot = queue_snapshot.get_shared_snapshot()
+		run_status = snapshot.get_run_status(USER, self.PIPELINE_NAME, self._job_name_prefix(subject_info))
+		if run_status is None and self.get_queued_or_running(subject_info):
+			# its jobs may be members of job arrays spanning several scans of the
+			# session or several subjects
+			for job_name_prefix in [subject_info.subject_id + '_' + subject_info.classifier,
+									queue_snapshot.JOB_ARRAY_NAME]:
+				run_status = snapshot.get_run_status(USER, self.PIPELINE_NAME, job_name_prefix)
+				if run_status is not None:
+					break
+		return run_status
 	
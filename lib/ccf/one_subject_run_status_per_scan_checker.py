@@ -36,4 +36,6 @@ class OneSubjectRunStatusPerScanChecker(one_subject_run_status_checker.OneSubjec
 		path = self.running_status_dir + os.sep + file_name
 		#print("path: " + path)
 		return path
-		
\ No newline at end of file
+
+	def _job_name_prefix(self, subject_info):
+		return subject_info.subject_id + '_' + subject_info.classifier + '_' + subject_info.extra
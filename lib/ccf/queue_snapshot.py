@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+"""
+ccf/queue_snapshot.py: A cached snapshot of the jobs known to the PBS queuing system.
+
+Rather than running qstat once (or more) for every subject whose run status is
+requested, a QueueSnapshot runs qstat once, indexes all the jobs it reports, and
+answers run status queries from that index until the snapshot is older than its
+time to live (TTL).
+"""
+
+# import of built-in modules
+import json
+import logging
+import os
+import subprocess
+import time
+
+# import of third-party modules
+
+# import of local modules
+import utils.debug_utils as debug_utils
+
+# authorship information
+__author__ = "Timothy B. Brown"
+__copyright__ = "Copyright 2020, The Connectome Coordination Facility (CCF)"
+__maintainer__ = "Junil Chang"
+
+# create a module logger
+module_logger = logging.getLogger(__name__)
+module_logger.setLevel(logging.WARNING)  # Note: This can be overidden by log file configuration
+
+DEFAULT_TTL_SECONDS = 60
+
+# job states reported by qstat that count as running, all other states except
+# completed/finished count as queued
+RUNNING_STATES = frozenset(['R', 'E', 'B'])
+FINISHED_STATES = frozenset(['C', 'F', 'X'])
+
+# session part of the names of job arrays whose members are for more than one
+# session (see ccf/job_submission_engine.py)
+JOB_ARRAY_NAME = 'JOB_ARRAY'
+
+
+class QueueSnapshot(object):
+	"""
+	Snapshot of the jobs in the PBS queue, indexed by job owner, job name and state.
+
+	Job names produced by the submitters in this package look like
+	<subject>_<classifier>[_<scan>].<PIPELINE_NAME>.<stage>_job.sh. Each job is
+	indexed under its owner, the pipeline name part of its job name, and every
+	'_' separated leading part of the session part of its job name. So a lookup for
+	a subject, a session, or a session and scan all take constant time.
+
+	Job arrays spanning several sessions are named JOB_ARRAY.<PIPELINE_NAME>.<n>,
+	so they are indexed under the JOB_ARRAY_NAME prefix for their pipeline.
+	"""
+
+	def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS, qstat_command='qstat'):
+		self._ttl_seconds = ttl_seconds
+		self._qstat_command = qstat_command
+		self._taken_at = None
+		self._jobs = {}
+		self._index = {}
+
+	@property
+	def ttl_seconds(self):
+		return self._ttl_seconds
+
+	@ttl_seconds.setter
+	def ttl_seconds(self, value):
+		self._ttl_seconds = value
+
+	@property
+	def jobs(self):
+		"""Dictionary of job id -> (job name, job owner, job state) for all jobs in the snapshot."""
+		self._refresh_if_stale()
+		return dict(self._jobs)
+
+	@property
+	def expired(self):
+		return self._taken_at is None or time.monotonic() - self._taken_at > self._ttl_seconds
+
+	def invalidate(self):
+		"""Force the next query to take a new snapshot."""
+		self._taken_at = None
+
+	def _read_json(self):
+		completed_process = subprocess.run(
+			[self._qstat_command, '-f', '-F', 'json'], check=True,
+			stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+		jobs = {}
+		for job_id, attributes in json.loads(completed_process.stdout).get('Jobs', {}).items():
+			jobs[job_id] = (attributes.get('Job_Name', ''),
+							attributes.get('Job_Owner', ''),
+							attributes.get('job_state', ''))
+		return jobs
+
+	def _read_full_text(self):
+		completed_process = subprocess.run(
+			[self._qstat_command, '-f'], check=True,
+			stdout=subprocess.PIPE, universal_newlines=True)
+		jobs = {}
+		job_id = None
+		attributes = {}
+		for line in completed_process.stdout.splitlines() + ['']:
+			if line.startswith('Job Id:') or not line.strip():
+				if job_id:
+					jobs[job_id] = (attributes.get('Job_Name', ''),
+									attributes.get('Job_Owner', ''),
+									attributes.get('job_state', ''))
+				job_id = line.split(':', 1)[1].strip() if line.startswith('Job Id:') else None
+				attributes = {}
+			elif ' = ' in line:
+				(key, value) = line.split(' = ', 1)
+				attributes[key.strip()] = value.strip()
+		return jobs
+
+	def refresh(self):
+		"""Take a new snapshot of the queue by running qstat once."""
+		module_logger.debug(debug_utils.get_name())
+
+		try:
+			jobs = self._read_json()
+		except (subprocess.CalledProcessError, ValueError):
+			# this qstat does not support (valid) JSON output, parse the full text output instead
+			jobs = self._read_full_text()
+
+		index = {}
+		for job_id, (job_name, job_owner, job_state) in jobs.items():
+			if job_state in FINISHED_STATES:
+				continue
+			owner = job_owner.split('@', 1)[0]
+			name_parts = job_name.split('.')
+			pipeline = name_parts[1] if len(name_parts) > 1 else ''
+			session_parts = name_parts[0].split('_')
+			for end in range(1, len(session_parts) + 1):
+				key = (owner, pipeline, '_'.join(session_parts[:end]))
+				index.setdefault(key, set()).add(job_state)
+
+		self._jobs = jobs
+		self._index = index
+		self._taken_at = time.monotonic()
+
+	def _refresh_if_stale(self):
+		if self.expired:
+			self.refresh()
+
+	def get_states(self, owner, pipeline_name, job_name_prefix):
+		"""
+		Set of states of the jobs owned by owner for the specified pipeline whose
+		job names start with the specified '_' separated prefix (e.g. <subject>,
+		<subject>_<classifier>, or <subject>_<classifier>_<scan>).
+		"""
+		self._refresh_if_stale()
+		return self._index.get((owner, pipeline_name, job_name_prefix), frozenset())
+
+	def get_run_status(self, owner, pipeline_name, job_name_prefix):
+		"""
+		'R' if any matching job is running, 'Q' if any matching job is queued but
+		none are running, and None if there are no matching jobs.
+		"""
+		states = self.get_states(owner, pipeline_name, job_name_prefix)
+		if states & RUNNING_STATES:
+			return 'R'
+		if states:
+			return 'Q'
+		return None
+
+
+_shared_snapshot = None
+
+
+def get_shared_snapshot():
+	"""
+	The QueueSnapshot shared by all run status checkers in this process.
+
+	The TTL of the shared snapshot can be set with the XNAT_PBS_JOBS_QSTAT_TTL
+	environment variable (seconds).
+	"""
+	global _shared_snapshot
+	if _shared_snapshot is None:
+		ttl_seconds = int(os.getenv('XNAT_PBS_JOBS_QSTAT_TTL', DEFAULT_TTL_SECONDS))
+		_shared_snapshot = QueueSnapshot(ttl_seconds)
+	return _shared_snapshot
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+"""
+ccf/running_status_index.py: An index of the 'running marker' files that exist
+in the running status directories of the sessions in the archive.
+
+Rather than calling os.path.exists on a marker file path for each subject (or
+scan) whose run status is requested, a RunningStatusIndex lists each running
+status directory once and answers all existence checks for marker files in
+that directory from the cached listing.
+"""
+
+# import of built-in modules
+import logging
+import os
+
+# import of third-party modules
+
+# import of local modules
+import utils.debug_utils as debug_utils
+
+# authorship information
+__author__ = "Timothy B. Brown"
+__copyright__ = "Copyright 2020, The Connectome Coordination Facility (CCF)"
+__maintainer__ = "Junil Chang"
+
+# create a module logger
+module_logger = logging.getLogger(__name__)
+module_logger.setLevel(logging.WARNING)  # Note: This can be overidden by log file configuration
+
+
+class RunningStatusIndex(object):
+	"""
+	Cache of the names of the marker files in each running status directory.
+
+	Each directory is listed (with os.scandir) the first time a marker file in
+	it is checked. The listing is kept until it is invalidated, so an index
+	should be used for one pass over a subject list (e.g. building a status
+	table or submitting a batch) and invalidated for any directory in which
+	markers are created or removed during that pass (or told about the markers
+	created, see add).
+	"""
+
+	def __init__(self):
+		self._marker_names = {}
+
+	def marker_names(self, running_status_dir):
+		"""Set of the names of the files in the specified running status directory."""
+		names = self._marker_names.get(running_status_dir)
+		if names is None:
+			module_logger.debug(debug_utils.get_name() + ": listing " + running_status_dir)
+			try:
+				with os.scandir(running_status_dir) as entries:
+					names = frozenset(entry.name for entry in entries)
+			except (FileNotFoundError, NotADirectoryError):
+				names = frozenset()
+			self._marker_names[running_status_dir] = names
+		return names
+
+	def exists(self, marker_file_path):
+		"""Whether the specified marker file exists (as of the cached directory listing)."""
+		(running_status_dir, marker_file_name) = os.path.split(marker_file_path)
+		return marker_file_name in self.marker_names(running_status_dir)
+
+	def add(self, marker_file_path):
+		"""
+		Record that the specified marker file has been created, without listing its
+		directory again (e.g. for a directory of markers shared by many subjects).
+		"""
+		(running_status_dir, marker_file_name) = os.path.split(marker_file_path)
+		names = self._marker_names.get(running_status_dir)
+		if names is not None:
+			self._marker_names[running_status_dir] = names | {marker_file_name}
+
+	def invalidate(self, running_status_dir=None):
+		"""
+		Discard the cached listing of the specified running status directory, or of
+		all directories if none is specified.
+		"""
+		if running_status_dir is None:
+			self._marker_names.clear()
+		else:
+			self._marker_names.pop(running_status_dir, None)
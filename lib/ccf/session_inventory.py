@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+"""
+ccf/session_inventory.py: A cached inventory of the resources in the RESOURCES
+directory of a session in the archive.
+
+Rather than running glob.glob over the same RESOURCES directory for every
+available_* query made by the archive classes (and the prereq checkers,
+completion checkers, etc. that use them), a SessionInventory lists the
+directory once with os.scandir and answers each query by matching patterns
+against the cached resource names. The listing is refreshed whenever the
+modification time of the RESOURCES directory changes, i.e. whenever a
+resource is added, removed, or renamed.
+"""
+
+# import of built-in modules
+import fnmatch
+import logging
+import os
+
+# import of third-party modules
+
+# import of local modules
+import utils.debug_utils as debug_utils
+
+# authorship information
+__author__ = "Timothy B. Brown"
+__copyright__ = "Copyright 2020, The Connectome Coordination Facility (CCF)"
+__maintainer__ = "Junil Chang"
+
+# create a module logger
+module_logger = logging.getLogger(__name__)
+module_logger.setLevel(logging.WARNING)  # Note: This can be overidden by log file configuration
+
+
+class SessionInventory(object):
+	"""
+	Inventory of the resource names (and modification times) in one session
+	RESOURCES directory.
+	"""
+
+	def __init__(self, resources_dir):
+		self._resources_dir = resources_dir
+		self._dir_mtime = None
+		self._entries = None
+
+	@property
+	def resources_dir(self):
+		return self._resources_dir
+
+	def _current_dir_mtime(self):
+		try:
+			return os.stat(self._resources_dir).st_mtime_ns
+		except (FileNotFoundError, NotADirectoryError):
+			return None
+
+	def refresh(self):
+		"""List the RESOURCES directory (once) and record the entries in it."""
+		module_logger.debug(debug_utils.get_name() + ": listing " + self._resources_dir)
+
+		dir_mtime = self._current_dir_mtime()
+		entries = {}
+		if dir_mtime is not None:
+			try:
+				with os.scandir(self._resources_dir) as dir_entries:
+					for entry in dir_entries:
+						entries[entry.name] = entry
+			except (FileNotFoundError, NotADirectoryError):
+				dir_mtime = None
+
+		self._dir_mtime = dir_mtime
+		self._entries = entries
+
+	def invalidate(self):
+		"""Force the next query to list the RESOURCES directory again."""
+		self._entries = None
+
+	def _refresh_if_stale(self):
+		if self._entries is None or self._current_dir_mtime() != self._dir_mtime:
+			self.refresh()
+
+	@property
+	def names(self):
+		"""Sorted list of the names of all resources in the session."""
+		self._refresh_if_stale()
+		return sorted(self._entries)
+
+	def exists(self, name):
+		"""Whether a resource with the specified name exists in the session."""
+		self._refresh_if_stale()
+		return name in self._entries
+
+	def mtime(self, name):
+		"""
+		Modification time of the resource with the specified name (as of the
+		time it was first requested since the directory was listed) or None if
+		there is no such resource.
+		"""
+		self._refresh_if_stale()
+		entry = self._entries.get(name)
+		if entry is None:
+			return None
+		return entry.stat().st_mtime
+
+	def glob(self, pattern):
+		"""
+		Sorted list of full paths to the resources whose names match the specified
+		(glob style) pattern. As with glob.glob, names that start with a '.' are
+		only matched by patterns that also start with a '.'.
+		"""
+		self._refresh_if_stale()
+		if not any(char in pattern for char in '*?['):
+			matches = [pattern] if pattern in self._entries else []
+		else:
+			matches = [name for name in self._entries
+					   if fnmatch.fnmatchcase(name, pattern)
+					   and (pattern.startswith('.') or not name.startswith('.'))]
+		return [self._resources_dir + os.sep + name for name in sorted(matches)]
+
+
+_session_inventories = {}
+
+
+def get_session_inventory(resources_dir):
+	"""The SessionInventory for the specified RESOURCES directory shared by everything in this process."""
+	inventory = _session_inventories.get(resources_dir)
+	if inventory is None:
+		inventory = SessionInventory(resources_dir)
+		_session_inventories[resources_dir] = inventory
+	return inventory
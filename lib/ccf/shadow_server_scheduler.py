@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+"""
+ccf/shadow_server_scheduler.py: Assign the PUT_DATA jobs of a batch to the
+shadow servers they put their results through.
+
+The shadow servers (the XNAT_PBS_JOBS_PUT_SERVER_LIST environment variable) are
+all probed once, in parallel, when the first put is assigned. A server that
+does not answer the probe the way a working XNAT server does (the same check
+that DeleteResource.sh and PutDirIntoResource.sh make) is skipped, and the
+latency of the probe of each healthy server is recorded.
+
+Puts are then assigned to the healthy servers with one of two policies (the
+XNAT_PBS_JOBS_PUT_SERVER_POLICY environment variable):
+
+    least-loaded - the server with the fewest puts assigned to it so far
+                   (weighted by probe latency, so a slow server gets fewer)
+    round-robin  - smooth weighted round-robin, with weights inversely
+                   proportional to probe latency
+
+The order in which the put scripts should fall back to other servers if the
+assigned server goes down before the job runs is available from
+fallback_servers.
+"""
+
+# import of built-in modules
+import concurrent.futures
+import http.client
+import logging
+import os
+import ssl
+import time
+import urllib.parse
+
+# import of third-party modules
+
+# import of local modules
+
+# authorship information
+__author__ = "Timothy B. Brown"
+__copyright__ = "Copyright 2020, The Connectome Coordination Facility (CCF)"
+__maintainer__ = "Junil Chang"
+
+# create a module logger
+module_logger = logging.getLogger(__name__)
+module_logger.setLevel(logging.WARNING)  # Note: This can be overidden by log file configuration
+
+LEAST_LOADED = 'least-loaded'
+ROUND_ROBIN = 'round-robin'
+POLICIES = [LEAST_LOADED, ROUND_ROBIN]
+
+# status codes of the response to a GET of the root of a working XNAT server
+# (it redirects to the login page). DeleteResource.sh and PutDirIntoResource.sh
+# only accept a redirect, so a server answering anything else (e.g. 200 from a
+# maintenance page) would be rejected by the put job.
+HEALTHY_STATUS_CODES = (302,)
+
+# seconds to wait for a server to answer a probe
+DEFAULT_PROBE_TIMEOUT = 10
+
+
+def default_servers():
+	"""List of the shadow servers specified by the XNAT_PBS_JOBS_PUT_SERVER_LIST environment variable"""
+	return os.getenv('XNAT_PBS_JOBS_PUT_SERVER_LIST', '').split()
+
+
+def default_policy():
+	"""The put assignment policy specified by the XNAT_PBS_JOBS_PUT_SERVER_POLICY environment variable"""
+	return os.getenv('XNAT_PBS_JOBS_PUT_SERVER_POLICY', LEAST_LOADED)
+
+
+def probe(server, timeout=DEFAULT_PROBE_TIMEOUT):
+	"""
+	Probe a server by getting the root of it (over https unless the server is
+	specified as a URL with another scheme).
+
+	Returns the latency (in seconds) of the probe if the server is healthy, otherwise None
+	"""
+	url = urllib.parse.urlsplit(server if '://' in server else 'https://' + server)
+	if url.scheme == 'https':
+		connection = http.client.HTTPSConnection(url.netloc, timeout=timeout, context=ssl.create_default_context())
+	else:
+		connection = http.client.HTTPConnection(url.netloc, timeout=timeout)
+
+	start_time = time.monotonic()
+	try:
+		connection.request('GET', '/')
+		status = connection.getresponse().status
+	except (OSError, http.client.HTTPException) as e:
+		module_logger.warning("shadow server: " + server + " did not answer probe: " + str(e))
+		return None
+	finally:
+		connection.close()
+	latency = time.monotonic() - start_time
+
+	if status not in HEALTHY_STATUS_CODES:
+		module_logger.warning("shadow server: " + server + " answered probe with status: " + str(status))
+		return None
+
+	return latency
+
+
+class ShadowServerScheduler(object):
+	"""
+	Assigns puts to the healthy servers in a list of shadow servers.
+	"""
+
+	def __init__(self, servers=None, policy=None, probe_timeout=DEFAULT_PROBE_TIMEOUT):
+		self._servers = servers if servers is not None else default_servers()
+		self._policy = policy if policy else default_policy()
+		if self._policy not in POLICIES:
+			raise ValueError("Unrecognized put server policy: " + self._policy)
+		self._probe_timeout = probe_timeout
+
+		self._latencies = None
+		self._assigned = {server: 0 for server in self._servers}
+		self._current_weights = {server: 0.0 for server in self._servers}
+
+	@property
+	def servers(self):
+		return self._servers
+
+	@property
+	def policy(self):
+		return self._policy
+
+	@property
+	def assigned(self):
+		"""Dictionary of server to the number of puts assigned to it"""
+		return dict(self._assigned)
+
+	def probe(self):
+		"""(Re-)probe all the servers, in parallel."""
+		with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(self._servers))) as executor:
+			latencies = executor.map(lambda server: probe(server, self._probe_timeout), self._servers)
+			self._latencies = dict(zip(self._servers, latencies))
+
+		for server in self._servers:
+			if self._latencies[server] is None:
+				module_logger.info("shadow server: " + server + " is down")
+			else:
+				module_logger.info("shadow server: " + server + " latency: " + "%.3f" % self._latencies[server])
+
+	def healthy_servers(self):
+		"""List of the servers that answered the probe, fastest first"""
+		if self._latencies is None:
+			self.probe()
+		return sorted([server for server in self._servers if self._latencies[server] is not None],
+					  key=lambda server: self._latencies[server])
+
+	def _weight(self, server):
+		# never let an (implausibly) quick probe give a server all of the puts
+		return 1.0 / max(self._latencies[server], 0.001)
+
+	def _least_loaded(self, servers):
+		return min(servers, key=lambda server: (self._assigned[server] + 1) / self._weight(server))
+
+	def _round_robin(self, servers):
+		total_weight = 0.0
+		for server in servers:
+			self._current_weights[server] += self._weight(server)
+			total_weight += self._weight(server)
+		server = max(servers, key=lambda server: self._current_weights[server])
+		self._current_weights[server] -= total_weight
+		return server
+
+	def assign(self):
+		"""
+		Assign a put to a server and return the server.
+
+		If no servers are healthy, the put is assigned to the first server in the
+		list (and left for the put job to find a working server when it runs).
+		"""
+		if not self._servers:
+			raise ValueError("No shadow servers: set XNAT_PBS_JOBS_PUT_SERVER_LIST")
+
+		servers = self.healthy_servers()
+		if not servers:
+			module_logger.warning("no shadow server answered the probe, assigning put to: " + self._servers[0])
+			server = self._servers[0]
+		elif self._policy == ROUND_ROBIN:
+			server = self._round_robin(servers)
+		else:
+			server = self._least_loaded(servers)
+
+		self._assigned[server] += 1
+		return server
+
+	def fallback_servers(self, server):
+		"""
+		List of the servers for the put assigned to the specified server to try, in
+		order, starting with that server, then the other healthy servers (fastest
+		first), then the servers that are down
+		"""
+		healthy = self.healthy_servers()
+		down = [other for other in self._servers if other not in healthy]
+		return [server] + [other for other in healthy + down if other != server]
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+"""
+ccf/status_cache.py: A cache of per-row status information (e.g. the rows of a
+Control panel status table) that is invalidated by changes to the file system.
+
+Each cached status is stored along with a fingerprint of the files and
+directories its evaluation depends on (e.g. the session RESOURCES directory,
+the output resource directory, the completion marker files, and the running
+status directory). The fingerprint is the modification time of each of those
+paths, so checking whether a cached status is still valid only takes one stat
+per path instead of re-running all the prerequisite, completion, and run status
+checks.
+"""
+
+# import of built-in modules
+import logging
+import os
+
+# import of third-party modules
+
+# import of local modules
+
+# authorship information
+__author__ = "Timothy B. Brown"
+__copyright__ = "Copyright 2020, The Connectome Coordination Facility (CCF)"
+__maintainer__ = "Junil Chang"
+
+# create a module logger
+module_logger = logging.getLogger(__name__)
+module_logger.setLevel(logging.WARNING)  # Note: This can be overidden by log file configuration
+
+
+def fingerprint(paths):
+	"""
+	Tuple of the modification times (in nanoseconds) of the specified paths,
+	with None for each path that does not exist
+	"""
+	mtimes = []
+	for path in paths:
+		try:
+			mtimes.append(os.stat(path).st_mtime_ns)
+		except OSError:
+			mtimes.append(None)
+	return tuple(mtimes)
+
+
+class StatusCache(object):
+	"""
+	Cache of status items keyed by row (e.g. session or session and scan) and
+	validated by the fingerprint of the paths each status item depends on.
+	"""
+
+	def __init__(self):
+		self._entries = {}
+
+	def __len__(self):
+		return len(self._entries)
+
+	def get(self, key, current_fingerprint):
+		"""
+		The cached status item for the specified key, or None if there is none or
+		the paths it depends on have changed since it was cached
+		"""
+		entry = self._entries.get(key)
+		if entry is None or entry[0] != current_fingerprint:
+			return None
+		return entry[1]
+
+	def put(self, key, current_fingerprint, status_item):
+		self._entries[key] = (current_fingerprint, status_item)
+
+	def invalidate(self, key=None):
+		"""Discard the cached status for the specified key, or all cached statuses."""
+		if key is None:
+			self._entries.clear()
+		else:
+			self._entries.pop(key, None)
+
+	def get_or_build(self, key, paths, build_status_item):
+		"""
+		The cached status item for the specified key if none of the specified paths
+		have changed since it was cached, otherwise the (newly cached) result of
+		calling build_status_item
+		"""
+		current_fingerprint = fingerprint(paths)
+		status_item = self.get(key, current_fingerprint)
+		if status_item is None:
+			module_logger.debug("building status for: " + str(key))
+			status_item = build_status_item()
+			self.put(key, current_fingerprint, status_item)
+		return status_item
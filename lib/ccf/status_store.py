@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+
+"""
+ccf/status_store.py: A persistent (SQLite) store of the prerequisite, completion,
+and run status of the sessions (and scans) processed by each pipeline.
+
+Each status record is keyed by (project, subject, classifier, scan, pipeline)
+and records the result of the prerequisite and completion checks, the
+modification time of the output resource, the state of the files the checks
+depend on (the marker state, see ccf/status_cache.py), the kind of completion
+check done (marker check, full file check, or full file check with deep
+verification of the files), and when the check was done.
+
+The batch completion checkers (Check*CompletionBatch.py) and the Control panels
+use a StatusStore to skip re-doing the prerequisite and completion checks for a
+row whose resources have not changed since it was last checked. Because the
+records are indexed by pipeline and completion, queries such as "all incomplete
+MsmAllProcessing sessions" are answered from the store instead of by crawling
+the archive, e.g.
+
+    status_store.py --pipeline MsmAllProcessing --incomplete
+
+The store is kept in the file named by the XNAT_PBS_JOBS_STATUS_DB environment
+variable, or in status.db in the XNAT_PBS_JOBS_CONTROL directory if that is
+not set. If neither is set, status records are only kept in memory, shared by
+all the threads of the process for its life (but not by worker processes).
+"""
+
+# import of built-in modules
+import collections
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+# import of third-party modules
+
+# import of local modules
+import ccf.status_cache as ccf_status_cache
+import utils.file_integrity as file_integrity
+import utils.my_argparse as my_argparse
+
+# authorship information
+__author__ = "Timothy B. Brown"
+__copyright__ = "Copyright 2020, The Connectome Coordination Facility (CCF)"
+__maintainer__ = "Junil Chang"
+
+# create a module logger
+module_logger = logging.getLogger(__name__)
+module_logger.setLevel(logging.WARNING)  # Note: This can be overidden by log file configuration
+
+# kinds of completion check
+MARKER_CHECK = 'marker'
+FILES_CHECK = 'files'
+VERIFIED_FILES_CHECK = 'files+verify'
+
+# the kinds of check whose results can be reused for each kind of check, a
+# check with deep verification is as good as a check that only finds the files
+_REUSABLE_CHECK_MODES = {
+	MARKER_CHECK: (MARKER_CHECK,),
+	FILES_CHECK: (FILES_CHECK, VERIFIED_FILES_CHECK),
+	VERIFIED_FILES_CHECK: (VERIFIED_FILES_CHECK,),
+}
+
+IN_MEMORY_DB = ':memory:'
+
+# seconds to wait for another process to finish writing to the store
+BUSY_TIMEOUT = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS status (
+	project TEXT NOT NULL,
+	subject TEXT NOT NULL,
+	classifier TEXT NOT NULL,
+	scan TEXT NOT NULL,
+	pipeline TEXT NOT NULL,
+	prereqs_met INTEGER,
+	resource TEXT,
+	resource_exists INTEGER,
+	resource_mtime REAL,
+	marker_state TEXT,
+	check_mode TEXT,
+	complete INTEGER,
+	queued_or_running INTEGER,
+	checked_at REAL,
+	PRIMARY KEY (project, subject, classifier, scan, pipeline)
+);
+CREATE INDEX IF NOT EXISTS status_pipeline_complete ON status (pipeline, complete, project);
+"""
+
+_COLUMNS = ['project', 'subject', 'classifier', 'scan', 'pipeline',
+			'prereqs_met', 'resource', 'resource_exists', 'resource_mtime',
+			'marker_state', 'check_mode', 'complete', 'queued_or_running', 'checked_at']
+
+StatusRecord = collections.namedtuple('StatusRecord', _COLUMNS)
+
+_BOOLEAN_COLUMNS = ['prereqs_met', 'resource_exists', 'complete', 'queued_or_running']
+
+
+def default_status_db_path():
+	"""The path to the status database file, or None if there is no persistent store configured."""
+	db_path = os.getenv('XNAT_PBS_JOBS_STATUS_DB')
+	if db_path:
+		return db_path
+
+	control_dir = os.getenv('XNAT_PBS_JOBS_CONTROL')
+	if control_dir:
+		return control_dir + os.sep + 'status.db'
+
+	return None
+
+
+def status_key(subject_info, pipeline):
+	"""The (project, subject, classifier, scan, pipeline) key of the status of the specified subject."""
+	return (subject_info.project, subject_info.subject_id,
+			getattr(subject_info, 'classifier', '') or '', subject_info.extra or '', pipeline)
+
+
+def completion_check_mode(bypass_mark, deep_verify=None):
+	"""
+	The kind of completion check done by a completion checker: a marker check, or
+	(if bypass_mark) a full file check, with deep verification of the files if
+	deep_verify (default: the XNAT_PBS_JOBS_DEEP_VERIFY environment variable)
+	"""
+	if not bypass_mark:
+		return MARKER_CHECK
+	if deep_verify is None:
+		deep_verify = file_integrity.deep_verify_default()
+	return VERIFIED_FILES_CHECK if deep_verify else FILES_CHECK
+
+
+def marker_state(paths):
+	"""Encoded state (modification times) of the specified paths"""
+	return json.dumps(ccf_status_cache.fingerprint(paths))
+
+
+def add_arguments(parser):
+	"""Add the command line arguments that control the use of a StatusStore to the specified parser."""
+	parser.add_argument('--status-db', dest='status_db', required=False, type=str,
+						default=default_status_db_path(),
+						help="status database file (default: $XNAT_PBS_JOBS_STATUS_DB)")
+	parser.add_argument('--recheck', dest='recheck', action='store_true',
+						required=False, default=False,
+						help="redo all checks, even for rows whose resources have not changed")
+
+
+def _record_from_row(row):
+	record = StatusRecord(*row)
+	return record._replace(**{name: None if getattr(record, name) is None else bool(getattr(record, name))
+							  for name in _BOOLEAN_COLUMNS})
+
+
+class StatusStore(object):
+	"""
+	SQLite backed store of StatusRecords.
+
+	A StatusStore can be shared by threads (each thread uses its own connection
+	to the database file, while an in memory database has one connection that the
+	threads take turns to use) and passed to worker processes (it is pickled as
+	just the database path and options, so a worker process given a store with an
+	in memory database gets a new, empty one).
+	"""
+
+	def __init__(self, db_path=None, recheck=False):
+		self._db_path = db_path if db_path else IN_MEMORY_DB
+		self._recheck = recheck
+		self._local = threading.local()
+		self._memory_connection = None
+		self._memory_lock = threading.RLock()
+
+	def __getstate__(self):
+		return {'_db_path': self._db_path, '_recheck': self._recheck}
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self._local = threading.local()
+		self._memory_connection = None
+		self._memory_lock = threading.RLock()
+
+	@property
+	def db_path(self):
+		return self._db_path
+
+	@property
+	def _connection(self):
+		if self._db_path == IN_MEMORY_DB:
+			# each connection to ':memory:' would be a separate database
+			with self._memory_lock:
+				if self._memory_connection is None:
+					module_logger.debug("opening status store: " + self._db_path)
+					connection = sqlite3.connect(self._db_path, check_same_thread=False)
+					connection.executescript(_SCHEMA)
+					self._memory_connection = connection
+				return self._memory_connection
+
+		connection = getattr(self._local, 'connection', None)
+		if connection is None:
+			module_logger.debug("opening status store: " + self._db_path)
+			os.makedirs(os.path.dirname(os.path.abspath(self._db_path)), exist_ok=True)
+			connection = sqlite3.connect(self._db_path, timeout=BUSY_TIMEOUT)
+			# let readers (e.g. Control panels) work while a batch check is writing
+			connection.execute('PRAGMA journal_mode=WAL')
+			connection.execute('PRAGMA synchronous=NORMAL')
+			connection.executescript(_SCHEMA)
+			self._local.connection = connection
+		return connection
+
+	@contextlib.contextmanager
+	def _locked_connection(self):
+		"""The connection to use, held for the exclusive use of this thread if it is shared"""
+		if self._db_path != IN_MEMORY_DB:
+			yield self._connection
+			return
+
+		with self._memory_lock:
+			yield self._connection
+
+	def get(self, key):
+		"""The StatusRecord for the specified key, or None if there is none."""
+		with self._locked_connection() as connection:
+			row = connection.execute(
+				'SELECT ' + ', '.join(_COLUMNS) + ' FROM status'
+				' WHERE project = ? AND subject = ? AND classifier = ? AND scan = ? AND pipeline = ?',
+				key).fetchone()
+		return _record_from_row(row) if row else None
+
+	def get_valid(self, key, current_marker_state, check_mode):
+		"""
+		The StatusRecord for the specified key if it was determined by the specified
+		kind of check (or one that can stand in for it, e.g. a deep verified file check
+		for a file check) and the files it depends on have not changed since, otherwise None
+		"""
+		if self._recheck:
+			return None
+
+		record = self.get(key)
+		if (record is None or record.marker_state != current_marker_state or
+				record.check_mode not in _REUSABLE_CHECK_MODES.get(check_mode, (check_mode,))):
+			return None
+		return record
+
+	def put(self, record):
+		with self._locked_connection() as connection, connection:
+			connection.execute(
+				'INSERT OR REPLACE INTO status (' + ', '.join(_COLUMNS) + ')'
+				' VALUES (' + ', '.join(['?'] * len(_COLUMNS)) + ')',
+				record)
+
+	def invalidate(self, key):
+		"""Discard the stored status for the specified key."""
+		with self._locked_connection() as connection, connection:
+			connection.execute(
+				'DELETE FROM status'
+				' WHERE project = ? AND subject = ? AND classifier = ? AND scan = ? AND pipeline = ?',
+				key)
+
+	def get_or_check(self, key, paths, check_mode, check, queued_or_running):
+		"""
+		The StatusRecord for the specified key.
+
+		If the stored record was determined by the specified kind of check (see
+		get_valid) and none of the specified paths have changed since, it is reused. Otherwise
+		check is called to redo the checks. It must return a tuple of
+		(prereqs_met, resource, resource_exists, resource_mtime, complete).
+
+		Either way, the record is stored with the specified queued_or_running
+		status (which is always determined anew, as it is cheap to determine and
+		changes without any change to the paths).
+		"""
+		current_marker_state = marker_state(paths)
+		record = self.get_valid(key, current_marker_state, check_mode)
+
+		if record is None:
+			(prereqs_met, resource, resource_exists, resource_mtime, complete) = check()
+			record = StatusRecord(*key, prereqs_met, resource, resource_exists, resource_mtime,
+								  current_marker_state, check_mode, complete, queued_or_running, time.time())
+		else:
+			module_logger.debug("reusing stored status for: " + str(key))
+			record = record._replace(queued_or_running=queued_or_running)
+
+		self.put(record)
+		return record
+
+	def query(self, pipeline, project=None, complete=None, prereqs_met=None):
+		"""
+		List of the StatusRecords for the specified pipeline (and optionally project)
+		with the specified completion and prerequisite status (if specified), in
+		project, subject, classifier, scan order
+		"""
+		sql = 'SELECT ' + ', '.join(_COLUMNS) + ' FROM status WHERE pipeline = ?'
+		parameters = [pipeline]
+		if complete is not None:
+			sql += ' AND complete = ?'
+			parameters.append(int(complete))
+		if project is not None:
+			sql += ' AND project = ?'
+			parameters.append(project)
+		if prereqs_met is not None:
+			sql += ' AND prereqs_met = ?'
+			parameters.append(int(prereqs_met))
+		sql += ' ORDER BY project, subject, classifier, scan'
+
+		with self._locked_connection() as connection:
+			return [_record_from_row(row) for row in connection.execute(sql, parameters)]
+
+
+if __name__ == "__main__":
+
+	parser = my_argparse.MyArgumentParser(
+		description="Program to list the stored status of the sessions processed by a pipeline.")
+
+	# mandatory arguments
+	parser.add_argument('-l', '--pipeline', dest='pipeline', required=True, type=str)
+
+	# optional arguments
+	parser.add_argument('-p', '--project', dest='project', required=False, type=str)
+	parser.add_argument('--status-db', dest='status_db', required=False, type=str,
+						default=default_status_db_path())
+	group = parser.add_mutually_exclusive_group()
+	group.add_argument('--complete', dest='complete', action='store_const', const=True)
+	group.add_argument('--incomplete', dest='complete', action='store_const', const=False)
+
+	# parse the command line arguments
+	args = parser.parse_args()
+
+	if not args.status_db:
+		print("No status database: set XNAT_PBS_JOBS_STATUS_DB or use --status-db", file=sys.stderr)
+		exit(1)
+
+	status_store = StatusStore(args.status_db)
+
+	print("\t".join(_COLUMNS))
+	for record in status_store.query(args.pipeline, args.project, args.complete):
+		print("\t".join(str(value) for value in record))
@@ -468,22 +468,15 @@ class OneSubjectJobSubmitter(one_subject_job_submitter.OneSubjectJobSubmitter):
 			return standard_process_data_jobno, all_process_data_jobs
 		
 		if stage >= ccf_processing_stage.ProcessingStage.PROCESS_DATA:
-			if standard_process_data_jobno:
-				fs_submit_cmd = 'qsub -W depend=afterok:' + standard_process_data_jobno + ' ' + self.freesurfer_assessor_script_name
-			else:
-				fs_submit_cmd = 'qsub ' + self.freesurfer_assessor_script_name
-
-			completed_submit_process = subprocess.run(
-				fs_submit_cmd, shell=True, check=True, stdout=subprocess.PIPE, universal_newlines=True)
-			fs_job_no = str_utils.remove_ending_new_lines(completed_submit_process.stdout)
-			all_process_data_jobs.append(fs_job_no)
-			return fs_job_no, all_process_data_jobs
+			fs_job, fs_jobs = self.queue_job(self.freesurfer_assessor_script_name, standard_process_data_jobno)
+			all_process_data_jobs.extend(fs_jobs)
+			return fs_job, all_process_data_jobs
 
 		else:
 			module_logger.info("freesurfer assessor job not submitted because of requested processing stage")
 			return standard_process_data_jobno, all_process_data_jobs
 			
-	def mark_running_status(self, stage):
+	def mark_running_status(self, stage, running=True):
 		module_logger.debug(debug_utils.get_name())
 
 		if stage > ccf_processing_stage.ProcessingStage.PREPARE_SCRIPTS:
@@ -498,7 +491,7 @@ class OneSubjectJobSubmitter(one_subject_job_submitter.OneSubjectJobSubmitter):
 			mark_cmd += ' --subject=' + self.subject
 			mark_cmd += ' --classifier=' + self.classifier
 			mark_cmd += ' --resource=RunningStatus'
-			mark_cmd += ' --queued'
+			mark_cmd += ' --queued' if running else ' --not-queued'
 
 			completed_mark_cmd_process = subprocess.run(
 				mark_cmd, shell=True, check=True, stdout=subprocess.PIPE, universal_newlines=True)
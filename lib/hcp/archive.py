@@ -12,6 +12,7 @@ import os
 
 
 # import of local modules
+import ccf.session_inventory as ccf_session_inventory
 import xnat.xnat_archive as xnat_archive
 
 
@@ -156,10 +157,23 @@ class HcpArchive(abc.ABC):
         directory for a subject in this project archive."""
         return self.session_dir_fullpath(subject_info) + '/RESOURCES'
 
+    def session_inventory(self, subject_info):
+        """the (cached) SessionInventory of the subject-level resources directory
+        for a subject in this project archive."""
+        return ccf_session_inventory.get_session_inventory(self.subject_resources_dir_fullpath(subject_info))
+
+    def _glob_resources(self, subject_info, path_expr):
+        """sorted list of full paths matching the specified expression, answered from
+        the session inventory when the expression is for a subject-level resource."""
+        (dir_name, pattern) = os.path.split(path_expr)
+        if dir_name != self.subject_resources_dir_fullpath(subject_info):
+            return sorted(glob.glob(path_expr))
+        return self.session_inventory(subject_info).glob(pattern)
+
     def available_functional_unproc_dir_fullpaths(self, subject_info):
         """list of full paths to unprocessed functional scan resource directories"""
-        dir_list = glob.glob(
-            self.subject_resources_dir_fullpath(subject_info) + '/*' +
+        dir_list = self._glob_resources(
+            subject_info, self.subject_resources_dir_fullpath(subject_info) + '/*' +
             self.FUNCTIONAL_SCAN_MARKER + '*' + self.UNPROC_SUFFIX)
         return sorted(dir_list)
 
@@ -198,8 +212,8 @@ class HcpArchive(abc.ABC):
 
     def available_functional_preproc_dir_fullpaths(self, subject_info):
         """Returns a list of full paths to preprocessed functional scan resources."""
-        dir_list = glob.glob(
-            self.subject_resources_dir_fullpath(subject_info) + '/*' +
+        dir_list = self._glob_resources(
+            subject_info, self.subject_resources_dir_fullpath(subject_info) + '/*' +
             self.FUNCTIONAL_SCAN_MARKER + '*' + self.PREPROC_SUFFIX)
         return sorted(dir_list)
 
@@ -209,7 +223,7 @@ class HcpArchive(abc.ABC):
 
     def available_diffusion_unproc_dir_fullpaths(self, subject_info):
         """list of full paths to unprocessed diffusion scan resource directories"""
-        dir_list = glob.glob(self.diffusion_unproc_dir_fullpath(subject_info))
+        dir_list = self._glob_resources(subject_info, self.diffusion_unproc_dir_fullpath(subject_info))
         return sorted(dir_list)
 
     def does_diffusion_unproc_dir_exist(self, subject_info):
@@ -224,14 +238,14 @@ class HcpArchive(abc.ABC):
 
     def available_diffusion_preproc_dir_fullpaths(self, subject_info):
         """list of full paths to preprocessed diffusion resources."""
-        dir_list = glob.glob(self.diffusion_preproc_dir_fullpath(subject_info))
+        dir_list = self._glob_resources(subject_info, self.diffusion_preproc_dir_fullpath(subject_info))
         return sorted(dir_list)
 
     def diffusion_bedpostx_dir_fullpath(self, subject_info):
         return self.subject_resources_dir_fullpath(subject_info) + os.sep + self.BEDPOSTX_PROCESSED_RESOURCE_NAME
 
     def available_diffusion_bedpostx_dir_fullpaths(self, subject_info):
-        dir_list = glob.glob(self.diffusion_bedpostx_dir_fullpath(subject_info))
+        dir_list = self._glob_resources(subject_info, self.diffusion_bedpostx_dir_fullpath(subject_info))
         return sorted(dir_list)
 
     def does_diffusion_bedpostx_dir_exist(self, subject_info):
@@ -268,8 +282,8 @@ class HcpArchive(abc.ABC):
 
     def available_FIX_processed_dir_fullpaths(self, subject_info):
         """Returns a list of full paths to FIX processed scan resources."""
-        dir_list = glob.glob(
-            self.subject_resources_dir_fullpath(subject_info) + '/*' +
+        dir_list = self._glob_resources(
+            subject_info, self.subject_resources_dir_fullpath(subject_info) + '/*' +
             self.FUNCTIONAL_SCAN_MARKER + '*' + self.FIX_PROCESSED_SUFFIX)
 
         return_dir_list = []
@@ -282,8 +296,8 @@ class HcpArchive(abc.ABC):
 
     def available_MultiRun_FIX_processed_dir_fullpaths(self, subject_info):
         """Returns a list of full paths to Multi-Run FIX processed scan resources."""
-        dir_list = glob.glob(
-            self.subject_resources_dir_fullpath(subject_info) + '/*' +
+        dir_list = self._glob_resources(
+            subject_info, self.subject_resources_dir_fullpath(subject_info) + '/*' +
             self.FUNCTIONAL_SCAN_MARKER + '*' + self.FIX_PROCESSED_SUFFIX)
 
         return_dir_list = []
@@ -296,8 +310,8 @@ class HcpArchive(abc.ABC):
     
     def available_task_processed_dir_fullpaths(self, subject_info):
         dir_list = []
-        first_dir_list = glob.glob(
-            self.subject_resources_dir_fullpath(subject_info) + '/*' +
+        first_dir_list = self._glob_resources(
+            subject_info, self.subject_resources_dir_fullpath(subject_info) + '/*' +
             self.TASK_SCAN_MARKER + '*')
 
         for directory in first_dir_list:
@@ -336,8 +350,8 @@ class HcpArchive(abc.ABC):
 
     def available_hand_reclassification_dir_fullpaths(self, subject_info):
         """Returns a list of full paths to hand reclassification resources for the scans."""
-        dir_list = glob.glob(
-            self.subject_resources_dir_fullpath(subject_info) + '/*' +
+        dir_list = self._glob_resources(
+            subject_info, self.subject_resources_dir_fullpath(subject_info) + '/*' +
             self.HAND_RECLASSIFICATION_SUFFIX)
         return sorted(dir_list)
 
@@ -354,8 +368,8 @@ class HcpArchive(abc.ABC):
 
     def available_RSS_processed_dir_fullpaths(self, subject_info):
         """Returns a list of the full paths to RSS processed scan resources."""
-        dir_list = glob.glob(
-            self.subject_resources_dir_fullpath(subject_info) + '/*' +
+        dir_list = self._glob_resources(
+            subject_info, self.subject_resources_dir_fullpath(subject_info) + '/*' +
             self.RSS_PROCESSED_SUFFIX)
         return sorted(dir_list)
 
@@ -366,12 +380,12 @@ class HcpArchive(abc.ABC):
 
     def available_reapplyfix_dir_fullpaths(self, subject_info, reg_name=None):
         if reg_name is not None:
-            dir_list = glob.glob(
-                self.subject_resources_dir_fullpath(subject_info) + '/*' +
+            dir_list = self._glob_resources(
+                subject_info, self.subject_resources_dir_fullpath(subject_info) + '/*' +
                 self.REAPPLY_FIX_SUFFIX + reg_name)
         else:
-            dir_list = glob.glob(
-                self.subject_resources_dir_fullpath(subject_info) + '/*' +
+            dir_list = self._glob_resources(
+                subject_info, self.subject_resources_dir_fullpath(subject_info) + '/*' +
                 self.REAPPLY_FIX_SUFFIX)
         return sorted(dir_list)
 
@@ -403,15 +417,15 @@ class HcpArchive(abc.ABC):
 
     def available_handreclassification_dir_fullpaths(self, subject_info):
         """Returns a list of the full paths to the hand reclassification resources."""
-        dir_list = glob.glob(
-            self.subject_resources_dir_fullpath(subject_info) + '/*' +
+        dir_list = self._glob_resources(
+            subject_info, self.subject_resources_dir_fullpath(subject_info) + '/*' +
             self.HAND_RECLASSIFICATION_SUFFIX)
         return sorted(dir_list)
 
     def available_apply_handreclassification_dir_fullpaths(self, subject_info):
         """Returns a list of the full paths to the applied hand reclassification resources."""
-        dir_list = glob.glob(
-            self.subject_resources_dir_fullpath(subject_info) + '/*' +
+        dir_list = self._glob_resources(
+            subject_info, self.subject_resources_dir_fullpath(subject_info) + '/*' +
             self.APPLY_HAND_RECLASSIFICATION_SUFFIX)
         return sorted(dir_list)
 
@@ -428,7 +442,7 @@ class HcpArchive(abc.ABC):
         return name_list
 
     def available_msmall_reg_dir_fullpaths(self, subject_info):
-        dir_list = glob.glob(self.subject_resources_dir_fullpath(subject_info) + '/MSMAllReg')
+        dir_list = self._glob_resources(subject_info, self.subject_resources_dir_fullpath(subject_info) + '/MSMAllReg')
         return sorted(dir_list)
 
     def available_RSS_processed_names(self, subject_info):
@@ -501,13 +515,13 @@ class HcpArchive(abc.ABC):
 
     def available_DeDriftAndResample_processed_dirs(self, subject_info):
         """Returns a list of full paths to DeDriftAndResample processed scan resources"""
-        dir_list = glob.glob(self.DeDriftAndResample_processed_dir_name(subject_info))
+        dir_list = self._glob_resources(subject_info, self.DeDriftAndResample_processed_dir_name(subject_info))
         return sorted(dir_list)
 
     def available_PostFix_processed_dirs(self, subject_info):
         """Returns a list of full paths to PostFix processed scan resources"""
-        dir_list = glob.glob(
-            self.subject_resources_dir_fullpath(subject_info) + '/*' +
+        dir_list = self._glob_resources(
+            subject_info, self.subject_resources_dir_fullpath(subject_info) + '/*' +
             self.FUNCTIONAL_SCAN_MARKER + '*' + self.POSTFIX_PROCESSED_SUFFIX)
         return sorted(dir_list)
 
@@ -587,8 +601,8 @@ class HcpArchive(abc.ABC):
         return scan_name.startswith(self.TASK_SCAN_MARKER)
 
     def available_structural_unproc_dir_fullpaths(self, subject_info):
-        dir_list = glob.glob(
-            self.subject_resources_dir_fullpath(subject_info) + os.sep +
+        dir_list = self._glob_resources(
+            subject_info, self.subject_resources_dir_fullpath(subject_info) + os.sep +
             'T[12]w_' + '*' + self.UNPROC_SUFFIX)
         return sorted(dir_list)
 
@@ -599,15 +613,15 @@ class HcpArchive(abc.ABC):
         return self.subject_resources_dir_fullpath(subject_info) + os.sep + 'Structural_' + self.PREPROC_SUFFIX
 
     def available_structural_preproc_dir_fullpaths(self, subject_info):
-        dir_list = glob.glob(
-            self.subject_resources_dir_fullpath(subject_info) + os.sep +
+        dir_list = self._glob_resources(
+            subject_info, self.subject_resources_dir_fullpath(subject_info) + os.sep +
             'Structural' + '_' + self.PREPROC_SUFFIX)
         return sorted(dir_list)
 
     def available_resting_state_preproc_dirs(self, subject_info):
         """Returns a list of full paths to functionally preprocessed resting state scan resources."""
-        dir_list = glob.glob(
-            self.subject_resources_dir_fullpath(subject_info) + '/*' +
+        dir_list = self._glob_resources(
+            subject_info, self.subject_resources_dir_fullpath(subject_info) + '/*' +
             self.RESTING_STATE_SCAN_MARKER + '*' + self.PREPROC_SUFFIX)
         return sorted(dir_list)
 
@@ -622,8 +636,8 @@ class HcpArchive(abc.ABC):
 
     def available_task_preproc_dirs(self, subject_info):
         """Returns a list of full paths to functionally preprocessed task scan resources."""
-        dir_list = glob.glob(
-            self.subject_resources_dir_fullpath(subject_info) + '/*' +
+        dir_list = self._glob_resources(
+            subject_info, self.subject_resources_dir_fullpath(subject_info) + '/*' +
             self.TASK_SCAN_MARKER + '*' + self.PREPROC_SUFFIX)
         return sorted(dir_list)
 
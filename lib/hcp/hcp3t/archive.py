@@ -54,15 +54,16 @@ class Hcp3T_Archive(hcp_archive.HcpArchive):
         super().__init__()
 
     def available_supplemental_structural_preproc_dir_fullpaths(self, subject_info):
-        dir_list = glob.glob(self.subject_resources_dir_fullpath(subject_info) + os.sep +
-                             'Structural' + '_' + self.PREPROC_SUFFIX + '_supplemental')
+        dir_list = self._glob_resources(
+            subject_info, self.subject_resources_dir_fullpath(subject_info) + os.sep +
+            'Structural' + '_' + self.PREPROC_SUFFIX + '_supplemental')
         return sorted(dir_list)
 
     def bedpostx_dir_fullpath(self, subject_info):
         return self.subject_resources_dir_fullpath(subject_info) + os.sep + 'Diffusion_bedpostx'
 
     def available_bedpostx_fullpaths(self, subject_info):
-        dir_list = glob.glob(self.bedpostx_dir_fullpath(subject_info))
+        dir_list = self._glob_resources(subject_info, self.bedpostx_dir_fullpath(subject_info))
         return sorted(dir_list)
 
 def _simple_interactive_demo():
@@ -8,7 +8,6 @@ import logging
 import os
 import stat
 import subprocess
-import time
 
 # import of third party modules
 
@@ -92,12 +91,11 @@ class OneSubjectPackageJobSubmitter():
     @property
     def working_directory_name(self):
         if not self._working_directory_name:
-            current_seconds_since_epoch = int(time.time())
             wdir = self.build_home
             wdir += os.sep + self.project 
             wdir += os.sep + self.WORK_DESC
             wdir += '.' + self.subject
-            wdir += '.' + str(current_seconds_since_epoch)
+            wdir += '.' + os_utils.unique_time_stamp()
             self._working_directory_name = wdir
             
         return self._working_directory_name
@@ -259,9 +257,6 @@ class OneSubjectPackageJobSubmitter():
         logger.info("   Stage: " + str(packaging_stage))
         logger.info("----------")
 
-        # make sure working directories do not have the same name based on 
-        # the same starting time by sleeping a few seconds
-        time.sleep(5)
 
         # build the working directory
         logger.info("Making working directory: " + self.working_directory_name)
@@ -7,8 +7,6 @@ hcp.hcp3t.diffusion_preprocessing.output_size_checker.py
 # import of built-in modules
 import logging
 import os
-import re
-import subprocess
 import sys
 
 
@@ -20,6 +18,7 @@ import sys
 import hcp.hcp3t.archive as hcp3t_archive
 import hcp.hcp3t.subject as hcp3t_subject
 import utils.my_argparse as my_argparse
+import utils.nifti_header as nifti_header
 import utils.str_utils as str_utils
 
 
@@ -102,20 +101,11 @@ class DiffusionOutputSizeChecker:
         if not os.path.isfile(file_name):
             return 0
 
-        cmd = 'fslinfo ' + file_name + ' | grep dim4 | grep -v pix'
-        completed_process = subprocess.run(cmd, shell=True, check=True, stdout=subprocess.PIPE,
-                                           universal_newlines=True)
-        # remove new line characters and leading and trailing spaces
-        output = str_utils.remove_ending_new_lines(completed_process.stdout).strip()
-        # collapse whitespace to single spaces
-        output = re.sub('\W+', ' ', output)
-        log.debug("output: " + output)
+        # read dim4 from the NIfTI header (rather than running fslinfo)
+        value = nifti_header.volume_count(file_name)
+        log.debug("dim4: " + str(value))
 
-        (name, value) = output.split(' ')
-        log.debug("name: " + name)
-        log.debug("value: " + value)
-
-        return int(value)
+        return value
 
     def _get_diffusion_preproc_data_volume_count(self, archive, subject_info):
         diff_preproc_resource_path = archive.diffusion_preproc_dir_fullpath(subject_info)
@@ -6,8 +6,6 @@ import enum
 import logging
 import os
 import stat
-import subprocess
-import time
 
 # import of third party modules
 
@@ -38,6 +36,12 @@ class ProcessingStage(ordered_enum.OrderedEnum):
 
 
 class OneSubjectJobSubmitter(one_subject_job_submitter.OneSubjectJobSubmitter):
+    """Submits the ReApplyFix jobs for one scan.
+
+    To submit several scans with each processing stage for all of them as one PBS
+    job array, configure a submitter per scan and pass them to
+    one_subject_job_submitter.submit_as_job_arrays.
+    """
 
     def __init__(self, hcp3t_archive, build_home):
         super().__init__(hcp3t_archive, build_home)
@@ -330,9 +334,6 @@ class OneSubjectJobSubmitter(one_subject_job_submitter.OneSubjectJobSubmitter):
         logger.info("     Scan: " + self.scan)
         logger.info("    Stage: " + str(processing_stage))
 
-        # make sure working directories do not have the same name based on 
-        # the same start time by sleeping a few seconds
-        time.sleep(5)
 
         # build the working directory name
         self._working_directory_name = \
@@ -370,62 +371,35 @@ class OneSubjectJobSubmitter(one_subject_job_submitter.OneSubjectJobSubmitter):
                                    self._output_resource_name,
                                    self.PIPELINE_NAME, leave_subject_id_level=True)
 
-        # Submit the job to get the data
+        # Queue the job to get the data
+        prior_job = None
         if processing_stage >= ProcessingStage.GET_DATA:
-
-            get_data_submit_cmd = 'qsub ' + self._get_data_script_name()
-            logger.info("get_data_submit_cmd: " + get_data_submit_cmd)
-
-            completed_get_data_submit_process = subprocess.run(
-                get_data_submit_cmd, shell=True, check=True, stdout=subprocess.PIPE,
-                universal_newlines=True)
-            get_data_job_no = str_utils.remove_ending_new_lines(completed_get_data_submit_process.stdout)
-            logger.info("get_data_job_no: " + get_data_job_no)
-
+            prior_job = self.submission_engine.queue(self._get_data_script_name(), prior_job)
+            logger.info("get_data job queued: " + self._get_data_script_name())
         else:
             logger.info("Get data job not submitted")
 
-        # Submit the job to process the data (do the work)
+        # Queue the job to process the data (do the work)
         if processing_stage >= ProcessingStage.PROCESS_DATA:
-
-            work_submit_cmd = 'qsub -W depend=afterok:' + get_data_job_no + ' ' + self._work_script_name()
-            logger.info("work_submit_cmd: " + work_submit_cmd)
-
-            completed_work_submit_process = subprocess.run(
-                work_submit_cmd, shell=True, check=True, stdout=subprocess.PIPE,
-                universal_newlines=True)
-            work_job_no = str_utils.remove_ending_new_lines(completed_work_submit_process.stdout)
-            logger.info("work_job_no: " + work_job_no)
-
+            prior_job = self.submission_engine.queue(self._work_script_name(), prior_job)
+            logger.info("work job queued: " + self._work_script_name())
         else:
             logger.info("Process data job not submitted")
 
-        # Submit job to clean the data                                                                                                                                                              
+        # Queue the job to clean the data
         if processing_stage >= ProcessingStage.CLEAN_DATA:
-
-            clean_submit_cmd = 'qsub -W depend=afterok:' + work_job_no + ' ' + self._clean_data_script_name()
-            logger.info("clean_submit_cmd: " + clean_submit_cmd)
-
-            completed_clean_submit_process = subprocess.run(
-                clean_submit_cmd, shell=True, check=True, stdout=subprocess.PIPE,
-                universal_newlines=True)
-            clean_job_no = str_utils.remove_ending_new_lines(completed_clean_submit_process.stdout)
-            logger.info("clean_job_no: " + clean_job_no)
-
+            prior_job = self.submission_engine.queue(self._clean_data_script_name(), prior_job)
+            logger.info("clean job queued: " + self._clean_data_script_name())
         else:
             logger.info("Clean data job not submitted")
 
-        # Submit job to put the resulting data in the DB                                                                                                                                            
+        # Queue the job to put the resulting data in the DB
         if processing_stage >= ProcessingStage.PUT_DATA:
-
-            put_submit_cmd = 'qsub -W depend=afterok:' + clean_job_no + ' ' + put_script_name
-            logger.info("put_submit_cmd: " + put_submit_cmd)
-            
-            completed_put_submit_process = subprocess.run(
-                put_submit_cmd, shell=True, check=True, stdout=subprocess.PIPE,
-                universal_newlines=True)
-            put_job_no = str_utils.remove_ending_new_lines(completed_put_submit_process.stdout)
-            logger.info("put_job_no: " + put_job_no)
-            
+            prior_job = self.submission_engine.queue(put_script_name, prior_job)
+            logger.info("put job queued: " + put_script_name)
         else:
             logger.info("Put data job not submitted")
+
+        # Submit the queued jobs unless they are being collected (e.g. into job arrays)
+        # with the jobs for other scans
+        self.submit_queued_jobs()
@@ -15,6 +15,7 @@ import glob
 # path changes and import of local modules
 import hcp.hcp7t.subject as hcp7t_subject
 import hcp.archive as hcp_archive
+import utils.file_utils as file_utils
 
 
 # authorship information
@@ -91,8 +92,14 @@ class Hcp7T_Archive(hcp_archive.HcpArchive):
         ret_value += os.sep + self.functional_scan_long_name(scan_name)
         return ret_value
             
-    def FIX_processing_complete(self, hcp7t_subject_info, scan_name, check_for_highres_clean_dtseries=True):
-        """Returns True if the specified scan has completed FIX processing for the specified subject."""
+    def FIX_processing_complete(self, hcp7t_subject_info, scan_name, check_for_highres_clean_dtseries=True,
+                                deep_verify=None):
+        """
+        Returns True if the specified scan has completed FIX processing for the specified subject.
+
+        If deep_verify is set (default: the XNAT_PBS_JOBS_DEEP_VERIFY environment variable),
+        the expected files are also checked for truncation or corruption.
+        """
 
         # If the output resource does not exist, then the processing has not been done.
         if not self.does_FIX_processed_exist(hcp7t_subject_info, scan_name):
@@ -181,16 +188,7 @@ class Hcp7T_Archive(hcp_archive.HcpArchive):
         file_name_list.append(mc_dir + os.sep + 'prefiltered_func_data_mcf_conf.nii.gz')
         file_name_list.append(mc_dir + os.sep + 'prefiltered_func_data_mcf.par')
 
-        for file_name in file_name_list:
-            # inform("Checking for existence of file: " + file_name)
-            if os.path.isfile(file_name):
-                continue
-            # If we get here, the most recently checked file does not exist
-            _inform("FILE DOES NOT EXIST: " + file_name)
-            return False
-
-        # If we get here, all files that were checked exist
-        return True
+        return file_utils.do_all_files_exist(file_name_list, deep_verify=deep_verify)
 
     def is_movie_scan_name(self, scan_name):
         return (self.is_task_scan_name(scan_name) and 'MOVIE' in scan_name)
@@ -214,8 +212,9 @@ class Hcp7T_Archive(hcp_archive.HcpArchive):
 
     def available_movie_preproc_dirs(self, subject_info):
         """Returns a list of full paths to functionally preprocessed MOVIE task scan resources."""
-        dir_list = glob.glob(self.subject_resources_dir_fullpath(subject_info) + '/*' +
-                             self.TASK_SCAN_MARKER + '*MOVIE*' + self.PREPROC_SUFFIX)
+        dir_list = self._glob_resources(
+            subject_info, self.subject_resources_dir_fullpath(subject_info) + '/*' +
+            self.TASK_SCAN_MARKER + '*MOVIE*' + self.PREPROC_SUFFIX)
         return sorted(dir_list)
 
     def available_movie_preproc_names(self, subject_info):
@@ -231,8 +230,9 @@ class Hcp7T_Archive(hcp_archive.HcpArchive):
         """
         Returns a list of full paths to unprocessed retinotopy task scan resources.
         """
-        dir_list = glob.glob(self.subject_resources_dir_fullpath(subject_info) + os.sep + '*' +
-                             self.TASK_SCAN_MARKER + '*RET*' + self.UNPROC_SUFFIX)
+        dir_list = self._glob_resources(
+            subject_info, self.subject_resources_dir_fullpath(subject_info) + os.sep + '*' +
+            self.TASK_SCAN_MARKER + '*RET*' + self.UNPROC_SUFFIX)
         return sorted(dir_list)
 
     def available_retinotopy_unproc_names(self, subject_info):
@@ -249,8 +249,9 @@ class Hcp7T_Archive(hcp_archive.HcpArchive):
     def available_retinotopy_preproc_dirs(self, subject_info):
         """Returns a list of full paths to functionally preprocessed retinotopy task scan
         resources."""
-        dir_list = glob.glob(self.subject_resources_dir_fullpath(subject_info) + '/*' +
-                             self.TASK_SCAN_MARKER + '*RET*' + self.PREPROC_SUFFIX)
+        dir_list = self._glob_resources(
+            subject_info, self.subject_resources_dir_fullpath(subject_info) + '/*' +
+            self.TASK_SCAN_MARKER + '*RET*' + self.PREPROC_SUFFIX)
         return sorted(dir_list)
 
     def available_retinotopy_preproc_dir_full_paths(self, subject_info):
@@ -304,7 +305,7 @@ class Hcp7T_Archive(hcp_archive.HcpArchive):
         return long_scan_name
 
     def available_DeDriftAndResample_HighRes_processed_dirs(self, subject_info):
-        dir_list = glob.glob(self.DeDriftAndResample_HighRes_processed_dir_name(subject_info))
+        dir_list = self._glob_resources(subject_info, self.DeDriftAndResample_HighRes_processed_dir_name(subject_info))
         return sorted(dir_list)
 
     def DeDriftAndResample_HighRes_processed_dir_name(self, subject_info):
@@ -10,7 +10,6 @@ import contextlib
 import os
 import stat
 import subprocess
-import time
 
 # import of third party modules
 
@@ -442,17 +441,12 @@ class OneSubjectJobSubmitter(one_subject_job_submitter.OneSubjectJobSubmitter):
             _inform("  Session: " + self.session)
             _inform("--------------------------------------------------")
 
-            # make sure working directories don't have the same name based on
-            # the same start time by sleeping a few seconds
-            time.sleep(5)
-            current_seconds_since_epoch = int(time.time())
-
             # build the working directory name
             self._working_directory_name = self.build_home
             self._working_directory_name += os.sep + self.project
             self._working_directory_name += os.sep + self.PIPELINE_NAME
             self._working_directory_name += '.' + self.subject
-            self._working_directory_name += '.' + str(current_seconds_since_epoch)
+            self._working_directory_name += '.' + os_utils.unique_time_stamp()
 
             # make the working directory
             _inform("making working directory: " + self._working_directory_name)
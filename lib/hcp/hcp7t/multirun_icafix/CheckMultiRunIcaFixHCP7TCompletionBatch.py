@@ -2,12 +2,14 @@
 
 # import of built-in modules
 import datetime
+import functools
 import logging
 import os
 
 # import of third-party modules
 
 # import of local modules
+import ccf.batch_check_runner as batch_check_runner
 import hcp.hcp7t.archive as hcp7t_archive
 import hcp.hcp7t.multirun_icafix.one_subject_completion_checker as one_subject_completion_checker
 import hcp.hcp7t.multirun_icafix.one_subject_prereq_checker as one_subject_prereq_checker
@@ -53,6 +55,39 @@ def _write_subject_info(output_file, project, subject_id, prereqs_met,
     output_file.write(subject_line + os.linesep)
 
     
+def _check_subject(archive, completion_checker, prereq_checker, bypass_mark, verbose,
+                   subject, queued_or_running):
+    subject_id = subject.subject_id
+    project = subject.project
+
+    prereqs_met = prereq_checker.are_prereqs_met(archive, subject)
+
+    if completion_checker.does_processed_resource_exist(archive, subject):
+        resource_exists = True
+
+        fullpath = archive.multirun_icafix_proc_dir_full_path(subject)
+        resource = archive.multirun_icafix_proc_dir_name(subject)
+
+        timestamp = os.path.getmtime(fullpath)
+        resource_date = datetime.datetime.fromtimestamp(timestamp).strftime(DATE_FORMAT)
+
+        if bypass_mark:
+            files_exist = completion_checker.is_processing_complete(archive, subject,
+                                                                    verbose=verbose)
+        else:
+            files_exist = completion_checker.is_processing_marked_complete(archive, subject)
+
+    else:
+        resource = DNM
+        resource_exists = False
+        resource_date = NA
+        files_exist = False
+
+    return (project, subject_id, prereqs_met,
+            resource, resource_exists, resource_date,
+            files_exist, queued_or_running)
+
+
 if __name__ == "__main__":
 
     parser = my_argparse.MyArgumentParser(
@@ -65,6 +100,7 @@ if __name__ == "__main__":
                         required=False, default=False)
     parser.add_argument('-v', '--verbose', dest='verbose', action='store_true',
                         required=False, default=False)
+    batch_check_runner.add_arguments(parser)
 
     # parse the command line arguments
     args = parser.parse_args()
@@ -96,34 +132,13 @@ if __name__ == "__main__":
     prereq_checker = one_subject_prereq_checker.OneSubjectPrereqChecker()
     running_checker = one_subject_run_status_checker.OneSubjectRunStatusChecker()
 
-    for subject in subject_list:
-        subject_id = subject.subject_id
-        project = subject.project
-
-        prereqs_met = prereq_checker.are_prereqs_met(archive, subject)
-        queued_or_running = running_checker.get_queued_or_running(subject)
+    # check the running markers for the whole list at once
+    queued_or_running_list = running_checker.get_queued_or_running_list(subject_list)
 
-        if completion_checker.does_processed_resource_exist(archive, subject):
-            resource_exists = True
+    # check the subjects (in parallel if requested), writing the results in subject list order
+    check_subject = functools.partial(_check_subject, archive, completion_checker, prereq_checker,
+                                      args.bypass_mark, args.verbose)
+    runner = batch_check_runner.BatchCheckRunner(args.jobs, args.use_processes)
 
-            fullpath = archive.multirun_icafix_proc_dir_full_path(subject)
-            resource = archive.multirun_icafix_proc_dir_name(subject)
-
-            timestamp = os.path.getmtime(fullpath)
-            resource_date = datetime.datetime.fromtimestamp(timestamp).strftime(DATE_FORMAT)
-    
-            if args.bypass_mark:
-                files_exist = completion_checker.is_processing_complete(archive, subject,
-                                                                        verbose=args.verbose)
-            else:
-                files_exist = completion_checker.is_processing_marked_complete(archive, subject)
-
-        else:
-            resource = DNM
-            resource_exists = False
-            resource_date = NA
-            files_exist = False
-
-        _write_subject_info(output_file, project, subject_id, prereqs_met,
-                            resource, resource_exists, resource_date,
-                            files_exist, queued_or_running)
+    for subject_info in runner.run(check_subject, zip(subject_list, queued_or_running_list)):
+        _write_subject_info(output_file, *subject_info)
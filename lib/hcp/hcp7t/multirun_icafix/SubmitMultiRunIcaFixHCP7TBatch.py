@@ -8,6 +8,7 @@ import logging
 
 # import of local modules
 import ccf.batch_submitter as batch_submitter
+import ccf.running_status_index as ccf_running_status_index
 import hcp.hcp7t.archive as hcp7t_archive
 import hcp.hcp7t.multirun_icafix.one_subject_job_submitter as one_subject_job_submitter
 import hcp.hcp7t.multirun_icafix.one_subject_run_status_checker as one_subject_run_status_checker
@@ -35,83 +36,89 @@ class BatchSubmitter(batch_submitter.BatchSubmitter):
 
     def submit_jobs(self, username, password, subject_list, config, force_submission=False):
 
-        # submit jobs for the listed subjects
-        for subject in subject_list:
-
-            run_status_checker = one_subject_run_status_checker.OneSubjectRunStatusChecker()
-            if not force_submission and run_status_checker.get_queued_or_running(subject):
-                print("-----")
-                print("\t  NOT SUBMITTING JOBS FOR")
-                print("\t                project: " + subject.project)
-                print("\t                subject: " + subject.subject_id)
-                print("\t                  extra: " + subject.extra)
-                print("\t structural ref project: " + subject.structural_reference_project)
-                print("\t JOBS ARE ALREADY QUEUED OR RUNNING")
-                continue
-            
-            submitter = one_subject_job_submitter.OneSubjectJobSubmitter(
-                self._archive, self._archive.build_home)
-
-            put_server = 'http://db-shadow' + str(self.get_and_inc_shadow_number()) + '.nrg.mir:8080'
-
-            # get information for the subject from the configuration
-            clean_output_first = config.get_bool_value(subject.subject_id, 'CleanOutputFirst')
-            processing_stage_str = config.get_value(subject.subject_id, 'ProcessingStage')
-            processing_stage = submitter.processing_stage_from_string(processing_stage_str)
-            walltime_limit_hrs = config.get_value(subject.subject_id, 'WalltimeLimitHours')
-            mem_limit_gbs = config.get_value(subject.subject_id, 'MemLimitGbs')
-            vmem_limit_gbs = config.get_value(subject.subject_id, 'VmemLimitGbs')
-            output_resource_suffix = config.get_value(subject.subject_id, 'OutputResourceSuffix')
-
-            print("-----")
-            print("\tSubmitting", submitter.PIPELINE_NAME, "jobs for:")
-            print("\t                project:", subject.project)
-            print("\t      reference project:", subject.structural_reference_project)
-            print("\t                subject:", subject.subject_id)
-            print("\t                  extra:", subject.extra)
-            print("\t structural ref project:", subject.structural_reference_project)
-            print("\t             put_server:", put_server)
-            print("\t     clean_output_first:", clean_output_first)
-            print("\t       processing_stage:", processing_stage)
-            print("\t     walltime_limit_hrs:", walltime_limit_hrs)
-            print("\t          mem_limit_gbs:", mem_limit_gbs)
-            print("\t         vmem_limit_gbs:", vmem_limit_gbs)
-            print("\t output_resource_suffix:", output_resource_suffix)
-
-            # user and server information
-            submitter.username = username
-            submitter.password = password
-            submitter.server = 'https://' + os_utils.getenv_required('XNAT_PBS_JOBS_XNAT_SERVER')
-
-            # subject and project information
-            submitter.project = subject.project
-            submitter.structural_reference_project = subject.structural_reference_project
-            submitter.subject = subject.subject_id
-            submitter.session = subject.subject_id + '_7T'
-            submitter.classifier = '7T'
-
-            avail_retinotopy_task_names = self._archive.available_retinotopy_preproc_names(subject)
-            avail_retinotopy_task_names = sorted(avail_retinotopy_task_names,
-                                                 key=one_subject_job_submitter.retinotopy_presentation_order_key)
-            concat_spec = '_'.join(list(map(one_subject_job_submitter.remove_scan_type,
-                                            avail_retinotopy_task_names)))
-            submitter.scan = 'tfMRI_7T_' + concat_spec
+        queued_job_lists = []
+        running_status_index = ccf_running_status_index.RunningStatusIndex()
+
+        try:
+            # submit jobs for the listed subjects
+            for subject in subject_list:
+
+                run_status_checker = one_subject_run_status_checker.OneSubjectRunStatusChecker()
+                if not force_submission and run_status_checker.get_queued_or_running(subject, running_status_index):
+                    print("-----")
+                    print("\t  NOT SUBMITTING JOBS FOR")
+                    print("\t                project: " + subject.project)
+                    print("\t                subject: " + subject.subject_id)
+                    print("\t                  extra: " + subject.extra)
+                    print("\t structural ref project: " + subject.structural_reference_project)
+                    print("\t JOBS ARE ALREADY QUEUED OR RUNNING")
+                    continue
             
-            # job parameters
-            submitter.clean_output_resource_first = clean_output_first
-            submitter.put_server = put_server
-            submitter.walltime_limit_hours = walltime_limit_hrs
-            submitter.mem_limit_gbs = mem_limit_gbs
-            submitter.vmem_limit_gbs = vmem_limit_gbs
-            submitter.output_resource_suffix = output_resource_suffix
+                submitter = one_subject_job_submitter.OneSubjectJobSubmitter(
+                    self._archive, self._archive.build_home)
 
-            # submit jobs
-            submitted_job_list = submitter.submit_jobs(processing_stage)
+                put_server = 'http://db-shadow' + str(self.get_and_inc_shadow_number()) + '.nrg.mir:8080'
 
-            for job in submitted_job_list:
-                print("\tsubmitted jobs: ", str(job))
+                # get information for the subject from the configuration
+                clean_output_first = config.get_bool_value(subject.subject_id, 'CleanOutputFirst')
+                processing_stage_str = config.get_value(subject.subject_id, 'ProcessingStage')
+                processing_stage = submitter.processing_stage_from_string(processing_stage_str)
+                walltime_limit_hrs = config.get_value(subject.subject_id, 'WalltimeLimitHours')
+                mem_limit_gbs = config.get_value(subject.subject_id, 'MemLimitGbs')
+                vmem_limit_gbs = config.get_value(subject.subject_id, 'VmemLimitGbs')
+                output_resource_suffix = config.get_value(subject.subject_id, 'OutputResourceSuffix')
 
-            print("-----")
+                print("-----")
+                print("\tSubmitting", submitter.PIPELINE_NAME, "jobs for:")
+                print("\t                project:", subject.project)
+                print("\t      reference project:", subject.structural_reference_project)
+                print("\t                subject:", subject.subject_id)
+                print("\t                  extra:", subject.extra)
+                print("\t structural ref project:", subject.structural_reference_project)
+                print("\t             put_server:", put_server)
+                print("\t     clean_output_first:", clean_output_first)
+                print("\t       processing_stage:", processing_stage)
+                print("\t     walltime_limit_hrs:", walltime_limit_hrs)
+                print("\t          mem_limit_gbs:", mem_limit_gbs)
+                print("\t         vmem_limit_gbs:", vmem_limit_gbs)
+                print("\t output_resource_suffix:", output_resource_suffix)
+
+                # user and server information
+                submitter.username = username
+                submitter.password = password
+                submitter.server = 'https://' + os_utils.getenv_required('XNAT_PBS_JOBS_XNAT_SERVER')
+
+                # subject and project information
+                submitter.project = subject.project
+                submitter.structural_reference_project = subject.structural_reference_project
+                submitter.subject = subject.subject_id
+                submitter.session = subject.subject_id + '_7T'
+                submitter.classifier = '7T'
+
+                avail_retinotopy_task_names = self._archive.available_retinotopy_preproc_names(subject)
+                avail_retinotopy_task_names = sorted(avail_retinotopy_task_names,
+                                                     key=one_subject_job_submitter.retinotopy_presentation_order_key)
+                concat_spec = '_'.join(list(map(one_subject_job_submitter.remove_scan_type,
+                                                avail_retinotopy_task_names)))
+                submitter.scan = 'tfMRI_7T_' + concat_spec
+            
+                # job parameters
+                submitter.clean_output_resource_first = clean_output_first
+                submitter.put_server = put_server
+                submitter.walltime_limit_hours = walltime_limit_hrs
+                submitter.mem_limit_gbs = mem_limit_gbs
+                submitter.vmem_limit_gbs = vmem_limit_gbs
+                submitter.output_resource_suffix = output_resource_suffix
+
+                # queue jobs, they are submitted for the whole batch at once below
+                submitted_job_list = self.queue_jobs(submitter, processing_stage)
+                queued_job_lists.append((subject, submitted_job_list))
+                # all the markers are in one directory per project, so rather than listing
+                # it again for the next subject, just record the marker that was created
+                running_status_index.add(run_status_checker.running_marker_file_full_path(subject))
+        finally:
+            # submit what was queued even if queuing the jobs for a later subject failed
+            self.submit_queued_jobs(queued_job_lists)
 
 
 def do_submissions(userid, password, subject_list, force_submission=False):
@@ -227,7 +227,7 @@ class OneSubjectJobSubmitter(one_subject_job_submitter.OneSubjectJobSubmitter):
 
             os.chmod(script_name, stat.S_IRWXU | stat.S_IRWXG)
 
-    def mark_running_status(self, stage):
+    def mark_running_status(self, stage, running=True):
         module_logger.debug(debug_utils.get_name())
 
         if stage > ccf_processing_stage.ProcessingStage.PREPARE_SCRIPTS:
@@ -243,7 +243,7 @@ class OneSubjectJobSubmitter(one_subject_job_submitter.OneSubjectJobSubmitter):
             if self.scan:
                 mark_cmd += ' --scan=' + self.scan
             
-            mark_cmd += ' --queued'
+            mark_cmd += ' --queued' if running else ' --not-queued'
 
             completed_mark_cmd_process = subprocess.run(
                 mark_cmd, shell=True, check=True, stdout=subprocess.PIPE, universal_newlines=True)
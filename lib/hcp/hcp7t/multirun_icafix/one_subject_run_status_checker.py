@@ -1,12 +1,13 @@
 #!/usr/bin/env python3
 
 # import of built-in modules
-import platform
 import os
 
 # import of third-party modules
 
 # import of local modules
+import ccf.queue_snapshot as queue_snapshot
+import ccf.running_status_index as ccf_running_status_index
 import hcp.hcp7t.multirun_icafix.one_subject_job_submitter as one_subject_job_submitter
 
 # authorship information
@@ -40,37 +41,31 @@ class OneSubjectRunStatusChecker():
         path = running_status_dir + os.sep + subject_info.project + os.sep + file_name
         return path
 
-    def get_queued_or_running(self, subject_info):
-        return os.path.exists(self._path_to_running_marker_file(subject_info))
+    def running_marker_file_full_path(self, subject_info):
+        return self._path_to_running_marker_file(subject_info)
 
-    def get_run_status(self, subject_info):
-
-        session_name = subject_info.subject_id + '_' + '7T'
-
-        USER = os.getev('USER')
-        if not USER:
-            raise RuntimeError("Environment variable USER must be set")
+    def running_marker_dir_full_path(self, subject_info):
+        return os.path.dirname(self._path_to_running_marker_file(subject_info))
 
-        qstat_running_cmd = 'qstat -u ' + USER
-        qstat_running_cmd += ' | grep ' + subject_info.subject_id + '.MultiRunI'
-        qstat_running_cmd += ' | grep " R "'
+    def get_queued_or_running(self, subject_info, running_status_index=None):
+        path = self._path_to_running_marker_file(subject_info)
+        if running_status_index is None:
+            return os.path.exists(path)
+        return running_status_index.exists(path)
 
-        qstat_stream = platform.popen(qstat_running_cmd, "r")
-        qstat_results = qstat_stream.readline()
-        qstat_stream.close()
+    def get_queued_or_running_list(self, subject_info_list):
+        index = ccf_running_status_index.RunningStatusIndex()
+        return [self.get_queued_or_running(subject_info, index) for subject_info in subject_info_list]
 
-        if qstat_results:
-            return 'R'
-
-        qstat_queued_cmd = 'qstat -u ' + USER
-        qstat_queued_cmd += ' | grep ' + subject_info.subject_id + '.MultiRunI'
-        qstat_queued_cmd += ' | grep " Q "'
-
-        qstat_stream = platform.popen(qstat_queued_cmd, "r")
-        qstat_results = qstat_stream.readline()
-        qstat_stream.close()
+    def get_run_status(self, subject_info):
 
-        if qstat_results:
-            return 'Q'
+        USER = os.getenv('USER')
+        if not USER:
+            raise RuntimeError("Environment variable USER must be set")
 
-        return None
+        snapshot = queue_snapshot.get_shared_snapshot()
+        run_status = snapshot.get_run_status(USER, self.PIPELINE_NAME, subject_info.subject_id + '_' + '7T')
+        if run_status is None and self.get_queued_or_running(subject_info):
+            # its jobs may be members of job arrays spanning several subjects
+            run_status = snapshot.get_run_status(USER, self.PIPELINE_NAME, queue_snapshot.JOB_ARRAY_NAME)
+        return run_status
@@ -12,7 +12,6 @@ import logging
 import os
 import stat
 import subprocess
-import time
 
 # import of third party modules
 
@@ -446,9 +445,6 @@ class OneSubjectJobSubmitter(one_subject_job_submitter.OneSubjectJobSubmitter):
                 logger.info("    Stage: " + str(processing_stage))
                 logger.info("--------------------------------------------------")
 
-                # make sure working directories do not have the same name based on
-                # the same start time by sleeping a few seconds
-                time.sleep(5)
 
                 # build the working directory name
                 self._working_directory_name = \
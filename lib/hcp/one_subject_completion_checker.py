@@ -40,5 +40,5 @@ class OneSubjectCompletionChecker(abc.ABC):
 	def is_processing_complete(self, archive, subject_info, verbose):
 		pass
 
-	def do_all_files_exist(self, file_name_list, verbose=False):
-		return file_utils.do_all_files_exist(file_name_list, verbose)
+	def do_all_files_exist(self, file_name_list, verbose=False, deep_verify=None):
+		return file_utils.do_all_files_exist(file_name_list, verbose, deep_verify=deep_verify)
@@ -10,11 +10,11 @@ import abc
 import contextlib
 import os
 import stat
-import time
 
 # import of third-party modules
 
 # import of local modules
+import ccf.job_submission_engine as job_submission_engine
 import utils.os_utils as os_utils
 import utils.str_utils as str_utils
 
@@ -31,6 +31,23 @@ def _inform(msg):
     print(os.path.basename(__file__) + ": " + msg)
 
 
+def submit_as_job_arrays(submitters, array_script_dir, *args, **kwargs):
+    """Submits the jobs for several (fully configured) submitters, e.g. one per scan
+    for the ReApplyFix submitter, with each processing stage for all of them submitted
+    as one PBS job array instead of as individual job chains.
+
+    :param submitters: the OneSubjectJobSubmitter objects whose jobs are to be submitted
+    :param array_script_dir: directory in which to write the job array wrapper scripts
+    :param args, kwargs: passed on to the submit_jobs method of each submitter
+    :return: list of the jobs submitted
+    """
+    with job_submission_engine.JobArraySubmissionEngine(array_script_dir) as engine:
+        for submitter in submitters:
+            submitter.submission_engine = engine
+            submitter.submit_jobs(*args, **kwargs)
+        return engine.submit()
+
+
 class OneSubjectJobSubmitter(abc.ABC):
     """This class is an abstract base class for classes that are used
     to submit jobs for one pipeline for one subject.
@@ -56,6 +73,9 @@ class OneSubjectJobSubmitter(abc.ABC):
         self._xnat_pbs_jobs_home = os_utils.getenv_required('XNAT_PBS_JOBS')
         self._log_dir = os_utils.getenv_required('XNAT_PBS_JOBS_LOG_DIR')
 
+        self._submission_engine = None
+        self._owns_submission_engine = False
+
     @property
     @abc.abstractmethod
     def PIPELINE_NAME(self):
@@ -81,15 +101,41 @@ class OneSubjectJobSubmitter(abc.ABC):
         """Returns the directory in which to place PUT logs."""
         return self._log_dir
 
+    @property
+    def submission_engine(self):
+        """Returns the engine through which this submitter's jobs are submitted.
+
+        If no engine has been set (e.g. shared by a batch submitter or set to a
+        job array engine), this submitter creates and owns its own engine.
+        """
+        if self._submission_engine is None:
+            self._submission_engine = job_submission_engine.SubmissionEngine()
+            self._owns_submission_engine = True
+        return self._submission_engine
+
+    @submission_engine.setter
+    def submission_engine(self, value):
+        self._submission_engine = value
+        self._owns_submission_engine = False
+
+    def submit_queued_jobs(self):
+        """Submits the queued jobs now if this submitter owns its submission engine.
+        Otherwise, whoever shared the engine is responsible for submitting them.
+        """
+        if self._owns_submission_engine:
+            try:
+                self.submission_engine.submit()
+            finally:
+                self.submission_engine.close()
+
     def build_working_directory_name(self, project, pipeline_name, subject_id, scan=None):
-        current_seconds_since_epoch = int(time.time())
         wdir = self.build_home
         wdir += os.sep + project
         wdir += os.sep + pipeline_name
         wdir += '.' + subject_id
         if scan:
             wdir += '.' + scan
-        wdir += '.' + str(current_seconds_since_epoch)
+        wdir += '.' + os_utils.unique_time_stamp()
         return wdir
 
     def create_put_script(self, put_script_name, username, password, put_server, project, subject, session,
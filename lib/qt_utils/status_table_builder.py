@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+"""
+qt_utils/status_table_builder.py: Build the rows of a Control panel status table
+in worker threads.
+
+Determining the status of a row (prerequisites, completion, run status) means
+checking the file system, which can take minutes for a long subjects file. A
+StatusTableBuilder does those checks in a thread pool and reports each row back
+to the GUI thread (as a Qt signal) as soon as it is available, so the table can
+be filled in incrementally while the GUI stays responsive.
+"""
+
+# import of built-in modules
+import concurrent.futures
+import logging
+import os
+import threading
+
+# import of third-party modules
+from PyQt5.QtCore import QObject
+from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtCore import pyqtSlot
+from PyQt5.QtWidgets import QApplication
+
+# import of local modules
+
+# authorship information
+__author__ = "Timothy B. Brown"
+__copyright__ = "Copyright 2020, The Connectome Coordination Facility (CCF)"
+__maintainer__ = "Junil Chang"
+
+# create a module logger
+module_logger = logging.getLogger(__name__)
+module_logger.setLevel(logging.WARNING)  # Note: This can be overidden by log file configuration
+
+# number of worker threads, can be set with the XNAT_PBS_JOBS_STATUS_WORKERS environment variable
+DEFAULT_MAX_WORKERS = 8
+
+
+class StatusTableBuilder(QObject):
+    """
+    Builds status items for a list of subjects in a pool of worker threads.
+
+    Starting a new build cancels any build that is still in progress. Results
+    from a cancelled build are never reported.
+
+    Signals (all emitted in the thread the builder lives in, i.e. the GUI thread):
+
+    status_item_ready(row, status_item) -- the status item for a row is available
+    progress(done, total) -- number of rows done so far out of the total
+    finished() -- all rows of the current build are done
+    """
+
+    status_item_ready = pyqtSignal(int, object)
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal()
+
+    # emitted by the worker threads, delivered to the builder's thread as a queued signal
+    _row_done = pyqtSignal(int, int, object)
+
+    def __init__(self, max_workers=None, parent=None):
+        super().__init__(parent)
+
+        if max_workers is None:
+            max_workers = int(os.getenv('XNAT_PBS_JOBS_STATUS_WORKERS', DEFAULT_MAX_WORKERS))
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self._generation = 0
+        self._cancel_event = None
+        self._futures = []
+        self._total = 0
+        self._done = 0
+
+        self._row_done.connect(self._on_row_done)
+
+        application = QApplication.instance()
+        if application:
+            application.aboutToQuit.connect(self.shutdown)
+
+    @property
+    def in_progress(self):
+        return self._done < self._total
+
+    def start(self, subject_list, build_status_item):
+        """
+        Start building the status items for the specified subjects.
+
+        build_status_item is called (in a worker thread) with each subject and
+        must return the status item for that subject.
+        """
+        self.cancel()
+
+        self._generation += 1
+        self._cancel_event = threading.Event()
+        self._total = len(subject_list)
+        self._done = 0
+
+        for row, subject in enumerate(subject_list):
+            self._futures.append(self._executor.submit(
+                self._build_row, self._generation, self._cancel_event, row, subject, build_status_item))
+
+        self.progress.emit(self._done, self._total)
+        if not subject_list:
+            self.finished.emit()
+
+    def cancel(self):
+        """Cancel the build that is in progress (if any)."""
+        if self._cancel_event:
+            self._cancel_event.set()
+        for future in self._futures:
+            future.cancel()
+        self._futures = []
+        self._total = 0
+        self._done = 0
+
+    @pyqtSlot()
+    def shutdown(self):
+        """Cancel the build in progress and stop the worker threads."""
+        self.cancel()
+        self._executor.shutdown(wait=False)
+
+    def _build_row(self, generation, cancel_event, row, subject, build_status_item):
+        if cancel_event.is_set():
+            return
+
+        try:
+            status_item = build_status_item(subject)
+        except Exception:
+            module_logger.exception("Unable to determine status for: " + str(subject))
+            status_item = None
+
+        if not cancel_event.is_set():
+            self._row_done.emit(generation, row, status_item)
+
+    @pyqtSlot(int, int, object)
+    def _on_row_done(self, generation, row, status_item):
+        if generation != self._generation or not self.in_progress:
+            # result from a build that has been cancelled or superseded
+            return
+
+        self._done += 1
+        if status_item is not None:
+            self.status_item_ready.emit(row, status_item)
+        self.progress.emit(self._done, self._total)
+
+        if self._done == self._total:
+            self._futures = []
+            self.finished.emit()
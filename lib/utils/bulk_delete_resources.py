@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+"""
+utils/bulk_delete_resources.py: Delete many DB resources at once.
+
+The deletions (e.g. a set of resources for every session in a subject list)
+are all issued concurrently, up to a maximum number at a time, through one
+shared XnatClient (see xnat/xnat_access.py). So they share one authenticated
+JSESSION, one pool of kept-alive connections, and one session ID lookup per
+project, and each DELETE is retried (with backoff) if it fails for a transient
+reason. In dry run mode the deletions are resolved and reported but not done.
+"""
+
+# import of built-in modules
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import getpass
+import os
+import sys
+
+# import of third party modules
+import requests
+
+# import of local modules
+import ccf.subject as ccf_subject
+import utils.my_argparse as my_argparse
+import utils.os_utils as os_utils
+import utils.str_utils as str_utils
+import utils.user_utils as user_utils
+import xnat.xnat_access as xnat_access
+
+# authorship information
+__author__ = "Timothy B. Brown"
+__copyright__ = "Copyright 2020, The Connectome Coordination Facility (CCF)"
+__maintainer__ = "Junil Chang"
+
+# maximum number of deletions in progress at once
+DEFAULT_MAX_CONCURRENT = 8
+
+# deletion result statuses
+DELETED = 'DELETED'
+NOT_FOUND = 'NOT_FOUND'
+FAILED = 'FAILED'
+DRY_RUN = 'DRY_RUN'
+
+ResourceDeletion = collections.namedtuple('ResourceDeletion', ['project', 'subject', 'session', 'resource'])
+
+DeletionResult = collections.namedtuple('DeletionResult', ['deletion', 'status', 'message'])
+
+
+def _inform(msg):
+	"""Inform the user of this program by outputing a message that is prefixed by the file name.
+
+	:param msg: Message to output
+	:type msg: str
+	"""
+	print(os.path.basename(__file__) + ": " + msg)
+
+
+def deletions_for_subjects(subject_info_list, resource_names):
+	"""List of ResourceDeletions of each of the named resources for each of the specified subjects"""
+	deletions = []
+	for subject_info in subject_info_list:
+		session = subject_info.subject_id + '_' + subject_info.classifier
+		for resource in resource_names:
+			deletions.append(ResourceDeletion(subject_info.project, subject_info.subject_id, session, resource))
+	return deletions
+
+
+def read_deletions(file_name):
+	"""List of the ResourceDeletions in a file of tab separated project, subject, session, resource lines"""
+	deletions = []
+	with open(file_name, 'r') as input_file:
+		for line in input_file:
+			line = str_utils.remove_ending_new_lines(line).strip()
+			if line != '' and line[0] != '#':
+				deletions.append(ResourceDeletion(*line.split('\t')))
+	return deletions
+
+
+def _resource_url(deletion, session_id):
+	return ('/REST/projects/' + deletion.project + '/subjects/' + deletion.subject +
+			'/experiments/' + session_id + '/resources/' + deletion.resource)
+
+
+def _delete_resource(client, deletion, dry_run):
+	try:
+		session_id = client.get_session_id(deletion.project, deletion.subject, deletion.session)
+		if session_id == xnat_access.SESSION_ID_NOT_FOUND:
+			return DeletionResult(deletion, NOT_FOUND, "no such session")
+
+		resource_url = _resource_url(deletion, session_id)
+		if dry_run:
+			return DeletionResult(deletion, DRY_RUN, "DELETE " + client.url(resource_url) + "?removeFiles=true")
+
+		response = client.delete(resource_url, params={'removeFiles': 'true'})
+
+	except requests.RequestException as e:
+		return DeletionResult(deletion, FAILED, str(e))
+
+	if response.status_code == 404:
+		return DeletionResult(deletion, NOT_FOUND, "no such resource")
+	if response.status_code >= 400:
+		return DeletionResult(deletion, FAILED, "status code: " + str(response.status_code))
+	return DeletionResult(deletion, DELETED, "")
+
+
+def _prefetch_session_ids(client, project):
+	"""Look up the session IDs of a project, returning a description of the failure, if any"""
+	try:
+		client.prefetch_session_ids(project)
+	except requests.RequestException as e:
+		_inform("Unable to look up the sessions in project: " + project + ": " + str(e))
+		return str(e)
+	return None
+
+
+async def _failed(deletion, message):
+	return DeletionResult(deletion, FAILED, message)
+
+
+async def _delete_all(client, deletions, max_concurrent, dry_run, report):
+	loop = asyncio.get_running_loop()
+	results = []
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrent) as executor:
+		# look up the session IDs of each project once, before the deletions start
+		projects = sorted(set(deletion.project for deletion in deletions))
+		failures = await asyncio.gather(*[loop.run_in_executor(executor, _prefetch_session_ids, client, project)
+										  for project in projects])
+		# the deletions in projects whose sessions could not be looked up fail without another try
+		failed_projects = {project: failure for (project, failure) in zip(projects, failures) if failure}
+
+		pending = [_failed(deletion, failed_projects[deletion.project]) if deletion.project in failed_projects else
+				   loop.run_in_executor(executor, functools.partial(_delete_resource, client, deletion, dry_run))
+				   for deletion in deletions]
+
+		for next_done in asyncio.as_completed(pending):
+			result = await next_done
+			results.append(result)
+			if report:
+				print("\t".join(list(result.deletion) + [result.status, result.message]), file=report, flush=True)
+
+	return results
+
+
+def delete_resources(client, deletions, max_concurrent=DEFAULT_MAX_CONCURRENT, dry_run=False, report=sys.stdout):
+	"""
+	Delete the resources specified by a list of ResourceDeletions (all at once, up
+	to max_concurrent at a time). A tab separated line for each deletion is
+	written to report as it finishes.
+
+	Returns the list of DeletionResults (in the order the deletions finished).
+	"""
+	if not deletions:
+		return []
+	return asyncio.run(_delete_all(client, deletions, max_concurrent, dry_run, report))
+
+
+def summarize(results):
+	"""Dictionary of the number of deletion results with each status"""
+	return collections.Counter(result.status for result in results)
+
+
+def main():
+	# create a parser object for getting the command line options
+	parser = my_argparse.MyArgumentParser(description="Program to delete many DB resources at once.")
+
+	# mandatory arguments
+	parser.add_argument('-u', '--user', dest='user', required=True, type=str)
+
+	# the resources to delete are either every specified resource name for every
+	# subject in a subject file, or the lines of a tab separated input file
+	group = parser.add_mutually_exclusive_group(required=True)
+	group.add_argument('-s', '--subject-file', dest='subject_file', type=str)
+	group.add_argument('-i', '--input-file', dest='input_file', type=str)
+
+	# optional arguments
+	parser.add_argument('-r', '--resource', dest='resources', action='append', default=[], type=str)
+	parser.add_argument('-ser', '--server', dest='server', required=False,
+						default='https://' + os_utils.getenv_required('XNAT_PBS_JOBS_XNAT_SERVER'),
+						type=str)
+	parser.add_argument('-pw', '--password', dest='password', required=False, type=str)
+	parser.add_argument('-j', '--max-concurrent', dest='max_concurrent', required=False, type=int,
+						default=DEFAULT_MAX_CONCURRENT)
+	parser.add_argument('-n', '--dry-run', dest='dry_run', action='store_true', required=False, default=False)
+	parser.add_argument('-f', '--force', dest='force', action='store_true', required=False, default=False)
+	parser.add_argument('-o', '--report', dest='report', required=False, type=str)
+
+	# parse the command line arguments
+	args = parser.parse_args()
+
+	if args.subject_file:
+		if not args.resources:
+			parser.error("at least one --resource must be specified with --subject-file")
+		subject_info_list = ccf_subject.read_subject_info_list(args.subject_file, separator=":")
+		deletions = deletions_for_subjects(subject_info_list, args.resources)
+	else:
+		deletions = read_deletions(args.input_file)
+
+	if args.password:
+		password = args.password
+	else:
+		password = getpass.getpass("Password: ")
+
+	# show parsed arguments
+	_inform("Parsed arguments:")
+	_inform("       Username: " + args.user)
+	_inform("       Password: " + "*** password mask ***")
+	_inform("         Server: " + args.server)
+	_inform("      Deletions: " + str(len(deletions)))
+	_inform(" Max Concurrent: " + str(args.max_concurrent))
+	_inform("        Dry Run: " + str(args.dry_run))
+
+	if not args.dry_run and not args.force and not user_utils.should_proceed():
+		args.dry_run = True
+
+	client = xnat_access.get_client(str_utils.get_server_name(args.server), args.user, password, scheme='https')
+
+	with contextlib.ExitStack() as stack:
+		if args.report:
+			report = stack.enter_context(open(args.report, 'w'))
+		else:
+			report = sys.stdout
+
+		results = delete_resources(client, deletions, args.max_concurrent, args.dry_run, report)
+
+	for status, count in sorted(summarize(results).items()):
+		_inform(status + ": " + str(count))
+
+	if any(result.status == FAILED for result in results):
+		sys.exit(1)
+
+
+if __name__ == '__main__':
+	main()
@@ -2,6 +2,7 @@
 
 # import of built-in modules
 import sys
+import time
 
 # import of third-party modules
 
@@ -22,7 +23,10 @@ def main():
     
     args = parser.parse_args()
     
-    file_utils.make_all_links_into_copies(args.full_path, verbose=args.verbose)
+    start_time = time.monotonic()
+    (links, copied_bytes) = file_utils.make_all_links_into_copies(args.full_path, verbose=args.verbose)
+    print("Made " + str(links) + " links into copies, " + file_utils.human_readable_byte_size(copied_bytes) +
+          "B copied, in " + "%.1f" % (time.monotonic() - start_time) + " seconds")
     
 if __name__ == '__main__':
     main()
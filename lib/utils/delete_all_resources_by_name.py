@@ -13,9 +13,11 @@ import sys
 # import of third party modules
 
 # import of local modules
-import utils.delete_resource as delete_resource
+import utils.bulk_delete_resources as bulk_delete_resources
 import utils.my_argparse as my_argparse
 import utils.os_utils as os_utils
+import utils.str_utils as str_utils
+import xnat.xnat_access as xnat_access
 import xnat.xnat_archive as xnat_archive
 
 # authorship information
@@ -66,6 +68,7 @@ def main():
 
     archive_root = my_xnat_archive.project_archive_root(args.project)
 
+    deletions = []
     dir_list = glob.glob(archive_root + os.sep + '*')
     for directory in sorted(dir_list):
         resource_dir_to_look_for = directory + os.sep + 'RESOURCES' + os.sep + args.resource
@@ -81,9 +84,15 @@ def main():
 
             _inform("Deleting resource: " + args.resource + " for session: " + session)
 
-            delete_resource.delete_resource(args.user, args.password, args.server,
-                                            args.project,  subject,  session,
-                                            args.resource, args.force)
+            deletions.append(bulk_delete_resources.ResourceDeletion(args.project, subject, session, args.resource))
+
+    # all the deletions share one client (and its connections) and are done concurrently,
+    # without --force they are only reported
+    client = xnat_access.get_client(str_utils.get_server_name(args.server), args.user, args.password, scheme='https')
+    results = bulk_delete_resources.delete_resources(client, deletions, dry_run=not args.force)
+
+    for status, count in sorted(bulk_delete_resources.summarize(results).items()):
+        _inform(status + ": " + str(count))
 
 
 if __name__ == '__main__':
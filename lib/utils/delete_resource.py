@@ -5,7 +5,6 @@
 # import of built-in modules
 import getpass
 import os
-import subprocess
 import sys
 
 # import of third party modules
@@ -33,9 +32,11 @@ def _inform(msg):
 
 
 def delete_resource(user, password, server, project, subject, session, resource, perform_delete=True):
+	# the client (and its connections to the server) are shared by all deletions done by this process
+	client = xnat_access.get_client(str_utils.get_server_name(server), user, password, scheme='https')
+
 	# get XNAT session id
-	xnat_session_id = xnat_access.get_session_id(server=str_utils.get_server_name(server), username=user, password=password,
-												 project=project, subject=subject, session=session)
+	xnat_session_id = client.get_session_id(project=project, subject=subject, session=session)
 
 	resource_url = ''
 	resource_url += 'https://' + str_utils.get_server_name(server)
@@ -44,18 +45,6 @@ def delete_resource(user, password, server, project, subject, session, resource,
 	resource_url += '/experiments/' + xnat_session_id
 	resource_url += '/resources/' + resource
 
-	variable_values = '?removeFiles=true'
-
-	resource_uri = resource_url + variable_values
-
-	pipeline_engine = os_utils.getenv_required('XNAT_PBS_JOBS_PIPELINE_ENGINE')
-
-	delete_cmd = 'java -Xmx256m -jar ' + pipeline_engine + os.sep + 'lib' + os.sep + 'XnatDataClient-1.7.6-SNAPSHOT-all.jar'
-	delete_cmd += ' -u ' + user
-	delete_cmd += ' -p ' + password
-	delete_cmd += ' -m DELETE'
-	delete_cmd += ' -r ' + resource_uri
-
 	if perform_delete:
 		_inform("Deleting")
 		_inform("    Server: " + server)
@@ -64,10 +53,10 @@ def delete_resource(user, password, server, project, subject, session, resource,
 		_inform("   Session: " + session)
 		_inform("  Resource: " + resource)
 
-		completed_delete_process = subprocess.run(delete_cmd, shell=True, check=True)
+		client.delete_resource(resource_url)
 
 	else:
-		_inform("delete_cmd: " + delete_cmd)
+		_inform("delete url: " + resource_url + "?removeFiles=true")
 		_inform("Deletion not attempted")
 
 
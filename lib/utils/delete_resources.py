@@ -7,10 +7,11 @@ import os
 # import of third party modules
 
 # import of local modules
-import utils.delete_resource as delete_resource
+import utils.bulk_delete_resources as bulk_delete_resources
 import utils.my_argparse as my_argparse
 import utils.os_utils as os_utils
 import utils.str_utils as str_utils
+import xnat.xnat_access as xnat_access
 
 # authorship information
 __author__ = "Timothy B. Brown"
@@ -59,22 +60,14 @@ def main():
 
     _inform("")
 
-    input_file = open(args.input_file, 'r')
-    for line in input_file:
-        line = str_utils.remove_ending_new_lines(line)
-        line = line.strip()
-        
-        if line != '' and line[0] != '#':
-            (project, subject, session, resource) = line.split('\t')
-            _inform("")
-            _inform("     Project: " + project)
-            _inform("     Subject: " + subject)
-            _inform("     Session: " + session)
-            _inform("    Resource: " + resource)
-            _inform("")
-
-            delete_resource.delete_resource(args.user, password, args.server, 
-                                            project, subject, session, resource)
+    deletions = bulk_delete_resources.read_deletions(args.input_file)
+
+    # all the deletions share one client (and its connections) and are done concurrently
+    client = xnat_access.get_client(str_utils.get_server_name(args.server), args.user, password, scheme='https')
+    results = bulk_delete_resources.delete_resources(client, deletions)
+
+    for status, count in sorted(bulk_delete_resources.summarize(results).items()):
+        _inform(status + ": " + str(count))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+
+"""
+utils/file_integrity.py: Check that expected output files are not truncated or
+corrupt (e.g. by a PUT job that was killed while copying them), not just that
+they exist.
+
+The checks are chosen to read as little of each file as possible:
+
+    .nii            the NIfTI-1/NIfTI-2 header (including the header of a CIFTI
+                    file, e.g. a .dtseries.nii) is read and the file must be at
+                    least as long as the header says the image data needs
+    .nii.gz         the NIfTI header is read (only as much of the file as is
+                    needed to decompress it) along with the gzip trailer (the
+                    last 8 bytes of the file), whose ISIZE field must match the
+                    uncompressed size the header says the image needs
+    other .gz       the whole file is decompressed (which checks the CRC)
+
+If the gzip trailer does not match (as it will not if the file is truncated),
+the whole file is decompressed to tell a truncated or corrupt file from one
+that is just laid out unexpectedly (e.g. written as several gzip members).
+Damage inside the compressed data of a .nii.gz that leaves its trailer intact
+is not found, as that would take decompressing every file. Other files are not
+checked.
+
+The result of checking each file is cached by (path, size, modification time),
+so re-checking a file that has not changed only costs a stat. The cache is kept
+in memory, and also in the SQLite file named by the XNAT_PBS_JOBS_VERIFY_CACHE_DB
+environment variable if that is set.
+"""
+
+# import of built-in modules
+import concurrent.futures
+import gzip
+import logging
+import os
+import sqlite3
+import stat
+import struct
+import threading
+import zlib
+
+# import of third party modules
+
+# import of local modules
+import utils.nifti_header as nifti_header
+
+# authorship information
+__author__ = "Timothy B. Brown"
+__copyright__ = "Copyright 2020, The Connectome Coordination Facility (CCF)"
+__maintainer__ = "Junil Chang"
+
+# create a module logger
+module_logger = logging.getLogger(__name__)
+module_logger.setLevel(logging.WARNING)  # Note: This can be overidden by log file configuration
+
+# environment variable that turns on deep verification in completion checks
+DEEP_VERIFY_VARIABLE = 'XNAT_PBS_JOBS_DEEP_VERIFY'
+
+# default number of files checked at once
+DEFAULT_VERIFY_WORKERS = int(os.getenv('XNAT_PBS_JOBS_VERIFY_WORKERS', '8'))
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# size of the smallest gzip file (10 byte header and 8 byte trailer around an empty stream)
+GZIP_MIN_SIZE = 18
+
+# bytes decompressed at a time when reading through a whole gzip file
+READ_SIZE = 1024 * 1024
+
+# seconds to wait for another process to finish writing to the cache
+BUSY_TIMEOUT = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS verified (
+	path TEXT NOT NULL,
+	size INTEGER NOT NULL,
+	mtime_ns INTEGER NOT NULL,
+	problem TEXT NOT NULL,
+	PRIMARY KEY (path, size, mtime_ns)
+);
+"""
+
+
+def deep_verify_default():
+	"""Whether deep verification is turned on by the XNAT_PBS_JOBS_DEEP_VERIFY environment variable"""
+	return os.getenv(DEEP_VERIFY_VARIABLE, '') not in ('', '0')
+
+
+def _check_gzip_stream(path):
+	"""Decompress the whole of a gzip file, returning a description of the problem with it, if any"""
+	try:
+		with gzip.open(path, 'rb') as gzip_file:
+			while gzip_file.read(READ_SIZE):
+				pass
+	except EOFError:
+		return "truncated (compressed data ends early)"
+	except (OSError, zlib.error) as e:
+		return "corrupt (" + str(e) + ")"
+	return None
+
+
+def _check_gzip_trailer(path, size, expected_isize):
+	"""
+	Check the gzip trailer of a file against the expected uncompressed size,
+	falling back to decompressing the whole file if they do not match
+	"""
+	if size < GZIP_MIN_SIZE:
+		return "truncated (" + str(size) + " bytes is too short for a gzip file)"
+
+	with open(path, 'rb') as gzip_file:
+		magic = gzip_file.read(2)
+		gzip_file.seek(-8, os.SEEK_END)
+		(crc, isize) = struct.unpack('<II', gzip_file.read(8))
+
+	if magic != GZIP_MAGIC:
+		return "not a gzip file"
+
+	if expected_isize is not None and isize == expected_isize % 2**32:
+		return None
+
+	module_logger.debug(path + ": gzip trailer ISIZE " + str(isize) + " does not match expected size " +
+						str(expected_isize) + ", decompressing whole file")
+	return _check_gzip_stream(path)
+
+
+def _nifti_size(header):
+	"""Size (in bytes) of a single file NIfTI image with the specified header"""
+	voxel_count = 1
+	for dim in header.dims:
+		voxel_count *= dim
+	return header.vox_offset + voxel_count * header.bitpix // 8
+
+
+def check_file(path, size=None):
+	"""
+	Check the specified file for truncation or corruption.
+
+	Returns a description of the problem with the file, or None if no problem is found
+	"""
+	if size is None:
+		size = os.stat(path).st_size
+
+	if path.endswith('.nii') or path.endswith('.nii.gz'):
+		try:
+			header = nifti_header.read_header(path)
+		except (ValueError, EOFError, OSError, zlib.error) as e:
+			return "bad NIfTI header (" + str(e) + ")"
+
+		if min(header.dims) < 0 or header.bitpix <= 0:
+			return "bad NIfTI header (dims: " + str(header.dims) + " bitpix: " + str(header.bitpix) + ")"
+
+		expected_size = _nifti_size(header)
+		if path.endswith('.gz'):
+			return _check_gzip_trailer(path, size, expected_size)
+
+		if size < expected_size:
+			return "truncated (" + str(size) + " bytes, header says " + str(expected_size) + ")"
+		return None
+
+	if path.endswith('.gz'):
+		return _check_gzip_trailer(path, size, None)
+
+	return None
+
+
+class VerifyCache(object):
+	"""
+	Cache of the results of check_file keyed by (path, size, modification time).
+
+	A VerifyCache can be shared by threads (each thread uses its own connection
+	to the database, if there is one).
+	"""
+
+	def __init__(self, db_path=None):
+		self._db_path = db_path
+		self._entries = {}
+		self._lock = threading.Lock()
+		self._local = threading.local()
+
+	@property
+	def _connection(self):
+		connection = getattr(self._local, 'connection', None)
+		if connection is None:
+			module_logger.debug("opening verify cache: " + self._db_path)
+			os.makedirs(os.path.dirname(os.path.abspath(self._db_path)), exist_ok=True)
+			connection = sqlite3.connect(self._db_path, timeout=BUSY_TIMEOUT)
+			connection.execute('PRAGMA journal_mode=WAL')
+			connection.execute('PRAGMA synchronous=NORMAL')
+			connection.executescript(_SCHEMA)
+			self._local.connection = connection
+		return connection
+
+	def get(self, key):
+		"""
+		The cached result for the specified (path, size, mtime_ns) key: a problem
+		description, '' if the file was found to be intact, or None if it is not cached
+		"""
+		with self._lock:
+			problem = self._entries.get(key)
+		if problem is not None or self._db_path is None:
+			return problem
+
+		row = self._connection.execute(
+			'SELECT problem FROM verified WHERE path = ? AND size = ? AND mtime_ns = ?', key).fetchone()
+		if row is None:
+			return None
+
+		with self._lock:
+			self._entries[key] = row[0]
+		return row[0]
+
+	def put_all(self, results):
+		"""Cache a dictionary of (path, size, mtime_ns) key to problem description ('' if none)."""
+		with self._lock:
+			self._entries.update(results)
+		if self._db_path is None or not results:
+			return
+
+		with self._connection as connection:
+			# results for earlier versions of the files are of no further use
+			connection.executemany('DELETE FROM verified WHERE path = ?', [(key[0],) for key in results])
+			connection.executemany('INSERT OR REPLACE INTO verified (path, size, mtime_ns, problem) VALUES (?, ?, ?, ?)',
+								   [key + (problem,) for (key, problem) in results.items()])
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache():
+	"""The VerifyCache shared by the checks done by this process"""
+	global _default_cache
+	with _default_cache_lock:
+		if _default_cache is None:
+			_default_cache = VerifyCache(os.getenv('XNAT_PBS_JOBS_VERIFY_CACHE_DB'))
+		return _default_cache
+
+
+def verify_files(file_names, max_workers=None, cache=None):
+	"""
+	Check the specified files for truncation or corruption, in parallel.
+
+	Files that do not exist (or are not regular files) are not checked.
+
+	Returns a dictionary of the name of each file found to have a problem to a
+	description of the problem
+	"""
+	if max_workers is None:
+		max_workers = DEFAULT_VERIFY_WORKERS
+	if cache is None:
+		cache = default_cache()
+
+	problems = {}
+	unchecked = {}
+
+	for file_name in file_names:
+		try:
+			file_stat = os.stat(file_name)
+		except OSError:
+			continue
+		if not stat.S_ISREG(file_stat.st_mode):
+			continue
+
+		key = (os.path.abspath(file_name), file_stat.st_size, file_stat.st_mtime_ns)
+		problem = cache.get(key)
+		if problem is None:
+			unchecked[file_name] = key
+		elif problem:
+			problems[file_name] = problem
+
+	if not unchecked:
+		return problems
+
+	module_logger.debug("verifying " + str(len(unchecked)) + " files (" +
+						str(len(file_names) - len(unchecked)) + " cached)")
+
+	def check(file_name):
+		try:
+			return check_file(file_name, unchecked[file_name][1])
+		except OSError as e:
+			return "unreadable (" + str(e) + ")"
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+		results = dict(zip(unchecked, executor.map(check, unchecked)))
+
+	for (file_name, problem) in results.items():
+		if problem:
+			problems[file_name] = problem
+
+	cache.put_all({unchecked[file_name]: problem if problem else '' for (file_name, problem) in results.items()})
+	return problems
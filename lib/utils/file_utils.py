@@ -3,15 +3,21 @@
 """utils/file_utils.py: Some simple and hopefully useful file related utilities."""
 
 # import of built-in modules
+import concurrent.futures
+import contextlib
 import datetime
 import os
+import re
 import shutil
 import subprocess
 import sys
+import threading
+import time
 
 # import of third-party modules
 
 # import of local modules
+import utils.file_integrity as file_integrity
 import utils.os_utils as os_utils
 import utils.str_utils as str_utils
 
@@ -159,50 +165,99 @@ def make_all_links_into_copies_ext(full_path):
 	print(output)
 
 
+# Number of threads used to copy the files that symbolic links are linked to into
+# the place of the links. As for listing directories, copying files in parallel
+# helps on remote file systems.
+DEFAULT_LINK_COPY_WORKERS = int(os.getenv('XNAT_PBS_JOBS_LINK_COPY_WORKERS', '8'))
+
+# lock so that the messages about each link made into a copy are not interleaved
+_output_lock = threading.Lock()
+
+
 def make_link_into_copy(full_path, verbose=False, output=sys.stdout):
 	"""
 	If the specified full_path is a symbolic link, copy the file it
 	is linked to into the location of the symbolic link. So the
 	full_path specified will now be a copy of the file that it
 	previously was a link to.
+
+	Returns the number of bytes copied.
 	"""
-	if os.path.islink(full_path):
-		linked_to = os.readlink(full_path)
-		if not os.path.isabs(linked_to):
-			linked_to = os.path.dirname(full_path) + os.sep + linked_to
+	if not os.path.islink(full_path):
+		return 0
 
-		if verbose:
+	linked_to = os.readlink(full_path)
+	if not os.path.isabs(linked_to):
+		linked_to = os.path.dirname(full_path) + os.sep + linked_to
+
+	if verbose:
+		with _output_lock:
 			print("  Making............: '", full_path, file=output)
 			print("  A copy of.........: '", linked_to, file=output)
 
-		os.remove(full_path)
-		shutil.copy2(linked_to, full_path)
+	# copy next to the link, then replace the link, so that the link is not lost
+	# if the copy fails
+	temp_path = os.path.dirname(full_path) + os.sep + '.' + os.path.basename(full_path) + '.' + str(os.getpid())
+	try:
+		copied = os_utils.copy_file_data(linked_to, temp_path)
+		shutil.copystat(linked_to, temp_path)
+		os.replace(temp_path, full_path)
+	except BaseException:
+		with contextlib.suppress(FileNotFoundError):
+			os.remove(temp_path)
+		raise
+
+	return copied
 
 
-def make_all_links_into_copies(full_path, verbose=False, output=sys.stdout):
+def _find_file_links(dir_path, verbose, output):
+	"""
+	List of the symbolic links to anything other than directories in the tree
+	rooted at dir_path, found in one pass over the tree (symbolic links to
+	directories are not followed).
+	"""
+	links = []
+	to_scan = [dir_path]
+	while to_scan:
+		scan_path = to_scan.pop()
+		if verbose:
+			print("Checking Directory:", scan_path, file=output)
+		with os.scandir(scan_path) as entries:
+			for entry in entries:
+				if entry.is_dir(follow_symlinks=False):
+					to_scan.append(entry.path)
+				elif entry.is_symlink() and not entry.is_dir():
+					links.append(entry.path)
+	return links
+
+
+def make_all_links_into_copies(full_path, verbose=False, output=sys.stdout, workers=DEFAULT_LINK_COPY_WORKERS):
 	"""
 	If the specified full_path is not a directory and the specified full_path
 	is a symbolic link, convert the full_path to a copy of the previously linked
-	file. If the specified full_path is a directory, then recursively search
-	for symbolic links in the directory tree and convert all of them to
-	copies of their previously linked to files.
+	file. If the specified full_path is a directory, then search the directory
+	tree for symbolic links (to files) and convert all of them to copies of their
+	previously linked to files, workers at a time.
+
+	Returns the number of links made into copies and the number of bytes copied.
 	"""
-	if os.path.isdir(full_path):
-		# walk the directory's contents and recursively call this
-		# function
-		for root, dirs, files in os.walk(full_path):
-			if verbose:
-				print("Checking Directory:", root, file=output)
-			for dir in dirs:
-				next_full_path = '%s%s%s' % (root, os.sep, dir)
-				make_all_links_into_copies(next_full_path, verbose, output)
-			for file in files:
-				next_full_path = '%s%s%s' % (root, os.sep, file)
-				make_all_links_into_copies(next_full_path, verbose, output)
-	else:
+	if not os.path.isdir(full_path):
 		if verbose:
 			print("Checking File.....:", full_path, file=output)
-		make_link_into_copy(full_path, verbose, output)
+		is_link = os.path.islink(full_path)
+		return int(is_link), make_link_into_copy(full_path, verbose, output)
+
+	start_time = time.monotonic()
+	links = _find_file_links(full_path, verbose, output)
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+		total_bytes = sum(executor.map(lambda link: make_link_into_copy(link, verbose, output), links))
+
+	if verbose:
+		print("Made " + str(len(links)) + " links into copies, " + human_readable_byte_size(total_bytes) +
+			  "B copied, in " + "%.1f" % (time.monotonic() - start_time) + " seconds", file=output)
+
+	return len(links), total_bytes
 
 
 def rm_file_if_exists(full_path, verbose=False, output=sys.stdout):
@@ -219,26 +274,130 @@ def rm_dir_if_exists(full_path, verbose=False, output=sys.stdout):
 		shutil.rmtree(full_path)
 
 		
-def do_all_files_exist(file_name_list, verbose=False, output=sys.stdout, short_circuit=True):
+# Number of threads used to list directories when checking for the existence of
+# expected files. Listing directories in parallel helps on remote file systems
+# (NFS, GPFS) on which each directory listing is a round trip to a server.
+# The default (0) lists the directories one after another.
+DEFAULT_FILE_CHECK_WORKERS = int(os.getenv('XNAT_PBS_JOBS_FILE_CHECK_WORKERS', '0'))
+
+
+def _list_directory(dir_name):
+	"""
+	Dictionary of the names of the entries in the specified directory to a flag
+	indicating whether the entry is a symbolic link. The dictionary is empty if
+	the directory does not exist, and None is returned if the directory exists
+	but cannot be listed (e.g. it is not readable).
+	"""
+	try:
+		with os.scandir(dir_name if dir_name else os.curdir) as entries:
+			return {entry.name: entry.is_symlink() for entry in entries}
+	except (FileNotFoundError, NotADirectoryError):
+		return {}
+	except OSError:
+		return None
+
+
+def do_all_files_exist(file_name_list, verbose=False, output=sys.stdout, short_circuit=True,
+					   max_workers=None, deep_verify=None):
+	"""
+	Whether all the files in the specified list exist.
+
+	Rather than checking for each file separately, the files are grouped by the
+	directory they are in and each directory is listed once with os.scandir. If
+	max_workers (default: the XNAT_PBS_JOBS_FILE_CHECK_WORKERS environment
+	variable) is greater than 0, that many threads are used to list the
+	directories in parallel. Otherwise, each directory is listed the first time
+	one of its files is checked, so that a short circuited check does not list
+	directories it never gets to.
+
+	Files are checked (and reported on) in the order in which they are listed.
+
+	If deep_verify (default: the XNAT_PBS_JOBS_DEEP_VERIFY environment variable)
+	is set, the files that exist are also checked (in parallel) for truncation
+	or corruption, see utils/file_integrity.py, and a damaged file counts as
+	missing.
+	"""
+	if max_workers is None:
+		max_workers = DEFAULT_FILE_CHECK_WORKERS
+	if deep_verify is None:
+		deep_verify = file_integrity.deep_verify_default()
+
+	listings = {}
+	executor = None
+
+	if max_workers > 0:
+		dir_names = []
+		for file_name in file_name_list:
+			dir_name = os.path.dirname(file_name)
+			if dir_name not in listings:
+				listings[dir_name] = None
+				dir_names.append(dir_name)
+
+		executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+		for dir_name in dir_names:
+			listings[dir_name] = executor.submit(_list_directory, dir_name)
 
 	all_files_exist = True
+	existing_file_names = []
 
-	for file_name in file_name_list:
+	try:
+		for file_name in file_name_list:
+			if verbose:
+				print("Checking for existence of: " + file_name, file=output)
+
+			(dir_name, base_name) = os.path.split(file_name)
+			if executor:
+				listing = listings[dir_name].result()
+			else:
+				if dir_name not in listings:
+					listings[dir_name] = _list_directory(dir_name)
+				listing = listings[dir_name]
+
+			if base_name in ('', '.', '..') or listing is None:
+				# not a simple directory entry or the directory cannot be
+				# listed, so check for the file directly
+				exists = os.path.exists(file_name)
+			elif base_name not in listing:
+				exists = False
+			elif listing[base_name]:
+				# symbolic links only count if what they link to exists
+				exists = os.path.exists(file_name)
+			else:
+				exists = True
+
+			if exists:
+				existing_file_names.append(file_name)
+				continue
+
+			# If we get here, the most recently checked file does not exist
+			print("FILE DOES NOT EXIST: " + file_name, file=output)
+			all_files_exist = False
+
+			# If we've been told to short circuit this test and have
+			# found 1 file that doesn't exist, then since we know the
+			# final return from this function is going to be False,
+			# just go ahead and return that now.
+			if short_circuit:
+				return all_files_exist
+
+	finally:
+		if executor:
+			executor.shutdown(wait=False, cancel_futures=True)
+
+	if deep_verify:
 		if verbose:
-			print("Checking for existence of: " + file_name, file=output)
-		if os.path.exists(file_name):
-			continue
+			print("Checking for truncation or corruption of: " + str(len(existing_file_names)) + " files",
+				  file=output)
 
-		# If we get here, the most recently checked file does not exist
-		print("FILE DOES NOT EXIST: " + file_name, file=output)
-		all_files_exist = False
+		problems = file_integrity.verify_files(existing_file_names)
+		for file_name in existing_file_names:
+			if file_name not in problems:
+				continue
 
-		# If we've been told to short circuit this test and have
-		# found 1 file that doesn't exist, then since we know the
-		# final return from this function is going to be False,
-		# just go ahead and return that now.
-		if short_circuit:
-			return all_files_exist
+			print("FILE IS DAMAGED: " + file_name + ": " + problems[file_name], file=output)
+			all_files_exist = False
+			if short_circuit:
+				return all_files_exist
 
 	# If we get here, we've cycled through all the files
 	return all_files_exist
@@ -311,14 +470,33 @@ def build_filename_list_from_file(f, root_dir, **substitutions):
 	  is treated as a comment and removed
 	"""
 	
-	list_from_file = f.readlines()
+	return expand_filename_list_template(compile_filename_list_template(f.readlines()),
+										 root_dir, **substitutions)
 
-	list_of_filenames = []
 
-	for name in list_from_file:
+_PLACEHOLDER_PATTERN = re.compile(r'\{([^{}]*)\}')
+
+
+def compile_filename_list_template(lines):
+	"""Parse the lines of a file path template file (see build_filename_list_from_file)
+
+	Comments are removed, internal whitespace is replaced by path separators, and
+	each remaining path is split into its literal parts and its {key} placeholder
+	(substitution slot) parts, so that expanding the template for a subject
+	requires no further parsing.
+
+	Returns
+	-------
+	tuple
+		one tuple per file path of alternating literal strings and placeholder
+		keys; literal strings are at even indices, placeholder keys at odd indices
+	"""
+	compiled_template = []
+
+	for name in lines:
 		# remove any comments (anything at or after a # on a line)
 		filename = name.split('#', 1)[0]
-		
+
 		# remove leading and trailing whitespace
 		filename = filename.strip()
 
@@ -327,21 +505,74 @@ def build_filename_list_from_file(f, root_dir, **substitutions):
 			# replace internal whitespace with separator '/' or '\'
 			filename = os.sep.join(filename.split())
 
-			# cycle through keys in substitutions and replace {key} with value
-			for substring in substitutions.keys():
-				str_to_replace = '{' + substring + '}'
-				replacement_str = substitutions[substring]
+			# split into literal parts and placeholder keys
+			compiled_template.append(tuple(_PLACEHOLDER_PATTERN.split(filename)))
+
+	return tuple(compiled_template)
 
-				if replacement_str:
-					filename = filename.replace(str_to_replace, replacement_str)
 
-			# prepend root directory 
-			filename = os.sep.join([root_dir, filename])
-			list_of_filenames.append(filename)
+def expand_filename_list_template(compiled_template, root_dir, **substitutions):
+	"""Create a list of file paths from a template compiled by compile_filename_list_template
+
+	Placeholders for which a (non-empty) substitution is specified are replaced by
+	the substitution, all other placeholders are left as they are, and root_dir is
+	prepended to each file path.
+	"""
+	replacements = {}
+	for key, value in substitutions.items():
+		if value:
+			replacements[key] = value
+
+	list_of_filenames = []
+	prefix = root_dir + os.sep
+
+	for parts in compiled_template:
+		if len(parts) == 1:
+			list_of_filenames.append(prefix + parts[0])
+			continue
+
+		expanded = list(parts)
+		for index in range(1, len(expanded), 2):
+			key = expanded[index]
+			expanded[index] = replacements.get(key, '{' + key + '}')
+		list_of_filenames.append(prefix + ''.join(expanded))
 
 	return list_of_filenames
 
 
+# compiled templates by template file path, each with the modification time of the
+# file at the time it was compiled
+_compiled_template_cache = {}
+
+
+def get_compiled_filename_list_template(template_file_name):
+	"""The compiled template for the specified template file
+
+	Each template file is read and compiled only once per process, unless its
+	modification time changes.
+	"""
+	mtime = os.stat(template_file_name).st_mtime_ns
+	cached = _compiled_template_cache.get(template_file_name)
+	if cached and cached[0] == mtime:
+		return cached[1]
+
+	with open(template_file_name) as f:
+		compiled_template = compile_filename_list_template(f.readlines())
+
+	_compiled_template_cache[template_file_name] = (mtime, compiled_template)
+	return compiled_template
+
+
+def build_filename_list_from_template_file(template_file_name, root_dir, **substitutions):
+	"""Create a list of file paths based on the contents of the specified template file
+
+	Same as build_filename_list_from_file, but takes the name of the template file
+	and uses the cached compiled template for the file.
+	"""
+	return expand_filename_list_template(get_compiled_filename_list_template(template_file_name),
+										 root_dir, **substitutions)
+
+
 if __name__ == '__main__':
 
 	x = 1
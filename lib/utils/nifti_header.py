@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+"""
+utils/nifti_header.py: Read the header of a NIfTI-1 or NIfTI-2 (.nii or .nii.gz) file.
+
+Only the header (the first 348 bytes of a NIfTI-1 file, or 540 bytes of a
+NIfTI-2 file) is read, and for a gzipped file only as much of the file as is
+needed to decompress the header is read. So reading the dimensions of an image
+does not need FSL (fslinfo) and takes about as long as opening the file.
+"""
+
+# import of built-in modules
+import collections
+import gzip
+import struct
+import sys
+
+# import of third party modules
+
+# import of local modules
+
+# authorship information
+__author__ = "Timothy B. Brown"
+__copyright__ = "Copyright 2020, The Connectome Coordination Facility (CCF)"
+__maintainer__ = "Junil Chang"
+
+NIFTI1_HEADER_SIZE = 348
+NIFTI2_HEADER_SIZE = 540
+
+NiftiHeader = collections.namedtuple('NiftiHeader', ['version', 'dims', 'datatype', 'bitpix', 'pixdims', 'vox_offset'])
+NiftiHeader.__doc__ = """
+Header of a NIfTI file: version (1 or 2), dims and pixdims (one per dimension,
+i.e. dim[1..dim[0]] and pixdim[1..dim[0]]), datatype and bitpix codes, and the
+offset of the image data in the file
+"""
+
+
+def _open(file_name):
+	if file_name.endswith('.gz'):
+		return gzip.open(file_name, 'rb')
+	return open(file_name, 'rb')
+
+
+def _byte_order(sizeof_hdr):
+	"""The struct byte order ('<' or '>') and NIfTI version of a header that starts with sizeof_hdr"""
+	for byte_order in ('<', '>'):
+		size = struct.unpack(byte_order + 'i', sizeof_hdr)[0]
+		if size == NIFTI1_HEADER_SIZE:
+			return byte_order, 1
+		if size == NIFTI2_HEADER_SIZE:
+			return byte_order, 2
+	raise ValueError("not a NIfTI-1 or NIfTI-2 header")
+
+
+def _read_exactly(nifti_file, count):
+	data = nifti_file.read(count)
+	if len(data) != count:
+		raise ValueError("file is too short to hold a NIfTI header")
+	return data
+
+
+def read_header(file_name):
+	"""The NiftiHeader of the specified NIfTI file. Raises a ValueError if it is not a NIfTI file."""
+	with _open(file_name) as nifti_file:
+		sizeof_hdr = _read_exactly(nifti_file, 4)
+		(byte_order, version) = _byte_order(sizeof_hdr)
+		header_size = NIFTI1_HEADER_SIZE if version == 1 else NIFTI2_HEADER_SIZE
+		header = sizeof_hdr + _read_exactly(nifti_file, header_size - 4)
+
+	if version == 1:
+		if header[344:348] not in (b'n+1\0', b'ni1\0'):
+			raise ValueError(file_name + ": bad NIfTI-1 magic: " + repr(header[344:348]))
+		dim = struct.unpack_from(byte_order + '8h', header, 40)
+		(datatype, bitpix) = struct.unpack_from(byte_order + '2h', header, 70)
+		pixdim = struct.unpack_from(byte_order + '8f', header, 76)
+		vox_offset = int(struct.unpack_from(byte_order + 'f', header, 108)[0])
+	else:
+		if header[4:8] not in (b'n+2\0', b'ni2\0'):
+			raise ValueError(file_name + ": bad NIfTI-2 magic: " + repr(header[4:12]))
+		(datatype, bitpix) = struct.unpack_from(byte_order + '2h', header, 12)
+		dim = struct.unpack_from(byte_order + '8q', header, 16)
+		pixdim = struct.unpack_from(byte_order + '8d', header, 104)
+		vox_offset = struct.unpack_from(byte_order + 'q', header, 168)[0]
+
+	ndim = dim[0]
+	if not 1 <= ndim <= 7:
+		raise ValueError(file_name + ": bad number of dimensions: " + str(ndim))
+
+	return NiftiHeader(version, tuple(dim[1:ndim + 1]), datatype, bitpix, tuple(pixdim[1:ndim + 1]), vox_offset)
+
+
+def volume_count(file_name):
+	"""
+	The number of volumes in the specified NIfTI file, i.e. the size of the 4th
+	dimension (dim4 as reported by fslinfo), 1 if the image has fewer dimensions
+	"""
+	dims = read_header(file_name).dims
+	return dims[3] if len(dims) >= 4 else 1
+
+
+if __name__ == '__main__':
+	for file_name in sys.argv[1:]:
+		header = read_header(file_name)
+		print(file_name + "\t" + "\t".join(name + "=" + str(value) for name, value in header._asdict().items()))
@@ -3,11 +3,18 @@
 """os_utils.py: Some simple and hopefully useful os utilities."""
 
 # import of built-in modules
+import collections
+import concurrent.futures
+import errno
+import fcntl
 import glob
+import itertools
+import json
 import logging
 import os
 import shutil
-import tempfile
+import threading
+import time
 
 # import of third party modules
 # None
@@ -29,6 +36,39 @@ sh = logging.StreamHandler()
 sh.setFormatter(logging.Formatter('%(name)s: %(message)s'))
 log.addHandler(sh)
 
+# per-process counter used to make time stamps unique
+_time_stamp_counter = itertools.count()
+
+# number of threads used by lndir to create symlinks, creating a symlink is a
+# metadata operation that mostly waits on the (network) file system, so many
+# more threads than processors are worthwhile
+DEFAULT_LNDIR_WORKERS = 16
+
+# number of symlinks created by each lndir task
+LNDIR_CHUNK_SIZE = 256
+
+# ioctl request to make a file a copy-on-write clone of (a reflink to) another file
+FICLONE = 0x40049409
+
+# ways in which copy_tree_by_links copies a file
+REFLINKED = 'reflinked'
+HARDLINKED = 'hardlinked'
+COPIED = 'copied'
+SKIPPED = 'skipped'
+
+# errors from FICLONE that mean the file system (or pair of file systems) can not reflink
+_NO_REFLINK_ERRORS = (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS)
+
+# errors from os.copy_file_range that mean the kernel or file systems do not support it
+_NO_COPY_FILE_RANGE_ERRORS = (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL)
+
+# name of the file in which replace_lndir_symlinks records its progress, so that
+# it can resume if interrupted
+REPLACE_LNDIR_SYMLINKS_MANIFEST = '.replace_lndir_symlinks.manifest'
+
+# suffix of the temporary name under which replace_lndir_symlinks makes each copy
+MATERIALIZING_SUFFIX = '.materializing'
+
 
 def getenv_required(var_name):
     value = os.getenv(var_name)
@@ -37,8 +77,69 @@ def getenv_required(var_name):
     return value
 
 
-def lndir(src, dst, show_log=False, ignore_existing_dst_files=False):
+def unique_time_stamp():
+    """
+    Returns a time stamp string suitable for use in file and directory names.
+
+    The string is the current seconds since the epoch followed by the process id
+    and a per-process counter. So time stamps generated in the same second, either
+    in this process or in another process, do not collide and callers do not have
+    to wait for the clock to advance between generating names.
+    """
+    return str(int(time.time())) + '_' + str(os.getpid()) + '_' + str(next(_time_stamp_counter))
+
+
+def _lndir_tree(src):
+    """
+    Lists of the directories and the files (anything that is not a directory) in
+    the tree rooted at src, as paths relative to src. Each directory is listed
+    after its parent. Symlinks to directories are listed as directories, but
+    are not followed.
+    """
+    dirs = []
+    files = []
+    to_scan = ['']
+    while to_scan:
+        rel_dir = to_scan.pop()
+        with os.scandir(src + rel_dir) as entries:
+            for entry in entries:
+                rel_path = rel_dir + '/' + entry.name
+                if entry.is_dir():
+                    dirs.append(rel_path)
+                    if not entry.is_symlink():
+                        to_scan.append(rel_path)
+                else:
+                    files.append(rel_path)
+    return dirs, files
+
+
+def _lndir_link(src, dst, rel_paths, show_log, ignore_existing_dst_files):
+    linked = 0
+    for rel_path in rel_paths:
+        src_filename = src + rel_path
+        dst_filename = dst + rel_path
+        if show_log:
+            print("linking: %s --> %s" % (dst_filename, src_filename))
+        try:
+            os.symlink(src_filename, dst_filename)
+            linked += 1
+        except FileExistsError as e:
+            if not ignore_existing_dst_files:
+                raise e
+    return linked
 
+
+def lndir(src, dst, show_log=False, ignore_existing_dst_files=False, workers=None):
+    """
+    Creates a shadow directory tree at dst of the tree at src, i.e. the same
+    directories with symlinks in place of the files.
+
+    The source tree is scanned first, then the directories are all created, then
+    the symlinks are created by a pool of workers threads (XNAT_PBS_JOBS_LNDIR_WORKERS
+    environment variable, or DEFAULT_LNDIR_WORKERS, if workers is not specified).
+
+    Returns the number of symlinks created.
+    """
     if not os.path.isdir(src):
         raise OSError("ERROR: %s is not a valid directory." % src)
 
@@ -48,52 +149,279 @@ def lndir(src, dst, show_log=False, ignore_existing_dst_files=False):
     if not os.path.exists(dst):
         os.mkdir(dst)
 
-    for root, dirs, files in os.walk(src):
-        log.debug("root:  " + root)
+    workers = _lndir_workers(workers)
+
+    start_time = time.monotonic()
+    src = src.rstrip(os.sep)
+    dst = dst.rstrip(os.sep)
+    dirs, files = _lndir_tree(src)
+
+    for rel_dir in dirs:
+        log.debug("dirname: " + rel_dir)
+        try:
+            os.mkdir(dst + rel_dir)
+        except FileExistsError:
+            pass
+
+    chunks = [files[start:start + LNDIR_CHUNK_SIZE] for start in range(0, len(files), LNDIR_CHUNK_SIZE)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(workers, len(chunks)))) as executor:
+        linked = sum(executor.map(
+            lambda chunk: _lndir_link(src, dst, chunk, show_log, ignore_existing_dst_files), chunks))
+
+    log.info("lndir: %s --> %s: %d directories, %d symlinks created, %d existing, in %.1f seconds" %
+              (dst, src, len(dirs), linked, len(files) - linked, time.monotonic() - start_time))
+    return linked
+
+
+def _lndir_workers(workers):
+    if workers:
+        return workers
+    return int(os.getenv('XNAT_PBS_JOBS_LNDIR_WORKERS', DEFAULT_LNDIR_WORKERS))
+
+
+def list_copy_tree(src):
+    """
+    Lists of the directories and the files in the tree rooted at src, as paths
+    relative to src, following symlinks (as rsync -L does). As for
+    'rsync src/* dst', names starting with . in src itself are left out.
+    """
+    dirs = []
+    files = []
+    to_scan = ['']
+    while to_scan:
+        rel_dir = to_scan.pop()
+        with os.scandir(src + rel_dir) as entries:
+            for entry in entries:
+                if rel_dir == '' and entry.name.startswith('.'):
+                    continue
+                rel_path = rel_dir + '/' + entry.name
+                if entry.is_dir():
+                    dirs.append(rel_path)
+                    to_scan.append(rel_path)
+                else:
+                    files.append(rel_path)
+    return dirs, files
+
+
+class _TreeCopier(object):
+    """
+    Copies files by reflink where the file system supports it, otherwise by hard
+    link where that is safe, otherwise by copying the data.
+    """
+
+    def __init__(self, show_log):
+        self._show_log = show_log
+        self._lock = threading.Lock()
+        # (source device, destination device) pairs that have been found to not support reflinks
+        self._no_reflink = set()
+
+    def _reflink(self, src_filename, dst_filename, src_stat, dst_dev):
+        if (src_stat.st_dev, dst_dev) in self._no_reflink:
+            return False
 
-        for filename in files:
-            log.debug("filename: " + filename)
+        with open(src_filename, 'rb') as src_file, open(dst_filename, 'wb') as dst_file:
             try:
-                src_filename = '%s/%s' % (root, filename)
-                dst_filename = '%s%s/%s' % (dst, root.replace(src, ''), filename)
-                if show_log:
-                    print("linking: %s --> %s" % (dst_filename, src_filename))
-                os.symlink(src_filename, dst_filename)
-
-            except FileExistsError as e:
-                if not ignore_existing_dst_files:
-                    raise e
-
-        for dirname in dirs:
-            log.debug("dirname: " + dirname)
+                fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+                return True
+            except OSError as e:
+                if e.errno not in _NO_REFLINK_ERRORS:
+                    raise
+                with self._lock:
+                    self._no_reflink.add((src_stat.st_dev, dst_dev))
+
+        os.remove(dst_filename)
+        return False
+
+    def copy_file(self, src_filename, dst_filename, dst_dev):
+        try:
+            src_stat = os.stat(src_filename)
+        except FileNotFoundError:
+            log.warning("skipping symlink with no referent: " + src_filename)
+            return SKIPPED
+
+        try:
+            dst_stat = os.stat(dst_filename)
+            if dst_stat.st_ino == src_stat.st_ino and dst_stat.st_dev == src_stat.st_dev:
+                return SKIPPED
+            if dst_stat.st_mtime > src_stat.st_mtime:
+                # as for rsync -u, files that are newer in the destination are left alone
+                return SKIPPED
+            if dst_stat.st_mtime == src_stat.st_mtime and dst_stat.st_size == src_stat.st_size:
+                # as for rsync, files with the same size and modification time are unchanged
+                return SKIPPED
+            os.remove(dst_filename)
+        except FileNotFoundError:
+            pass
+
+        if self._show_log:
+            print("copying: %s --> %s" % (src_filename, dst_filename))
+
+        if self._reflink(src_filename, dst_filename, src_stat, dst_dev):
+            shutil.copystat(src_filename, dst_filename)
+            return REFLINKED
+
+        # a hard link shares the data and mode with the source, so is only safe if
+        # the source can not be written through it, and its owner (who could make
+        # it writable, as they could a copy made by rsync -a) is someone else
+        if (src_stat.st_dev == dst_dev and src_stat.st_uid != os.geteuid() and
+                not os.access(src_filename, os.W_OK)):
             try:
-                os.mkdir('%s%s/%s' % (dst, root.replace(src, ''), dirname))
-            except OSError:
-                pass
+                os.link(src_filename, dst_filename)
+                return HARDLINKED
+            except OSError as e:
+                if e.errno not in (errno.EPERM, errno.EACCES, errno.EMLINK, errno.EXDEV):
+                    raise
+
+        shutil.copy2(src_filename, dst_filename)
+        return COPIED
+
+    def copy_files(self, src, dst, rel_paths, dst_dev):
+        return collections.Counter(self.copy_file(src + rel_path, dst + rel_path, dst_dev)
+                                   for rel_path in rel_paths)
+
+
+def copy_tree_by_links(src, dst, show_log=False, workers=None):
+    """
+    Copies the files in the tree at src into the tree at dst, with the same
+    results as 'rsync -auL src/* dst', but without copying the data where that
+    can be avoided.
+
+    Each file is a reflink (a copy-on-write clone) of the source file if the
+    file system supports it. Otherwise it is a hard link to the source file if
+    the source and destination are on the same file system and the source file
+    is read-only and owned by another user (so it can not be modified through
+    the link). Otherwise it is a copy.
+
+    Returns a Counter of the number of files reflinked, hard linked, copied, and skipped.
+    """
+    if not os.path.isdir(src):
+        raise OSError("ERROR: %s is not a valid directory." % src)
+
+    start_time = time.monotonic()
+    src = src.rstrip(os.sep)
+    dst = dst.rstrip(os.sep)
+    os.makedirs(dst, exist_ok=True)
+    dst_dev = os.stat(dst).st_dev
+
+    dirs, files = list_copy_tree(src)
+    for rel_dir in dirs:
+        os.makedirs(dst + rel_dir, exist_ok=True)
+
+    copier = _TreeCopier(show_log)
+    chunks = [files[start:start + LNDIR_CHUNK_SIZE] for start in range(0, len(files), LNDIR_CHUNK_SIZE)]
+    counts = collections.Counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(_lndir_workers(workers), len(chunks)))) as executor:
+        for chunk_counts in executor.map(lambda chunk: copier.copy_files(src, dst, chunk, dst_dev), chunks):
+            counts.update(chunk_counts)
 
+    log.info("copy_tree_by_links: %s --> %s: %d reflinked, %d hard linked, %d copied, %d skipped, in %.1f seconds" %
+             (src, dst, counts[REFLINKED], counts[HARDLINKED], counts[COPIED], counts[SKIPPED],
+              time.monotonic() - start_time))
+    return counts
 
-def replace_lndir_symlinks(srcpath):
+
+def copy_file_data(src, dst):
+    """
+    Copy the data of the file src to the (new) file dst in the kernel (with
+    os.copy_file_range), falling back to shutil.copyfile (which uses sendfile)
+    where that is not supported. Returns the number of bytes copied.
+    """
+    with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+        size = os.fstat(src_file.fileno()).st_size
+        copied = 0
+        try:
+            while copied < size:
+                count = os.copy_file_range(src_file.fileno(), dst_file.fileno(), size - copied)
+                if count == 0:
+                    break
+                copied += count
+            return copied
+        except (AttributeError, OSError) as e:
+            if copied > 0 or (isinstance(e, OSError) and e.errno not in _NO_COPY_FILE_RANGE_ERRORS):
+                raise
+
+    shutil.copyfile(src, dst)
+    return os.path.getsize(dst)
+
+
+def _materializing_path(filename):
+    return os.path.dirname(filename) + os.sep + '.' + os.path.basename(filename) + MATERIALIZING_SUFFIX
+
+
+def _find_lndir_symlinks(srcpath):
+    """
+    List of the symlinks to files in the tree rooted at srcpath (symlinks to
+    directories are not followed). Like a glob('*') walk, entries whose names
+    start with '.' are skipped.
+    """
+    links = []
+    to_scan = [srcpath]
+    while to_scan:
+        with os.scandir(to_scan.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    to_scan.append(entry.path)
+                elif entry.is_symlink() and entry.is_file():
+                    links.append(entry.path)
+    return links
+
+
+def _materialize(filename):
+    """Replace the symlink filename with a copy of the file it links to, returns the bytes copied"""
+    linked_to = os.path.realpath(filename)
+    log.debug("Replacing: " + filename + " with copy of: " + linked_to)
+
+    # copy to a temporary name in the same directory, so that the copy replaces
+    # the link in one (atomic) step
+    temp_filename = _materializing_path(filename)
+    copied = copy_file_data(linked_to, temp_filename)
+    shutil.copystat(linked_to, temp_filename)
+    os.replace(temp_filename, filename)
+    return copied
+
+
+def replace_lndir_symlinks(srcpath, workers=None):
     """
     Replaces all symlinks in an lndir (see above) created directory structure with
     copies of the files that are linked to.
+
+    The copies are made by a pool of worker threads (see lndir). Each copy is made
+    under a temporary name and then moved over the symlink, and the symlinks
+    being replaced are recorded in a manifest file (REPLACE_LNDIR_SYMLINKS_MANIFEST)
+    in srcpath. If it is interrupted, running it again removes the partial copies
+    left by the interrupted run and replaces the symlinks that are still symlinks
+    (the tree is searched again, so symlinks added since are replaced too).
+
+    Returns the number of symlinks replaced.
     """
-    for filename in glob.glob(srcpath + os.sep + '*'):
-        log.debug("filename: " + filename)
+    start_time = time.monotonic()
+    manifest_path = srcpath + os.sep + REPLACE_LNDIR_SYMLINKS_MANIFEST
+
+    # remove any partial copies left by an interrupted run
+    try:
+        with open(manifest_path, 'r') as manifest:
+            interrupted_links = json.loads(manifest.readline())['links']
+        log.info("cleaning up after interrupted replacement of symlinks in: " + srcpath)
+        for filename in interrupted_links:
+            if os.path.lexists(_materializing_path(filename)):
+                os.remove(_materializing_path(filename))
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
 
-        if os.path.isdir(filename) and not os.path.islink(filename):
-            log.debug("\tis a directory that is not a symlink - recursing")
-            replace_lndir_symlinks(filename)
+    to_replace = _find_lndir_symlinks(srcpath)
+    with open(manifest_path, 'w') as manifest:
+        print(json.dumps({'links': to_replace}), file=manifest)
 
-        elif os.path.isfile(filename) and os.path.islink(filename):
-            log.debug("\tis a regular file that is a symlink and should be replaced")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=_lndir_workers(workers)) as executor:
+        total_bytes = sum(executor.map(_materialize, to_replace))
 
-            log.info("Replacing: " + filename + " with copy of: " + os.path.realpath(filename))
+    os.remove(manifest_path)
+    log.info("replace_lndir_symlinks: %s: %d symlinks replaced with copies, %d bytes copied, in %.1f seconds" %
+             (srcpath, len(to_replace), total_bytes, time.monotonic() - start_time))
+    return len(to_replace)
 
-            with tempfile.TemporaryDirectory() as temp_dirpath:
-                temp_filename = temp_dirpath + os.sep + os.path.basename(filename)
-                shutil.copy2(filename, temp_filename)
-                os.remove(filename)
-                shutil.move(temp_filename, filename)
 
 def replace_symlinks_with_relative(srcpath):
 
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+
+"""
+utils/overlay_copy.py: Copy a sequence of directories (layers) over each other
+into destination directories, in parallel.
+
+Copying each layer in turn with 'rsync -auL layer/* destination' overlays the
+layers: where more than one layer has a file at the same destination path, the
+last layer's file ends up at that path (unless the copy already at that path is
+newer, as rsync -u leaves files that are newer in the destination alone).
+
+An OverlayCopyPlan works out up front which layer's file wins each destination
+path under those rules. Because each destination path is then written by only
+one copy, the winning files are copied (still with rsync -auL, in chunks of
+files) by several workers at once, with the same result as copying the layers
+one after another.
+"""
+
+# import of built-in modules
+import collections
+import concurrent.futures
+import logging
+import os
+import subprocess
+import time
+
+# import of third party modules
+
+# import of local modules
+import utils.os_utils as os_utils
+
+# authorship information
+__author__ = "Timothy B. Brown"
+__copyright__ = "Copyright 2020, The Connectome Coordination Facility (CCF)"
+__maintainer__ = "Junil Chang"
+
+# create a module logger
+module_logger = logging.getLogger(__name__)
+module_logger.setLevel(logging.WARNING)  # Note: This can be overidden by log file configuration
+
+# default number of copies done at once
+DEFAULT_WORKERS = 4
+
+# number of copy tasks to split the files into per worker, so that workers that
+# get small files go on to help with the rest
+CHUNKS_PER_WORKER = 4
+
+# exit status of rsync when some files could not be transferred
+RSYNC_PARTIAL_TRANSFER = 23
+
+# the file of a layer that is to be copied to a destination path
+_Winner = collections.namedtuple('_Winner', ['layer', 'rel_path', 'size'])
+
+
+def rsync_layer(src, dst, show_log=False):
+	"""Copy a layer the way that copying each layer in turn does: 'rsync -auL src/* dst'"""
+	rsync_cmd = 'rsync -auLv ' if show_log else 'rsync -auL '
+	rsync_cmd += src + os.sep + '*' + ' ' + dst
+	module_logger.debug("rsync_cmd: " + rsync_cmd)
+
+	completed_rsync_process = subprocess.run(
+		rsync_cmd, shell=True, check=True, stdout=subprocess.PIPE,
+		universal_newlines=True)
+	module_logger.debug("stdout: " + completed_rsync_process.stdout)
+
+
+def _rsync_files(src, dst, rel_paths, show_log):
+	rsync_cmd = ['rsync', '-auLv' if show_log else '-auL', '--files-from=-', src + os.sep, dst + os.sep]
+	completed_rsync_process = subprocess.run(
+		rsync_cmd, check=True, stdout=subprocess.PIPE, universal_newlines=True,
+		input=''.join(rel_path.lstrip('/') + '\n' for rel_path in rel_paths))
+	if show_log:
+		print(completed_rsync_process.stdout, end='')
+
+
+class OverlayCopyPlan(object):
+	"""
+	Plan for copying a sequence of (source directory, destination directory)
+	layers over each other.
+
+	As when copying the layers in turn with rsync -auL, symlinks with no referent
+	are not copied and make execute raise a subprocess.CalledProcessError (exit
+	status 23) after all the other files have been copied.
+	"""
+
+	def __init__(self):
+		self._layers = []
+
+	def __len__(self):
+		return len(self._layers)
+
+	def add(self, src, dst):
+		"""Add a layer that is copied over the layers already added."""
+		self._layers.append((src.rstrip(os.sep), dst.rstrip(os.sep)))
+
+	def _plan(self):
+		"""
+		The directories to create, a dictionary of destination path to the
+		_Winner to copy to it, or None if the layers conflict (a path that is a
+		directory in one layer is a file in another) so that they can only be
+		copied in turn, and a list of the symlinks with no referent
+		"""
+		dirs = set()
+		winners = {}
+		broken_links = []
+		# modification time of what will be at each destination path
+		mtimes = {}
+
+		for (layer, (src, dst)) in enumerate(self._layers):
+			layer_dirs, layer_files = os_utils.list_copy_tree(src)
+			dirs.update(dst + rel_dir for rel_dir in layer_dirs)
+			dirs.add(dst)
+
+			for rel_path in layer_files:
+				try:
+					src_stat = os.stat(src + rel_path)
+				except FileNotFoundError:
+					module_logger.error("symlink has no referent: " + src + rel_path)
+					broken_links.append(src + rel_path)
+					continue
+
+				dst_path = dst + rel_path
+				if dst_path not in mtimes:
+					try:
+						mtimes[dst_path] = os.stat(dst_path).st_mtime
+					except FileNotFoundError:
+						mtimes[dst_path] = None
+
+				if mtimes[dst_path] is not None and mtimes[dst_path] > src_stat.st_mtime:
+					# as for rsync -u, the newer file already at the path is left alone
+					continue
+
+				mtimes[dst_path] = src_stat.st_mtime
+				winners[dst_path] = _Winner(layer, rel_path, src_stat.st_size)
+
+		if any(path in dirs for path in mtimes):
+			return dirs, None, broken_links
+		return dirs, winners, broken_links
+
+	def _chunks(self, winners, chunk_count):
+		"""List of (layer, [rel_path, ...]) copy tasks with about equal total sizes"""
+		by_layer = collections.defaultdict(list)
+		for winner in winners.values():
+			by_layer[winner.layer].append(winner)
+
+		target_size = max(1, sum(winner.size for winner in winners.values()) // chunk_count)
+		chunks = []
+		for layer in sorted(by_layer):
+			chunk = []
+			chunk_size = 0
+			for winner in sorted(by_layer[layer], key=lambda winner: winner.rel_path):
+				chunk.append(winner.rel_path)
+				chunk_size += winner.size
+				if chunk_size >= target_size:
+					chunks.append((layer, chunk))
+					chunk = []
+					chunk_size = 0
+			if chunk:
+				chunks.append((layer, chunk))
+		return chunks
+
+	def execute(self, workers=DEFAULT_WORKERS, show_log=False):
+		"""Copy all the layers added."""
+		start_time = time.monotonic()
+
+		if not self._layers:
+			return
+
+		if workers <= 1:
+			for (src, dst) in self._layers:
+				rsync_layer(src, dst, show_log)
+			return
+
+		dirs, winners, broken_links = self._plan()
+		if winners is None:
+			module_logger.warning("layers have conflicting files and directories, copying them in turn")
+			for (src, dst) in self._layers:
+				rsync_layer(src, dst, show_log)
+			return
+
+		for dir_path in sorted(dirs):
+			os.makedirs(dir_path, exist_ok=True)
+
+		chunks = self._chunks(winners, workers * CHUNKS_PER_WORKER)
+		with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+			futures = [executor.submit(_rsync_files, self._layers[layer][0], self._layers[layer][1], rel_paths, show_log)
+					   for (layer, rel_paths) in chunks]
+			for future in concurrent.futures.as_completed(futures):
+				# raise the first failure (if any)
+				future.result()
+
+		module_logger.info("copied " + str(len(winners)) + " files from " + str(len(self._layers)) + " layers in " +
+						   str(len(chunks)) + " chunks with " + str(workers) + " workers in " +
+						   "%.1f" % (time.monotonic() - start_time) + " seconds")
+
+		if broken_links:
+			raise subprocess.CalledProcessError(
+				RSYNC_PARTIAL_TRANSFER, 'rsync -auL', output="symlinks with no referent: " + " ".join(broken_links))
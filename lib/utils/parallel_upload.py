@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+
+"""
+utils/parallel_upload.py: Upload a directory of files into an XNAT DB session
+level resource using several parallel HTTP streams.
+
+The files in the directory are split into (total size) balanced chunks, one
+per stream, and each stream uploads the files in its chunk one after another
+through a shared XnatClient (see xnat/xnat_access.py). A file whose upload
+fails is retried (from the start of the file). The resource catalog is not
+updated as each file is added, it is refreshed once after all the files have
+been uploaded.
+
+The files uploaded are recorded in a transfer journal in the directory (see
+utils/transfer_journal.py), so if an upload is interrupted (e.g. the job runs
+out of walltime, or the server is restarted) a re-run only uploads the files
+that have not been uploaded or have changed since. Before the catalog is
+refreshed, the files in the resource are checked against the size and
+checksum of each uploaded file, and any that are missing or differ are
+uploaded again.
+
+This is an alternative to putting a directory into a resource by zipping it
+up and uploading the zip file in a single stream (PutDirIntoResource.sh
+--use-http), and is used by XNAT_working_dir_put.sh when --parallel-streams=
+is specified.
+"""
+
+# import of built-in modules
+import concurrent.futures
+import getpass
+import heapq
+import os
+import sys
+import threading
+import time
+import urllib.parse
+
+# import of third party modules
+import requests
+
+# import of local modules
+import utils.my_argparse as my_argparse
+import utils.os_utils as os_utils
+import utils.transfer_journal as transfer_journal
+import utils.user_utils as user_utils
+import xnat.xnat_access as xnat_access
+
+# authorship information
+__author__ = "Timothy B. Brown"
+__copyright__ = "Copyright 2020, The Connectome Coordination Facility (CCF)"
+__maintainer__ = "Junil Chang"
+
+# default number of parallel upload streams
+DEFAULT_STREAMS = 4
+
+# number of times the upload of a file is attempted
+DEFAULT_FILE_ATTEMPTS = 3
+
+MEGABYTE = 1024 * 1024
+
+
+def _inform(msg):
+	"""Inform the user of this program by outputing a message that is prefixed by the file name.
+
+	:param msg: Message to output
+	:type msg: str
+	"""
+	print(os.path.basename(__file__) + ": " + msg, flush=True)
+
+
+def list_files(root_dir):
+	"""
+	List of (path relative to root_dir, size) for all the files in the tree rooted
+	at root_dir (except for a transfer journal)
+	"""
+	files = []
+	for dir_path, dir_names, file_names in os.walk(root_dir):
+		dir_names.sort()
+		for file_name in sorted(file_names):
+			full_path = os.path.join(dir_path, file_name)
+			if dir_path == root_dir and file_name == transfer_journal.JOURNAL_FILE_NAME:
+				continue
+			if os.path.isfile(full_path):
+				files.append((os.path.relpath(full_path, root_dir), os.path.getsize(full_path)))
+	return files
+
+
+def balance_chunks(files, chunk_count):
+	"""
+	Split a list of (path, size) into (at most) chunk_count lists with total sizes
+	that are as close to each other as can easily be arranged (each file, largest
+	first, goes to the chunk that currently has the smallest total size).
+	"""
+	chunk_count = max(1, min(chunk_count, len(files)))
+	chunks = [[] for i in range(chunk_count)]
+	totals = [(0, index) for index in range(chunk_count)]
+
+	for path, size in sorted(files, key=lambda file: file[1], reverse=True):
+		total, index = heapq.heappop(totals)
+		chunks[index].append((path, size))
+		heapq.heappush(totals, (total + size, index))
+
+	return [chunk for chunk in chunks if chunk]
+
+
+class ParallelUploader(object):
+	"""
+	Uploads the files in a directory into a session level resource in several
+	parallel streams.
+	"""
+
+	def __init__(self, client, project, subject, session, resource,
+				 reason='Unspecified', streams=DEFAULT_STREAMS, file_attempts=DEFAULT_FILE_ATTEMPTS):
+		self._client = client
+		self._project = project
+		self._subject = subject
+		self._session = session
+		self._resource = resource
+		self._reason = reason
+		self._streams = streams
+		self._file_attempts = file_attempts
+		self._journal = None
+
+		self._lock = threading.Lock()
+		self._bytes_uploaded = 0
+		self._files_uploaded = 0
+
+	def _resource_path(self, session_id):
+		return ('/projects/' + self._project + '/subjects/' + self._subject +
+				'/experiments/' + session_id + '/resources/' + self._resource)
+
+	def _create_resource(self, session_id):
+		response = self._client.put('/REST' + self._resource_path(session_id),
+									params={'event_reason': self._reason})
+		if response.status_code == 409:
+			# the resource already exists
+			return
+		response.raise_for_status()
+
+	def _upload_file(self, root_dir, session_id, path, size):
+		url = ('/REST' + self._resource_path(session_id) + '/files/' +
+			   urllib.parse.quote(path.replace(os.sep, '/')))
+		params = {'inbody': 'true', 'overwrite': 'true', 'update-stats': 'false',
+				  'event_reason': self._reason}
+
+		mtime_ns = os.stat(os.path.join(root_dir, path)).st_mtime_ns
+
+		for attempt in range(1, self._file_attempts + 1):
+			try:
+				with transfer_journal.ChecksummingFile(os.path.join(root_dir, path)) as upload_file:
+					response = self._client.put(url, params=params, data=upload_file)
+					md5 = upload_file.hexdigest()
+				response.raise_for_status()
+				break
+
+			except requests.RequestException as e:
+				if attempt == self._file_attempts:
+					raise
+				_inform("upload of " + path + " failed (" + str(e) + "), attempt " + str(attempt + 1) +
+						" of " + str(self._file_attempts))
+
+		self._journal.record_uploaded(path, size, mtime_ns, md5)
+
+		with self._lock:
+			self._bytes_uploaded += size
+			self._files_uploaded += 1
+
+	def _upload_chunk(self, root_dir, session_id, stream, chunk):
+		start_time = time.monotonic()
+		chunk_bytes = 0
+		for path, size in chunk:
+			self._upload_file(root_dir, session_id, path, size)
+			chunk_bytes += size
+
+		elapsed = max(time.monotonic() - start_time, 0.001)
+		_inform("stream " + str(stream) + ": " + str(len(chunk)) + " files, " +
+				"%.1f" % (chunk_bytes / MEGABYTE) + " MB in " + "%.1f" % elapsed + " seconds (" +
+				"%.1f" % (chunk_bytes / MEGABYTE / elapsed) + " MB/s)")
+
+	def _upload_files(self, root_dir, session_id, files):
+		chunks = balance_chunks(files, self._streams)
+		with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(chunks))) as executor:
+			futures = [executor.submit(self._upload_chunk, root_dir, session_id, stream, chunk)
+					   for stream, chunk in enumerate(chunks)]
+			for future in concurrent.futures.as_completed(futures):
+				# raise the first failure (if any)
+				future.result()
+
+	def _remote_files(self, session_id):
+		"""Dictionary of path (relative to the resource) to (size, digest) of the files in the resource"""
+		response = self._client.get('/REST' + self._resource_path(session_id) + '/files',
+									params={'format': 'json'})
+		response.raise_for_status()
+
+		remote_files = {}
+		for result in response.json()['ResultSet']['Result']:
+			path = urllib.parse.unquote(result['URI'].split('/files/', 1)[1])
+			remote_files[path.replace('/', os.sep)] = (int(result['Size']), result.get('digest'))
+		return remote_files
+
+	def _unverified_files(self, session_id, files):
+		"""List of the (path, size) files that are missing from the resource or differ from what was uploaded"""
+		remote_files = self._remote_files(session_id)
+
+		unverified = []
+		for path, size in files:
+			remote_size, remote_digest = remote_files.get(path, (None, None))
+			md5 = self._journal.md5(path)
+			if remote_size != size or (remote_digest and md5 and remote_digest != md5):
+				unverified.append((path, size))
+		return unverified
+
+	def _refresh_catalog(self, session_id):
+		response = self._client.post('/data/services/refresh/catalog',
+									 params={'resource': '/archive' + self._resource_path(session_id),
+											 'options': 'populateStats,append,delete'})
+		response.raise_for_status()
+
+	def upload(self, root_dir, resume=True):
+		"""
+		Upload all the files in the tree rooted at root_dir into the resource.
+
+		If resume is True, the files that the transfer journal in root_dir records
+		as already uploaded (and that have not changed since) are not uploaded again.
+		"""
+		session_id = self._client.get_session_id(self._project, self._subject, self._session)
+		if session_id == xnat_access.SESSION_ID_NOT_FOUND:
+			raise ValueError("No session: " + self._session + " in project: " + self._project)
+
+		self._journal = transfer_journal.TransferJournal(
+			root_dir, '/archive' + self._resource_path(session_id), resume)
+		try:
+			self._upload(root_dir, session_id)
+		finally:
+			self._journal.close()
+
+	def _upload(self, root_dir, session_id):
+		files = list_files(root_dir)
+		to_upload = [(path, size) for path, size in files
+					 if not self._journal.is_uploaded(path, size,
+													  os.stat(os.path.join(root_dir, path)).st_mtime_ns)]
+		total_bytes = sum(size for path, size in to_upload)
+		if len(to_upload) < len(files):
+			_inform("resuming upload: " + str(len(files) - len(to_upload)) + " of " + str(len(files)) +
+					" files already uploaded")
+		_inform("uploading " + str(len(to_upload)) + " files, " + "%.1f" % (total_bytes / MEGABYTE) + " MB, in " +
+				str(min(self._streams, len(to_upload))) + " streams to resource: " + self._resource)
+
+		start_time = time.monotonic()
+		self._create_resource(session_id)
+		self._upload_files(root_dir, session_id, to_upload)
+
+		# make sure what is in the resource is what was uploaded before finalizing it
+		unverified = self._unverified_files(session_id, files)
+		if unverified:
+			_inform(str(len(unverified)) + " files missing from or differing in resource, uploading them again")
+			for path, size in unverified:
+				self._journal.forget(path)
+			self._upload_files(root_dir, session_id, unverified)
+
+			unverified = self._unverified_files(session_id, files)
+			if unverified:
+				raise ValueError("files could not be verified in resource: " + self._resource + ": " +
+								 ", ".join(path for path, size in unverified))
+
+		self._refresh_catalog(session_id)
+		self._journal.mark_finalized()
+
+		elapsed = max(time.monotonic() - start_time, 0.001)
+		_inform("uploaded " + str(self._files_uploaded) + " files, " +
+				"%.1f" % (self._bytes_uploaded / MEGABYTE) + " MB in " + "%.1f" % elapsed + " seconds (" +
+				"%.1f" % (self._bytes_uploaded / MEGABYTE / elapsed) + " MB/s)")
+
+
+def main():
+	# create a parser object for getting the command line options
+	parser = my_argparse.MyArgumentParser(
+		description="Program to upload a directory of files into a DB resource in parallel streams.")
+
+	# mandatory arguments
+	parser.add_argument('-u', '--user', dest='user', required=True, type=str)
+	parser.add_argument('-pr', '--project', dest='project', required=True, type=str)
+	parser.add_argument('-sub', '--subject', dest='subject', required=True, type=str)
+	parser.add_argument('-ses', '--session', dest='session', required=True, type=str)
+	parser.add_argument('-r', '--resource', dest='resource', required=True, type=str)
+	parser.add_argument('-d', '--dir', dest='dir', required=True, type=str)
+
+	# optional arguments
+	parser.add_argument('-ser', '--server', dest='server', required=False, default=None, type=str,
+						help="server (default: $XNAT_PBS_JOBS_XNAT_SERVER)")
+	parser.add_argument('--protocol', dest='protocol', required=False, default='https',
+						choices=['http', 'https'])
+	parser.add_argument('-pw', '--password', dest='password', required=False, type=str)
+	parser.add_argument('--reason', dest='reason', required=False, default='Unspecified', type=str)
+	parser.add_argument('-n', '--streams', dest='streams', required=False, type=int, default=DEFAULT_STREAMS)
+	parser.add_argument('--no-resume', dest='resume', action='store_false', required=False, default=True,
+						help="upload all files, even those a transfer journal records as already uploaded")
+	parser.add_argument('-f', '--force', dest='force', action='store_true', required=False, default=False)
+
+	# parse the command line arguments
+	args = parser.parse_args()
+
+	if not args.server:
+		args.server = os_utils.getenv_required('XNAT_PBS_JOBS_XNAT_SERVER')
+
+	if args.password:
+		password = args.password
+	else:
+		password = getpass.getpass("Password: ")
+
+	# show parsed arguments
+	_inform("Parsed arguments:")
+	_inform("  Username: " + args.user)
+	_inform("  Password: " + "*** password mask ***")
+	_inform("    Server: " + args.server)
+	_inform("   Project: " + args.project)
+	_inform("   Subject: " + args.subject)
+	_inform("   Session: " + args.session)
+	_inform("  Resource: " + args.resource)
+	_inform("       Dir: " + args.dir)
+	_inform("   Streams: " + str(args.streams))
+	_inform("    Resume: " + str(args.resume))
+
+	if not args.force and not user_utils.should_proceed():
+		_inform("Did not attempt to put to resource: " + args.resource)
+		return
+
+	client = xnat_access.get_client(args.server, args.user, password, scheme=args.protocol)
+	uploader = ParallelUploader(client, args.project, args.subject, args.session, args.resource,
+								args.reason, args.streams)
+	try:
+		uploader.upload(args.dir, args.resume)
+	except (requests.RequestException, ValueError) as e:
+		_inform("ERROR: " + str(e))
+		sys.exit(1)
+
+
+if __name__ == '__main__':
+	main()
@@ -21,6 +21,7 @@ def main():
 
     # optional arguments
     parser.add_argument('-d', '--directory', dest='directory', required=False, default=None, type=str)
+    parser.add_argument('-w', '--workers', dest='workers', required=False, default=None, type=int)
 
     # parse the command line arguments
     args = parser.parse_args()
@@ -30,7 +31,7 @@ def main():
 
     root_path = os.path.expandvars(os.path.expanduser(args.directory))
     print("root_path: " + root_path)
-    os_utils.replace_lndir_symlinks(root_path)
+    os_utils.replace_lndir_symlinks(root_path, args.workers)
 
 
 if __name__ == '__main__':
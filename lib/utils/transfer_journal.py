@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+"""
+utils/transfer_journal.py: A journal of the files uploaded from a working
+directory into a DB resource, so that an interrupted upload can be resumed.
+
+The journal is kept in the working directory (in a file named
+JOURNAL_FILE_NAME, which is not itself uploaded). It records the resource the
+files are being uploaded to and, for each file that has been uploaded, the
+size, modification time, and MD5 checksum of the file as it was uploaded.
+Records are appended (and flushed) as each file finishes uploading, so if the
+upload is killed partway through, a re-run only needs to upload the files that
+are not in the journal or that have changed since they were uploaded.
+"""
+
+# import of built-in modules
+import hashlib
+import json
+import logging
+import os
+import threading
+
+# import of third party modules
+
+# import of local modules
+
+# authorship information
+__author__ = "Timothy B. Brown"
+__copyright__ = "Copyright 2020, The Connectome Coordination Facility (CCF)"
+__maintainer__ = "Junil Chang"
+
+# create a module logger
+module_logger = logging.getLogger(__name__)
+module_logger.setLevel(logging.WARNING)  # Note: This can be overidden by log file configuration
+
+JOURNAL_FILE_NAME = '.XNAT_PUT_JOURNAL'
+
+# upload states
+UPLOADED = 'uploaded'
+FINALIZED = 'finalized'
+
+
+class ChecksummingFile(object):
+	"""
+	Read-only binary file that computes the MD5 checksum of the data read from it
+	(e.g. as it is being uploaded). Seeking back to the start restarts the checksum.
+	"""
+
+	def __init__(self, path):
+		self._file = open(path, 'rb')
+		self._md5 = hashlib.md5()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def read(self, size=-1):
+		data = self._file.read(size)
+		self._md5.update(data)
+		return data
+
+	def fileno(self):
+		return self._file.fileno()
+
+	def tell(self):
+		return self._file.tell()
+
+	def seek(self, offset, whence=os.SEEK_SET):
+		if offset != 0 or whence != os.SEEK_SET:
+			raise ValueError("a ChecksummingFile can only be rewound to its start")
+		self._md5 = hashlib.md5()
+		return self._file.seek(0)
+
+	def close(self):
+		self._file.close()
+
+	def hexdigest(self):
+		return self._md5.hexdigest()
+
+
+class TransferJournal(object):
+	"""
+	Journal of the files uploaded from a working directory to a target (e.g. the
+	URL of a DB resource).
+	"""
+
+	def __init__(self, working_dir, target, resume=True):
+		self._path = working_dir + os.sep + JOURNAL_FILE_NAME
+		self._target = target
+		self._lock = threading.Lock()
+		self._entries = {}
+		self._finalized = False
+
+		if not resume or not self._load():
+			# start a new journal (there is no journal, or it is of an upload to somewhere else)
+			with open(self._path, 'w') as journal_file:
+				print(json.dumps({'target': target}), file=journal_file)
+
+		self._journal_file = open(self._path, 'a')
+
+	@property
+	def path(self):
+		return self._path
+
+	@property
+	def finalized(self):
+		return self._finalized
+
+	def _load(self):
+		try:
+			with open(self._path, 'r') as journal_file:
+				lines = journal_file.readlines()
+		except FileNotFoundError:
+			return False
+
+		try:
+			if not lines or json.loads(lines[0]).get('target') != self._target:
+				return False
+		except ValueError:
+			return False
+
+		for line in lines[1:]:
+			try:
+				record = json.loads(line)
+			except ValueError:
+				# a partially written last line from an upload that was killed
+				continue
+
+			if record.get('state') == FINALIZED:
+				self._finalized = True
+			else:
+				self._entries[record['path']] = record
+
+		module_logger.info("resuming upload to " + self._target + " with " +
+						   str(len(self._entries)) + " files already uploaded")
+		return True
+
+	def _append(self, record):
+		with self._lock:
+			print(json.dumps(record), file=self._journal_file, flush=True)
+
+	def is_uploaded(self, path, size, mtime_ns):
+		"""Whether the file at path (relative to the working directory) has been uploaded and not changed since"""
+		entry = self._entries.get(path)
+		return (entry is not None and entry['state'] == UPLOADED and
+				entry['size'] == size and entry['mtime_ns'] == mtime_ns)
+
+	def md5(self, path):
+		"""MD5 checksum of the file at path as it was uploaded, or None if it has not been uploaded"""
+		entry = self._entries.get(path)
+		return entry['md5'] if entry else None
+
+	def record_uploaded(self, path, size, mtime_ns, md5):
+		record = {'path': path, 'size': size, 'mtime_ns': mtime_ns, 'md5': md5, 'state': UPLOADED}
+		with self._lock:
+			self._entries[path] = record
+		self._append(record)
+
+	def forget(self, path):
+		"""Record that the file at path needs to be uploaded again."""
+		with self._lock:
+			self._entries.pop(path, None)
+		self._append({'path': path, 'state': 'pending'})
+
+	def mark_finalized(self):
+		self._finalized = True
+		self._append({'state': FINALIZED})
+
+	def close(self):
+		self._journal_file.close()
@@ -8,15 +8,12 @@ import os
 import inspect
 import sys
 import json
+import random
+import threading
 import time
 import xml.etree.ElementTree as ET
 import subprocess
 import re
-import urllib
-import socket
-
-from urllib.error import URLError, HTTPError
-from ssl import SSLError
 
 # import of third party modules
 pass
@@ -50,65 +47,372 @@ def _debug(msg):
         _inform(inspect.stack()[1][3] + ": DEBUG: " + msg)
 
 
-def get_session_id(server, username, password, project, subject, session):
+# maximum number of connections kept open to (and in use with) an XNAT server by one XnatClient,
+# can be set with the XNAT_PBS_JOBS_XNAT_MAX_CONNECTIONS environment variable
+DEFAULT_MAX_CONNECTIONS = 10
 
-    request_url = 'http://' + server + '/data/projects/' + project + '/subjects/' + subject + '/experiments'
-    _debug("request_url: " + request_url)
+# number of times a request that failed for a (possibly) transient reason is retried
+DEFAULT_MAX_RETRIES = 6
 
-    response = requests.get(request_url, auth=(username, password))
-    _debug("response: " + str(response))
-    _debug("response.headers: " + str(response.headers))
-    _debug("response.text: " + str(response.text))
+# backoff between retries (in seconds) is a random value up to
+# min(BACKOFF_MAX, BACKOFF_BASE * 2 ** retry_number)
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
 
-    if (response.status_code != 200):
-        _inform(inspect.stack()[0][3] + ": Cannot get response from request: " + request_url)
-        sys.exit(1)
+# (connect, read) timeouts in seconds for each request
+DEFAULT_TIMEOUT = (10, 300)
 
-    if 'application/json' not in response.headers['content-type']:
-        _inform(inspect.stack()[0][3] + ": Unexpected response content-type: " + response.headers['content-type'] +
-                " from " + request_url)
-        sys.exit(1)
+# HTTP status codes for which a request is retried
+RETRY_STATUS_CODES = (429, 502, 503, 504)
 
-    json_response = json.loads(response.text)
-    _debug("json_response: " + str(json_response))
+# session (experiment) label to ID mappings are cached on disk in the directory named by the
+# XNAT_PBS_JOBS_SESSION_ID_CACHE environment variable (if it is set) for this many seconds,
+# which can be set with the XNAT_PBS_JOBS_SESSION_ID_CACHE_TTL environment variable
+DEFAULT_SESSION_ID_CACHE_TTL = 3600
 
-    json_result_set = json_response['ResultSet']
-    _debug("json_result_set: " + str(json_result_set))
+SESSION_ID_NOT_FOUND = 'XNAT SESSION ID NOT FOUND'
 
-    json_record_count = int(json_result_set['totalRecords'])
-    _debug("json_record_count: " + str(json_record_count))
 
-    json_result = json_result_set['Result']
-    _debug("json_result: " + str(json_result))
+class SessionIdCache():
+    """Cache of the session (experiment) label to XNAT session ID mappings of projects.
 
-    session_and_session_id_list = []
-    for i in range(0, json_record_count):
-        item_list = []
-        for key in ['label', 'ID']:
-            item_list.append(str(json_result[i][key]))
-        session_and_session_id_list.append(item_list)
+    All the mappings for a project are fetched with one request the first time
+    a session ID in that project is looked up, after which lookups are just
+    dictionary lookups. If a cache directory is specified, the mappings are
+    also saved there (one JSON file per server and project) and reused by
+    other processes until they are older than ttl seconds.
 
-    _debug("session_and_session_id_list: " + str(session_and_session_id_list))
+    A label that is not in a project when its mappings are fetched is also
+    remembered (in memory) as missing for ttl seconds, so that looking it up
+    again does not fetch the whole project again.
+    """
 
-    for session_and_session_id in session_and_session_id_list:
-        if session == session_and_session_id[0]:
-            return session_and_session_id[1]
+    def __init__(self, cache_dir=None, ttl=None):
+        if cache_dir is None:
+            cache_dir = os.getenv('XNAT_PBS_JOBS_SESSION_ID_CACHE')
+        if ttl is None:
+            ttl = int(os.getenv('XNAT_PBS_JOBS_SESSION_ID_CACHE_TTL', DEFAULT_SESSION_ID_CACHE_TTL))
+
+        self._cache_dir = cache_dir
+        self._ttl = ttl
+        self._lock = threading.Lock()
+
+        # (server, project) -> (time fetched, {session label: session ID})
+        self._session_ids = {}
+
+        # (server, project, session label) -> time at which the label was found to be missing
+        self._missing = {}
+
+    def _cache_file_name(self, server, project):
+        return self._cache_dir + os.sep + re.sub(r'[^\w.-]', '_', server) + '.' + project + '.session_ids.json'
+
+    def _load(self, server, project):
+        if not self._cache_dir:
+            return None
+
+        try:
+            with open(self._cache_file_name(server, project), 'r') as cache_file:
+                cached = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+        if time.time() - cached['fetched_at'] > self._ttl:
+            return None
+
+        return (cached['fetched_at'], cached['session_ids'])
+
+    def _save(self, server, project, fetched_at, session_ids):
+        if not self._cache_dir:
+            return
+
+        # write to a temporary file and rename it so readers never see a partially written file
+        cache_file_name = self._cache_file_name(server, project)
+        temp_file_name = cache_file_name + '.' + str(os.getpid()) + '.tmp'
+        try:
+            os.makedirs(self._cache_dir, exist_ok=True)
+            with open(temp_file_name, 'w') as cache_file:
+                json.dump({'fetched_at': fetched_at, 'session_ids': session_ids}, cache_file)
+            os.replace(temp_file_name, cache_file_name)
+        except OSError as e:
+            _inform("Unable to save session ID cache: " + cache_file_name + ": " + str(e))
+
+    def prefetch(self, client, project):
+        """Fetch (with one request) the IDs of all the sessions in the specified project."""
+        request_url = '/data/projects/' + project + '/experiments?format=json&columns=ID,label'
+        _debug("request_url: " + request_url)
+
+        json_result = client.get_json(request_url)['ResultSet']['Result']
+        session_ids = {str(result['label']): str(result['ID']) for result in json_result}
+        fetched_at = time.time()
+
+        with self._lock:
+            self._session_ids[(client.server, project)] = (fetched_at, session_ids)
+        self._save(client.server, project, fetched_at, session_ids)
+
+        return session_ids
+
+    def _cached_session_ids(self, server, project):
+        with self._lock:
+            cached = self._session_ids.get((server, project))
+            if cached is None:
+                cached = self._load(server, project)
+                if cached is not None:
+                    self._session_ids[(server, project)] = cached
+
+        if cached is None or time.time() - cached[0] > self._ttl:
+            return None
+        return cached[1]
+
+    def get_session_id(self, client, project, session):
+        """The XNAT session ID for the session with the specified label in the specified project."""
+        session_ids = self._cached_session_ids(client.server, project)
+        if session_ids is not None and session in session_ids:
+            return session_ids[session]
+
+        key = (client.server, project, session)
+        with self._lock:
+            missing_since = self._missing.get(key)
+        if missing_since is not None and time.time() - missing_since <= self._ttl:
+            return SESSION_ID_NOT_FOUND
+
+        # not fetched yet, or a session created since the project was fetched
+        session_ids = self.prefetch(client, project)
+        if session not in session_ids:
+            with self._lock:
+                self._missing[key] = time.time()
+            return SESSION_ID_NOT_FOUND
+
+        return session_ids[session]
+
+    def invalidate(self, server=None, project=None):
+        """Forget the (in memory) session IDs and missing labels for the specified project, or for all projects."""
+        with self._lock:
+            if project is None:
+                self._session_ids.clear()
+                self._missing.clear()
+            else:
+                self._session_ids.pop((server, project), None)
+                for key in [key for key in self._missing if key[:2] == (server, project)]:
+                    del self._missing[key]
 
-    return 'XNAT SESSION ID NOT FOUND'
 
+class XnatClient():
+    """XNAT REST API client.
 
-def get_jsession_id(server, username, password):
+    Requests are made through a requests.Session, so connections to the server
+    are kept alive and reused (up to max_connections of them at once), and the
+    client authenticates once (with the username and password) to get a
+    JSESSION ID which is then used for all subsequent requests. If the JSESSION
+    expires, the client re-authenticates and retries the request.
 
-    request_url = 'http://' + server + '/data/JSESSION'
-    response = requests.get(request_url, auth=(username, password))
+    Requests that fail with a connection error, a timeout, or a status code in
+    RETRY_STATUS_CODES are retried up to max_retries times, waiting a bounded,
+    exponentially increasing, randomized (jittered) time between tries so that
+    many clients retrying at once do not all hit the server at the same time.
+    """
 
-    if (response.status_code != 200):
-        _inform(inspect.stack()[0][3] + ": Cannot get response from request: " + request_url)
-        _inform(inspect.stack()[0][3] + ": Check username and password")
+    def __init__(self, server, username, password, scheme='http', jsession_id=None,
+                 max_connections=None, max_retries=DEFAULT_MAX_RETRIES, timeout=DEFAULT_TIMEOUT):
+        if max_connections is None:
+            max_connections = int(os.getenv('XNAT_PBS_JOBS_XNAT_MAX_CONNECTIONS', DEFAULT_MAX_CONNECTIONS))
+
+        self._server = server
+        self._username = username
+        self._password = password
+        self._scheme = scheme
+        self._max_retries = max_retries
+        self._timeout = timeout
+        self._lock = threading.Lock()
+
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max_connections,
+                                                pool_maxsize=max_connections,
+                                                pool_block=True)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+        self._jsession_id = None
+        if jsession_id:
+            self._set_jsession_id(jsession_id)
+
+        self._session_id_cache = _session_id_cache
+
+    @property
+    def server(self):
+        return self._server
+
+    def url(self, url):
+        """Full URL for the specified URL, server relative path (e.g. /data/...), or scheme-less URL"""
+        if url.startswith('http://') or url.startswith('https://'):
+            return url
+        if url.startswith('/'):
+            return self._scheme + '://' + self._server + url
+        return self._scheme + '://' + url
+
+    def _set_jsession_id(self, jsession_id):
+        self._jsession_id = jsession_id
+        self._session.cookies.set('JSESSIONID', jsession_id)
+
+    def _authenticate(self):
+        request_url = self.url('/data/JSESSION')
+        response = self._request_with_retries('GET', request_url, auth=(self._username, self._password))
+        if response.status_code != 200:
+            raise requests.HTTPError("Cannot get JSESSION ID from: " + request_url + " (status code: " +
+                                     str(response.status_code) + ")", response=response)
+
+        self._set_jsession_id(response.text.strip())
+        _debug("jsession_id: " + self._jsession_id)
+        return self._jsession_id
+
+    def authenticate(self, expired_jsession_id=None):
+        """Get a new JSESSION ID using the username and password.
+
+        If expired_jsession_id is specified, a new JSESSION ID is only gotten if
+        that is still the current one (i.e. no other thread has already replaced it).
+        """
+        with self._lock:
+            if expired_jsession_id is None or self._jsession_id == expired_jsession_id:
+                self._authenticate()
+            return self._jsession_id
+
+    @property
+    def jsession_id(self):
+        if not self._jsession_id:
+            with self._lock:
+                if not self._jsession_id:
+                    self._authenticate()
+        return self._jsession_id
+
+    def _backoff(self, retry_number):
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** retry_number))
+
+    def _request_with_retries(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self._timeout)
+
+        # a file being uploaded is rewound to where it started before each retry
+        body = kwargs.get('data')
+        body_start = body.tell() if hasattr(body, 'seek') else None
+
+        retry_number = 0
+        while True:
+            if retry_number > 0 and body_start is not None:
+                body.seek(body_start)
+            try:
+                response = self._session.request(method, url, **kwargs)
+                if response.status_code not in RETRY_STATUS_CODES or retry_number >= self._max_retries:
+                    return response
+                reason = "status code " + str(response.status_code)
+
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if retry_number >= self._max_retries:
+                    raise
+                reason = type(e).__name__
+
+            delay = self._backoff(retry_number)
+            retry_number += 1
+            _inform(method + " " + url + " failed (" + reason + "), retry " + str(retry_number) +
+                    " of " + str(self._max_retries) + " in " + "%.1f" % delay + " seconds")
+            time.sleep(delay)
+
+    def request(self, method, url, **kwargs):
+        """Make a request (using the JSESSION ID) and return the requests.Response.
+
+        The response is returned whatever its status code, it is up to the caller to check it.
+        """
+        url = self.url(url)
+        jsession_id = self.jsession_id
+
+        response = self._request_with_retries(method, url, **kwargs)
+
+        if response.status_code == 401:
+            # the JSESSION has expired
+            self.authenticate(expired_jsession_id=jsession_id)
+            response = self._request_with_retries(method, url, **kwargs)
+
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def get_json(self, url):
+        """JSON response to a GET of the specified URL (raises a requests.HTTPError if there is no such response)"""
+        response = self.get(url)
+        _debug("response: " + str(response))
+
+        if response.status_code != 200:
+            raise requests.HTTPError("Cannot get response from request: " + url +
+                                     " (status code: " + str(response.status_code) + ")", response=response)
+
+        if 'application/json' not in response.headers['content-type']:
+            raise requests.HTTPError("Unexpected response content-type: " + response.headers['content-type'] +
+                                     " from " + url, response=response)
+
+        return response.json()
+
+    def get_session_id(self, project, subject, session):
+        """The XNAT session ID (a.k.a. the experiment ID, e.g. ConnectomeDB_E1234) for a session.
+
+        Session labels are unique within a project, so the session ID is looked
+        up in the IDs of all the sessions in the project, which are fetched once
+        (see SessionIdCache) rather than once per subject.
+        """
+        return self._session_id_cache.get_session_id(self, project, session)
+
+    def prefetch_session_ids(self, project):
+        """Fetch (with one request) the IDs of all the sessions in the specified project."""
+        return self._session_id_cache.prefetch(self, project)
+
+    def delete_resource(self, resource_url):
+        """Delete the resource (and its files) at the specified URL."""
+        response = self.delete(resource_url, params={'removeFiles': 'true'})
+        response.raise_for_status()
+        return response
+
+
+_session_id_cache = SessionIdCache()
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(server, username, password, scheme='http', jsession_id=None):
+    """The XnatClient for the specified server and user that is shared by everything in this process.
+
+    If a jsession_id is specified, it is used by a newly created client instead of authenticating again.
+    """
+    key = (scheme, server, username)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = XnatClient(server, username, password, scheme=scheme, jsession_id=jsession_id)
+            _clients[key] = client
+        return client
+
+
+def get_session_id(server, username, password, project, subject, session):
+    try:
+        return get_client(server, username, password).get_session_id(project, subject, session)
+    except requests.HTTPError as e:
+        _inform(inspect.stack()[0][3] + ": " + str(e))
         sys.exit(1)
 
-    _debug("response.text: " + str(response.text))
-    return str(response.text)
+
+def get_jsession_id(server, username, password):
+    try:
+        return get_client(server, username, password).jsession_id
+    except requests.HTTPError as e:
+        _inform(inspect.stack()[0][3] + ": " + str(e))
+        _inform(inspect.stack()[0][3] + ": Check username and password")
+        sys.exit(1)
 
 
 class Workflow():
@@ -119,9 +423,7 @@ class Workflow():
         self._password = password
         self._server = server
         self._jsession_id = jsession_id
-        self._timeout = 8
-        self._timeout_max = 1024
-        self._timeout_step = 8
+        self._client = get_client(server, user, password, jsession_id=jsession_id)
 
     def create_workflow(self, experiment_id, project_id, pipeline, status):
         """Creates a workflow entry and returns the primary key of the inserted workflow"""
@@ -193,50 +495,23 @@ class Workflow():
 
     def get_URL_string_using_jsession(self, URL):
         """Get URL results as a string"""
-        restRequest = urllib.request.Request(URL)
-        restRequest.add_header("Cookie", "JSESSIONID=" + self._jsession_id)
-
-        while (self._timeout <= self._timeout_max):
-            try:
-                restConnHandle = urllib.request.urlopen(restRequest, None, self._timeout)
-            except HTTPError as e:
-                if (e.code == 400):
-                    return '404 Error'
-                elif (e.code == 500):
-                    return '500 Error'
-                elif (e.code != 404):
-                    self._timeout += self._timeout_step
-                    print('HTTPError code: ' + str(e.code) + '. Timeout increased to ' + str(self._timeout) + ' seconds for ' + URL)
-                else:
-                    print(str(e))
-                    break
-
-            except URLError as e:
-                self._timeout += self._timeout_step
-                print('URLError code: ' + str(e.reason) + '. Timeout increased to ' + str(self._timeout) + ' seconds for ' + URL)
-            except SSLError as e:
-                self._timeout += self._timeout_step
-                print('SSLError code: ' + str(e.message) + '. Timeout increased to ' + str(self._timeout) + ' seconds for ' + URL)
-            except socket.timeout:
-                self._timeout += self._timeout_step
-                print('Socket timed out. Timeout increased to ' + str(self._timeout) + ' seconds for ' + URL)
-
-            else:
-                try:
-                    ReadResults = restConnHandle.read()
-                    return str(ReadResults)
-
-                except HTTPError as e:
-                    print('READ HTTPError code: ' + str(e.code) + '. File read timeout for ' + str(self._timeout) + ' seconds for ' + URL)  # nopep8
-                except URLError as e:
-                    print('READ URLError code: ' + str(e.reason) + '. File read timeout for ' + str(self._timeout) + ' seconds for ' + URL)  # nopep8
-                except SSLError as e:
-                    print('READ SSLError code: ' + str(e.message) + '. File read timeout for ' + str(self._timeout) + ' seconds for ' + URL)  # nopep8
-                except socket.timeout:
-                    print('READ Socket timed out. File read timeout for ' + str(self._timeout) + ' seconds for ' + URL)
-
-        print('ERROR: No reasonable timeout limit could be found for ' + URL)
-        sys.exit()
+        try:
+            response = self._client.get(URL)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            print(str(e))
+            print('ERROR: No response could be gotten from ' + URL)
+            sys.exit()
+
+        if response.status_code == 400:
+            return '404 Error'
+        elif response.status_code == 500:
+            return '500 Error'
+        elif response.status_code != 200:
+            print('HTTPError code: ' + str(response.status_code) + ' for ' + URL)
+            print('ERROR: No response could be gotten from ' + URL)
+            sys.exit()
+
+        return response.text
 
 
 def _simple_interactive_demo():